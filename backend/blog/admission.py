@@ -0,0 +1,183 @@
+"""
+Admission control: concurrency limits for expensive endpoints, and rate limits for writes
+
+An endpoint of BLOG_CONCURRENCY_LIMITS runs at most `limit` requests at once; up
+to `queue` more wait for a slot, for at most `timeout` seconds, and any other
+request is answered right away with a 503 and a Retry-After header. So a spike of
+sign ins (each one hashing a password) or of streamed listings cannot take every
+worker thread, and the cheap endpoints keep being answered at their usual latency.
+
+Writes (POST, PUT, DELETE) also take a token from a bucket of their user (or of
+their IP address, when signed out), refilled at BLOG_WRITE_RATE; a client that
+has run out of tokens gets a 429 with a Retry-After header.
+
+A streamed response (a listing with ?stream=1, or an event stream) reads and sends
+its rows on its worker thread after the view has returned, so it holds its slot
+until it is closed. The one exception is an event stream under myblog/asgi.py,
+which holds no thread while it waits for events and gives its slot back as soon
+as it is made.
+
+Both are kept per process: with several worker processes, each admits its own share.
+"""
+
+from django.conf import settings
+from django.http import JsonResponse
+from .cache import LocalCache
+import functools
+import math
+import threading
+import time
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ConcurrencyLimit:
+    """
+    Lets `limit` callers in at once, and `queue` more wait up to `timeout` seconds for their turn
+    """
+
+    def __init__(self, limit, queue, timeout):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Takes a slot, waiting for one if the queue has room; returns False when none was taken
+        """
+
+        with self.condition:
+            if self.running < self.limit:
+                self.running += 1
+                return True
+            if self.waiting >= self.queue:
+                return False
+
+            self.waiting += 1
+            try:
+                deadline = time.monotonic() + self.timeout
+                while self.running >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+                self.running += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self.condition:
+            self.running -= 1
+            self.condition.notify()
+
+
+class HeldSlot:
+    """
+    The slot of a ConcurrencyLimit held by a response, given back when the response is closed
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def close(self):
+        limit, self.limit = self.limit, None
+        if limit is not None:
+            limit.release()
+
+
+class TokenBuckets:
+    """
+    Token buckets of `burst` tokens refilled at `rate` tokens per second, one for each key
+
+    A bucket left alone long enough to be full again is forgotten, so they are kept in a
+    LocalCache whose entries expire after that time
+    """
+
+    def __init__(self, rate, burst, max_entries):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = LocalCache(max_entries, burst / rate)
+        self.lock = threading.Lock()
+
+    def take(self, key):
+        """
+        Takes a token from the bucket of `key`; returns 0, or the seconds until a token is there when it is empty
+        """
+
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            if tokens < 1:
+                return (1 - tokens) / self.rate
+            self.buckets.set(key, (tokens - 1, now))
+            return 0
+
+    def clear(self):
+        self.buckets.clear()
+
+
+@functools.lru_cache(maxsize=None)
+def _token_buckets(rate, burst):
+    return TokenBuckets(rate, burst, settings.BLOG_LOCAL_CACHE_ENTRIES)
+
+
+def get_write_buckets():
+    """
+    Gets the (shared) write buckets of the current BLOG_WRITE_RATE, or None when writes are not rate limited
+    """
+
+    return _token_buckets(*settings.BLOG_WRITE_RATE) if settings.BLOG_WRITE_RATE else None
+
+
+def _retry_response(error, status, seconds):
+    response = JsonResponse({"error": error}, status=status)
+    response['Retry-After'] = str(max(1, math.ceil(seconds)))
+    return response
+
+
+class AdmissionMiddleware:
+    """
+    Sheds the requests over the limits of BLOG_CONCURRENCY_LIMITS and BLOG_WRITE_RATE
+
+    Goes after AuthenticationMiddleware, whose user keys the write buckets. The slot of a
+    streamed response is given back when the response is closed (but for an event stream
+    under myblog/asgi.py), and that of any other response once it is made
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.limits = {endpoint: ConcurrencyLimit(*limit) for endpoint, limit in settings.BLOG_CONCURRENCY_LIMITS.items()}
+
+    def __call__(self, request):
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            limit = getattr(request, 'admission_limit', None)
+            if limit is not None:
+                if getattr(response, 'streaming', False) and not (hasattr(response, 'asgi_stream') and request.META.get('blog.asgi')):
+                    response._closable_objects.append(HeldSlot(limit))
+                else:
+                    limit.release()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        write_buckets = get_write_buckets()
+        if write_buckets is not None and request.method not in SAFE_METHODS:
+            key = 'user:%s' % request.user.pk if request.user.is_authenticated else 'ip:%s' % request.META.get('REMOTE_ADDR')
+            retry_after = write_buckets.take(key)
+            if retry_after:
+                # Exception: the client writing faster than BLOG_WRITE_RATE
+                return _retry_response("Too many writes, retry later", 429, retry_after)
+
+        limit = self.limits.get((request.resolver_match.url_name, request.method))
+        if limit is not None:
+            if not limit.acquire():
+                # Exception: the endpoint running and queueing as many requests as it can
+                return _retry_response("The server is busy, retry later", 503, settings.BLOG_RETRY_AFTER)
+            request.admission_limit = limit
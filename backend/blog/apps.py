@@ -1,5 +1,24 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_migrate
 
 
 class BlogConfig(AppConfig):
     name = 'blog'
+
+    def ready(self):
+        from .auth import forget_logged_out_user, forget_saved_user
+        from .changes import reinstall_change_triggers
+        from .profiling import install_query_timer
+        from .search import drop_view, reinstall_triggers
+        from .sqlite import configure_connection
+        connection_created.connect(configure_connection)
+        connection_created.connect(install_query_timer)
+        pre_migrate.connect(drop_view, sender=self)
+        post_migrate.connect(reinstall_triggers, sender=self)
+        post_migrate.connect(reinstall_change_triggers, sender=self)
+        post_save.connect(forget_saved_user, sender=get_user_model())
+        post_delete.connect(forget_saved_user, sender=get_user_model())
+        user_logged_out.connect(forget_logged_out_user)
@@ -0,0 +1,66 @@
+"""
+Authentication backend that caches the users sessions are logged in as
+
+AuthenticationMiddleware loads request.user through the backend's get_user on
+every request. CachedModelBackend answers it from an in-process LRU, then from
+the shared `sessions` cache, and only then from auth_user. A cached user is
+forgotten whenever it is saved (e.g. a password change or the last_login of a
+new sign in), deleted, or logged out. As with blog/sessions.py, this only holds
+across processes when the `sessions` cache is shared by all of them.
+"""
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from .cache import LocalCache
+import copy
+
+local_users = LocalCache(settings.BLOG_LOCAL_CACHE_ENTRIES, settings.BLOG_LOCAL_CACHE_TTL)
+
+
+def _user_key(user_id):
+    return 'user:%s' % user_id
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _user_key(user_id)
+        user = local_users.get(key)
+        if user is None:
+            user = caches[settings.SESSION_CACHE_ALIAS].get(key)
+            if user is None:
+                user = super().get_user(user_id)
+                if user is None:
+                    return None
+                caches[settings.SESSION_CACHE_ALIAS].set(key, user)
+            local_users.set(key, user)
+
+        # Each request gets its own instance
+        return copy.copy(user)
+
+
+def forget_user(user_id):
+    """
+    Drops a user from the caches, so that it is read again from the database
+    """
+
+    key = _user_key(user_id)
+    local_users.delete(key)
+    caches[settings.SESSION_CACHE_ALIAS].delete(key)
+
+
+def forget_saved_user(sender, instance, **kwargs):
+    """
+    post_save / post_delete receiver of the user model
+    """
+
+    forget_user(instance.pk)
+
+
+def forget_logged_out_user(sender, request, user, **kwargs):
+    """
+    user_logged_out receiver
+    """
+
+    if user is not None:
+        forget_user(user.pk)
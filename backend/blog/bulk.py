@@ -0,0 +1,155 @@
+"""
+Batch creation and deletion of articles and comments
+
+Items are validated one by one and written with bulk_create, CHUNK_SIZE rows per
+transaction, so an import costs one request and a few transactions instead of
+one request, one parse and one transaction per row.
+"""
+
+from django.db import connections, router, transaction
+from .profiling import timed
+from .streaming import NDJSON
+import json
+
+# Rows written per transaction
+CHUNK_SIZE = 1000
+
+# Ids looked up per query (SQLite allows at most 999 variables in a statement)
+ID_CHUNK_SIZE = 500
+
+
+def read_items(request):
+    """
+    Reads the items of a batch request: a JSON array body, or one JSON value per line for NDJSON
+
+    NDJSON bodies are read line by line as the items are consumed, and a malformed line gives a
+    None item. Raises ValueError (or json.JSONDecodeError) when a JSON array body is malformed
+    """
+
+    if request.content_type == NDJSON:
+        return _read_lines(request)
+
+    with timed('parse'):
+        items = json.loads(request.body.decode())
+    if not isinstance(items, list):
+        raise ValueError("The body must be a JSON array")
+    return items
+
+
+def _read_lines(request):
+    for line in request:
+        if line.strip():
+            try:
+                yield json.loads(line.decode())
+            except ValueError:
+                yield None
+
+
+def read_ids(request):
+    """
+    Reads the ids of a batch deletion: {"ids": [...]} or a plain JSON array of ids
+
+    Raises ValueError (or json.JSONDecodeError) when the body is malformed
+    """
+
+    with timed('parse'):
+        ids = json.loads(request.body.decode())
+    if isinstance(ids, dict):
+        ids = ids.get('ids')
+    if not isinstance(ids, list) or not all(isinstance(id, int) for id in ids):
+        raise ValueError("The body must be a list of ids")
+    return ids
+
+
+def _insert(model, objs, on_insert):
+    # Inserts the objects in one transaction and gives back their ids, in order
+    db = router.db_for_write(model)
+    with transaction.atomic(using=db):
+        model.objects.using(db).bulk_create(objs)
+        if on_insert is not None:
+            on_insert(objs)
+        if objs[0].pk is not None:
+            return [obj.pk for obj in objs]
+
+        # SQLite does not give ids back from a bulk INSERT. The write lock is held from the first
+        # INSERT until the commit and AUTOINCREMENT ids only grow, so the ids are the last len(objs) ones
+        with connections[db].cursor() as cursor:
+            cursor.execute('SELECT last_insert_rowid()')
+            last_id = cursor.fetchone()[0]
+    return list(range(last_id - len(objs) + 1, last_id + 1))
+
+
+def create_in_chunks(model, items, make, on_insert=None):
+    """
+    Validates the items and inserts the valid ones, one transaction per CHUNK_SIZE rows
+
+    `make(item)` gives the unsaved model instance of an item, or raises ValueError with the error message
+    `on_insert(objs)` is called in each transaction, right after its objects are inserted
+    Returns the result of every item, in order: {"id": ...} or {"error": ...}
+    """
+
+    results = []
+    pending = []
+    for item in items:
+        try:
+            obj = make(item)
+        except ValueError as error:
+            results.append({"error": str(error)})
+            continue
+
+        pending.append((len(results), obj))
+        results.append(None)
+        if len(pending) == CHUNK_SIZE:
+            _create_pending(model, pending, results, on_insert)
+            pending = []
+
+    if pending:
+        _create_pending(model, pending, results, on_insert)
+    return results
+
+
+def _create_pending(model, pending, results, on_insert):
+    ids = _insert(model, [obj for _, obj in pending], on_insert)
+    for (index, _), id in zip(pending, ids):
+        results[index] = {"id": id}
+
+
+def delete_in_chunks(model, ids, user, fields=(), on_delete=None):
+    """
+    Deletes the objects with the given ids that are written by the user, one transaction per chunk of ids
+
+    `on_delete(rows)` is called in each transaction, right after its objects are deleted, with their (id, *fields) tuples.
+    They are read again in the transaction, so an object deleted meanwhile (e.g. by a concurrent request) is left out
+
+    Returns the result of every id, in order ({"id": ...} or {"id": ..., "error": ...}), and the
+    (id, *fields) tuple of every deleted object
+    """
+
+    db = router.db_for_write(model)
+    results = []
+    deleted = []
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        rows = model.objects.using(db).filter(id__in=chunk).values_list('id', 'author_id', *fields)
+        rows = {row[0]: row for row in rows}
+        owned = [id for id, row in rows.items() if row[1] == user.id]
+
+        owned_rows = []
+        if owned:
+            with transaction.atomic(using=db):
+                owned_rows = list(model.objects.using(db).select_for_update()
+                                  .filter(id__in=owned, author=user).values_list('id', *fields))
+                model.objects.using(db).filter(id__in=[row[0] for row in owned_rows]).only('id').delete()
+                if on_delete is not None and owned_rows:
+                    on_delete(owned_rows)
+
+        for id in chunk:
+            if id not in rows:
+                results.append({"id": id, "error": "Does not exist"})
+            elif rows[id][1] != user.id:
+                results.append({"id": id, "error": "You do not have access to it"})
+            else:
+                results.append({"id": id})
+        deleted.extend(owned_rows)
+
+    return results, deleted
@@ -0,0 +1,120 @@
+"""
+Versioned read-through cache for article and comment reads
+
+Serialized responses are stored under keys that carry a per-article version.
+Writes never delete cached responses; they bump the article's version, so the
+next read misses and stale entries are left for the cache's LRU eviction.
+Any Django cache backend configured as the `blog` cache works (local-memory by
+default, or a shared Redis cache, see `CACHES` in the settings).
+
+Versions are only bumped in the cache of the process that writes. A shared cache
+is invalidated for every process at once; a local-memory cache is not, so its
+responses expire BLOG_LOCAL_CACHE_TIMEOUT seconds after they are cached, which
+bounds how long other processes serve them after a write.
+
+LocalCache is the in-process LRU that sessions and users are read through (see
+blog/sessions.py and blog/auth.py).
+"""
+
+from django.core.cache import caches
+import collections
+import threading
+import time
+
+CACHE_ALIAS = 'blog'
+
+
+def _version_key(article_id):
+    return 'article:%d:version' % article_id
+
+
+def get_version(article_id):
+    """
+    Gets the current cache version of an article
+    """
+
+    cache = caches[CACHE_ALIAS]
+    key = _version_key(article_id)
+    version = cache.get(key)
+    if version is None:
+        # A version that has been evicted restarts from a value never used before,
+        # so entries cached under the old versions cannot be served again
+        cache.add(key, int(time.time() * 1000000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(article_id):
+    """
+    Invalidates every cached response of an article (its detail and its comments)
+    """
+
+    cache = caches[CACHE_ALIAS]
+    try:
+        cache.incr(_version_key(article_id))
+    except ValueError:
+        # No version stored: nothing has been cached under the current one
+        pass
+
+
+def get_cached(article_id, name):
+    """
+    Looks up the cached response `name` of an article
+
+    Returns the key it is cached under and the cached value (None on a miss)
+    """
+
+    key = 'article:%d:%d:%s' % (article_id, get_version(article_id), name)
+    return key, caches[CACHE_ALIAS].get(key)
+
+
+def set_cached(key, value):
+    """
+    Caches a response under the key given by get_cached
+    """
+
+    caches[CACHE_ALIAS].set(key, value)
+
+
+
+
+class LocalCache:
+    """
+    A small in-process LRU cache whose entries expire `ttl` seconds after they are set
+
+    It is put in front of a shared cache for the values every request reads (sessions and users), where
+    even a round trip to the shared cache costs; a value changed by another process is seen within `ttl`
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
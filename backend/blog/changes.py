@@ -0,0 +1,100 @@
+"""
+Change feed of the articles and comments, for clients that keep a copy of the blog
+
+Every write to an article or a comment adds a row to blog_change, whose id is its
+sequence number, and removes the row of the previous write to the same object:
+the feed holds one row per object, the last change to it, and deletions are kept
+as tombstones. A client that asks for the changes after the last sequence number
+it has seen gets each object changed since then once, however many times it was
+written, so a sync costs what changed and not the size of the blog.
+
+The rows are written by triggers on blog_article and blog_comment, so every write
+is logged, including bulk inserts, queryset updates and the deletes cascaded from
+an article to its comments. SQLite gives ids in commit order (the AUTOINCREMENT
+ids are never reused, and there is a single writer), so a client never skips a
+change committed after the changes it has read.
+"""
+
+from django.db import connections, router, transaction
+from .compression import decompress
+from .fields import ARTICLE_FIELDS, COMMENT_FIELDS
+from .models import Article, Change, Comment
+from .search import is_migrated
+
+CHANGE_TABLES = (
+    # (kind, table, columns whose update is a change)
+    (Change.ARTICLE, 'blog_article', 'title, content'),
+    (Change.COMMENT, 'blog_comment', 'content'),
+)
+
+TRIGGER_SQL = """CREATE TRIGGER IF NOT EXISTS blog_change_{kind}_{event} AFTER {action} ON {table} BEGIN
+    DELETE FROM blog_change WHERE kind = '{kind}' AND object_id = {row}.id;
+    INSERT INTO blog_change(kind, object_id, deleted) VALUES ('{kind}', {row}.id, {deleted});
+END"""
+
+TRIGGER_EVENTS = (
+    # (event, action, row, deleted)
+    ('insert', 'INSERT', 'new', 0),
+    ('update', 'UPDATE OF {columns}', 'new', 0),
+    ('delete', 'DELETE', 'old', 1),
+)
+
+
+def trigger_names():
+    return ['blog_change_%s_%s' % (kind, event) for kind, _, _ in CHANGE_TABLES for event, _, _, _ in TRIGGER_EVENTS]
+
+
+def install_change_triggers(connection):
+    """
+    Creates the triggers that log the writes to blog_change, when they are missing
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for kind, table, columns in CHANGE_TABLES:
+            for event, action, row, deleted in TRIGGER_EVENTS:
+                cursor.execute(TRIGGER_SQL.format(
+                    kind=kind, event=event, action=action.format(columns=columns), table=table, row=row, deleted=deleted))
+
+
+def reinstall_change_triggers(sender, using, **kwargs):
+    """
+    post_migrate receiver: migrations that rebuild blog_article or blog_comment drop their triggers (see blog/search.py)
+    """
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite' and Change._meta.db_table in connection.introspection.table_names() and is_migrated(connection):
+        install_change_triggers(connection)
+
+
+def read_changes(since, limit):
+    """
+    Gets the changes after the sequence number `since`, oldest first, at most `limit` of them
+
+    Returns a list of {"seq", "type", "id", "deleted", "data"} dictionaries, "data" having the fields of the
+    article or comment as it is now (None when it is deleted), and whether there are more changes
+    """
+
+    db = router.db_for_read(Change)
+    # One snapshot for the changes and the objects, so that none is deleted in between
+    with transaction.atomic(using=db):
+        changes = list(Change.objects.using(db).filter(id__gt=since).order_by('id').values_list(
+            'id', 'kind', 'object_id', 'deleted')[:limit + 1])
+        more = len(changes) > limit
+        changes = changes[:limit]
+
+        objects = {}
+        for kind, model, fields in ((Change.ARTICLE, Article, ARTICLE_FIELDS), (Change.COMMENT, Comment, COMMENT_FIELDS)):
+            ids = [object_id for _, change_kind, object_id, deleted in changes if change_kind == kind and not deleted]
+            if ids:
+                for row in model.objects.using(db).filter(id__in=ids).values_list(*fields):
+                    objects[kind, row[0]] = data = dict(zip(fields, row))
+                    data['content'] = decompress(data['content'])
+
+    results = []
+    for seq, kind, object_id, deleted in changes:
+        data = objects.get((kind, object_id))
+        results.append({"seq": seq, "type": kind, "id": object_id, "deleted": data is None, "data": data})
+    return results, more
@@ -0,0 +1,219 @@
+"""
+Compression at rest of article and comment contents
+
+A CompressedTextField stores a text of BLOG_COMPRESSION_THRESHOLD bytes or more
+(in UTF-8) as a BLOB: a one-byte marker of the format (FORMATS) followed by the
+compressed text. Shorter texts, and texts that do not get smaller, are stored as
+plain TEXT, so the column holds both and the type of a value tells them apart.
+
+Decompression is lazy. values_list() gives the stored values as they are, and
+the RowEncoder of blog/serializers.py decompresses a content only while it
+encodes it; a model instance decompresses its content the first time it is
+read. SQL gets the text through the blog_decompress() function, registered on
+every SQLite connection (see blog/sqlite.py): the full-text index reads the
+articles through the blog_article_text view made of it, and the previews of the
+article list are cut from it.
+
+Only the application's connections have blog_decompress(), so no trigger calls
+it (the search index is fed from Python, see blog/search.py): the database can
+be written by any client, e.g. `manage.py dbshell` or a restore script. What
+such a client reads of a compressed content is the stored BLOB, though, and it
+cannot read the blog_article_text view.
+"""
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, models, transaction
+from django.db.models import Func
+from django.db.models.query_utils import DeferredAttribute
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = b'z'
+ZSTD = b's'
+
+# Rows read and rewritten per transaction by compress_rows
+CHUNK_SIZE = 1000
+
+
+def _zstd_compress(data):
+    if zstandard is None:
+        raise ImproperlyConfigured("BLOG_COMPRESSION = 'zstd' needs the zstandard package")
+    return zstandard.ZstdCompressor(level=settings.BLOG_COMPRESSION_LEVEL).compress(data)
+
+
+def _zstd_decompress(data, size):
+    if zstandard is None:
+        raise ImproperlyConfigured("Contents compressed with zstd need the zstandard package")
+    if size is None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zstandard.ZstdDecompressor().stream_reader(data).read(size)
+
+
+def _zlib_decompress(data, size):
+    if size is None:
+        return zlib.decompress(data)
+    return zlib.decompressobj().decompress(data, size)
+
+
+# Marker: (name, compress(bytes), decompress(bytes, at most `size` bytes of it or None for all))
+FORMATS = {
+    ZLIB: ('zlib', lambda data: zlib.compress(data, settings.BLOG_COMPRESSION_LEVEL), _zlib_decompress),
+    ZSTD: ('zstd', _zstd_compress, _zstd_decompress),
+}
+MARKERS = {name: marker for marker, (name, _, _) in FORMATS.items()}
+
+
+def compress(text):
+    """
+    Gets the value a text is stored as: the marked, compressed bytes, or the text itself when it is short or does not compress
+    """
+
+    if not isinstance(text, str) or settings.BLOG_COMPRESSION is None:
+        return text
+    data = text.encode()
+    if len(data) < settings.BLOG_COMPRESSION_THRESHOLD:
+        return text
+
+    marker = MARKERS[settings.BLOG_COMPRESSION]
+    compressed = marker + FORMATS[marker][1](data)
+    return compressed if len(compressed) < len(data) else text
+
+
+def decompress(value, length=None):
+    """
+    Gets the text of a stored value (given back as is when it is not compressed), or its first `length` characters
+
+    Only as much of the value as the first characters need is decompressed
+    """
+
+    if not isinstance(value, (bytes, memoryview)):
+        return value if length is None or value is None else value[:length]
+    value = bytes(value)
+    if length is None:
+        return FORMATS[value[:1]][2](value[1:], None).decode()
+
+    # A character is at most 4 bytes of UTF-8; a character cut in the middle is dropped
+    return FORMATS[value[:1]][2](value[1:], length * 4).decode(errors='ignore')[:length]
+
+
+class Decompress(Func):
+    """
+    The text of a CompressedTextField column in SQL, or its first `length` characters
+    """
+
+    function = 'blog_decompress'
+    output_field = models.TextField()
+
+    def __init__(self, expression, length=None):
+        expressions = [expression] if length is None else [expression, models.Value(length)]
+        super().__init__(*expressions)
+
+
+def register_functions(connection):
+    """
+    Registers blog_decompress() on a new SQLite connection
+    """
+
+    connection.connection.create_function('blog_decompress', -1, decompress, deterministic=True)
+
+
+class CompressedTextAttribute(DeferredAttribute):
+    """
+    Decompresses the field's value of a model instance when it is first read
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, (bytes, memoryview)):
+            value = instance.__dict__[self.field_name] = decompress(value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field_name] = value
+
+
+class CompressedTextField(models.TextField):
+    """
+    A TextField whose long values are compressed when saved (see the module's docstring)
+
+    Lookups compare the stored values, so no lookup (`exact`, `contains` or the like)
+    matches a compressed text; filter on Decompress() of the column instead. Only SQLite
+    columns are compressed, as other databases do not take bytes in a text column
+    """
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, CompressedTextAttribute(self.attname))
+
+    def to_python(self, value):
+        return super().to_python(decompress(value))
+
+    def get_db_prep_save(self, value, connection):
+        value = super().get_db_prep_save(value, connection)
+        return compress(value) if connection.vendor == 'sqlite' else value
+
+
+def compress_rows(model, field, using='default', restore=False):
+    """
+    Rewrites the stored values of a CompressedTextField of every row as they are saved now (or, with `restore`,
+    as plain texts), e.g. after BLOG_COMPRESSION or BLOG_COMPRESSION_THRESHOLD changed
+
+    Only the rows whose stored value changes are written. Returns the number of rows written
+    """
+
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    table = quote_name(model._meta.db_table)
+    column = quote_name(model._meta.get_field(field).column)
+    convert = decompress if restore else lambda value: compress(decompress(value))
+
+    written = 0
+    last_id = 0
+    while True:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute('SELECT id, %s FROM %s WHERE id > %%s ORDER BY id LIMIT %%s' % (column, table), [last_id, CHUNK_SIZE])
+            rows = cursor.fetchall()
+            if not rows:
+                return written
+            last_id = rows[-1][0]
+
+            updates = []
+            for id, value in rows:
+                stored = convert(value)
+                if type(stored) is not type(value) or stored != value:
+                    updates.append((stored, id))
+            cursor.executemany('UPDATE %s SET %s = %%s WHERE id = %%s' % (table, column), updates)
+            written += len(updates)
+
+
+def rewrite_contents(connection, restore=False):
+    """
+    Rewrites the contents of every article and comment with compress_rows, and builds the search index again
+
+    The search index and the change log would take every rewritten row for an edit: their triggers are dropped
+    while the contents are rewritten, and created again after
+    """
+
+    # Imported here: blog/models.py imports this module
+    from .changes import install_change_triggers, trigger_names
+    from .models import Article, Comment
+    from .search import drop_index, install_index
+    if connection.vendor != 'sqlite':
+        return 0
+
+    drop_index(connection)
+    with connection.cursor() as cursor:
+        for name in trigger_names():
+            cursor.execute('DROP TRIGGER IF EXISTS ' + name)
+
+    written = sum(compress_rows(model, 'content', connection.alias, restore) for model in (Article, Comment))
+    install_index(connection, rebuild=True)
+    install_change_triggers(connection)
+    return written
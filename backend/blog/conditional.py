@@ -0,0 +1,74 @@
+"""
+Conditional GET support (ETag / Last-Modified) for articles and comments
+
+Validators are made from the `version` and `updated_at` columns only, so a
+polling client that already has the current representation gets its
+`304 Not Modified` without `content` ever being read or serialized.
+"""
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+import hashlib
+import time
+
+
+def has_validators(request):
+    """
+    Tells whether the request is conditional (carries If-None-Match or If-Modified-Since)
+    """
+
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def object_validators(id, version, updated_at):
+    """
+    Makes the (ETag, Last-Modified timestamp) pair of a single article or comment
+    """
+
+    return '"%d-%d"' % (id, version), int(updated_at.timestamp())
+
+
+def _settled(last_modified):
+    # Last-Modified is in whole seconds, so it is left out while the object's last change is in the current second:
+    # a change later in that second would not move it forward, and If-Modified-Since would miss it. This is checked
+    # whenever a response is served, so a cached response gets its Last-Modified once that second is over
+    if last_modified is not None and last_modified < int(time.time()):
+        return last_modified
+    return None
+
+
+def list_validators(rows, *extra):
+    """
+    Makes the (ETag, Last-Modified timestamp) pair of a listing
+
+    `rows` are the (id, version, updated_at, ...) tuples of the listed objects, and `extra` other values the
+    representation depends on (e.g. the next page cursor): all of them make the ETag. A listing has no
+    Last-Modified (None), as the dates of its rows do not move forward when a row is deleted
+    """
+
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(repr(row).encode())
+    digest.update(repr(extra).encode())
+
+    return '"%s"' % digest.hexdigest(), None
+
+
+def not_modified(request, etag, last_modified):
+    """
+    Gets the 304 Not Modified response when the client's validators still match, or None
+    """
+
+    return get_conditional_response(request, etag=etag, last_modified=_settled(last_modified))
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Adds the ETag and Last-Modified headers to a response, and returns it
+    """
+
+    response['ETag'] = etag
+    last_modified = _settled(last_modified)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,263 @@
+"""
+Server-Sent Events for the comments of an article
+
+Pages that show an article subscribe to /api/article/<id>/comment/events instead
+of polling its comment list: the comment write paths publish every comment
+created, edited or deleted to the article's channel, and the stream pushes it to
+the subscribers as an SSE event (`created`, `updated` or `deleted`, with the
+comment as JSON data). A `reload` event tells the client to read the list again:
+sent after a bulk write, the deletion of the article, or when the client fell so
+far behind that events were dropped.
+
+The broker is in-process by default. With several processes on one machine,
+BLOG_EVENTS_SOCKET_DIR makes it a SocketBroker, which relays each event to every
+process through a UNIX datagram socket per process, as a stand-in for a broker
+such as Redis pub/sub.
+
+Under myblog/asgi.py, open streams are pushed from the event loop and hold no worker
+thread; under WSGI, each open stream holds one, so at most as many are open at once
+as the endpoint's BLOG_CONCURRENCY_LIMITS allows (see blog/admission.py).
+"""
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+import asyncio
+import collections
+import json
+import logging
+import os
+import socket
+import threading
+
+# Events kept for a subscriber that has not read them yet; it is told to reload when more arrive
+MAX_PENDING = 100
+
+# Milliseconds a client waits before reconnecting a dropped stream
+RETRY = 3000
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Events of one channel for one subscriber, read by a thread (get) or by a coroutine (get_async)
+    """
+
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.events = collections.deque()
+        self.condition = threading.Condition()
+        self.waiter = None
+        self.closed = False
+
+    def put(self, event):
+        with self.condition:
+            if len(self.events) >= MAX_PENDING:
+                # Too far behind: the client is told to read the comments again instead
+                self.events.clear()
+                event = ('reload', None)
+            self.events.append(event)
+            self.condition.notify()
+            waiter, self.waiter = self.waiter, None
+
+        if waiter is not None:
+            loop, future = waiter
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+    def get(self, timeout):
+        """
+        Waits up to `timeout` seconds for the next (event, data); None when there was none
+        """
+
+        with self.condition:
+            if not self.events:
+                self.condition.wait(timeout)
+            return self.events.popleft() if self.events else None
+
+    async def get_async(self, timeout):
+        """
+        Same as get, for a coroutine
+        """
+
+        loop = asyncio.get_event_loop()
+        with self.condition:
+            if self.events:
+                return self.events.popleft()
+            future = loop.create_future()
+            self.waiter = (loop, future)
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        with self.condition:
+            self.waiter = None
+            return self.events.popleft() if self.events else None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    Publishes events to the subscribers of a channel in this process
+    """
+
+    def __init__(self):
+        self.channels = collections.defaultdict(set)
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self.lock:
+            self.channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.channels[subscription.channel]
+
+    def publish(self, channel, event, data=None):
+        self.deliver(channel, event, data)
+
+    def deliver(self, channel, event, data):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.put((event, data))
+
+
+class SocketBroker(LocalBroker):
+    """
+    Relays the events to every process that has a socket in `directory`, its own included
+
+    The socket of a process that has exited is removed by the first publisher that finds it dead
+    """
+
+    def __init__(self, directory):
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, '%d.sock' % os.getpid())
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.path)
+        threading.Thread(target=self.receive, name='events', daemon=True).start()
+
+    def publish(self, channel, event, data=None):
+        message = json.dumps([channel, event, data]).encode()
+        reload = json.dumps([channel, 'reload', None]).encode()
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                try:
+                    sender.sendto(message, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # A process that is gone
+                    if path != self.path:
+                        try:
+                            os.unlink(path)
+                        except FileNotFoundError:
+                            pass
+                except OSError:
+                    # E.g. a datagram too large for the socket: the subscribers of that process are told to reload instead
+                    try:
+                        sender.sendto(reload, path)
+                    except OSError:
+                        logger.warning("The %s event of %s was lost for %s", event, channel, path, exc_info=True)
+        finally:
+            sender.close()
+
+    def receive(self):
+        while True:
+            message = self.socket.recv(1 << 20)
+            try:
+                channel, event, data = json.loads(message.decode())
+                self.deliver(channel, event, data)
+            except Exception:
+                # A malformed message is dropped, and the next ones are still delivered
+                logger.exception("Could not deliver the event message %r", message[:100])
+
+
+_broker = None
+_broker_pid = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """
+    Gets the broker of this process (a forked worker makes its own)
+    """
+
+    global _broker, _broker_pid
+    with _broker_lock:
+        if _broker is None or _broker_pid != os.getpid():
+            directory = settings.BLOG_EVENTS_SOCKET_DIR
+            _broker = SocketBroker(directory) if directory else LocalBroker()
+            _broker_pid = os.getpid()
+        return _broker
+
+
+def comment_channel(article_id):
+    return 'article:%d:comments' % article_id
+
+
+def subscribe_comments(article_id):
+    """
+    Subscribes to the events of an article's comments; close the subscription when done
+    """
+
+    return get_broker().subscribe(comment_channel(article_id))
+
+
+def publish_comment(article_id, event, comment=None):
+    """
+    Tells the subscribers of an article's comments that a comment was created, updated or deleted (or to reload them)
+    """
+
+    get_broker().publish(comment_channel(article_id), event, comment)
+
+
+def encode_event(event, data):
+    return ('event: %s\ndata: %s\n\n' % (event, json.dumps(data))).encode()
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    """
+    A text/event-stream of the events of a subscription, with a comment sent as keep-alive every BLOG_SSE_KEEPALIVE seconds
+
+    Iterating it waits in the thread (WSGI); an ASGI server that knows of asgi_stream() iterates that instead,
+    on its event loop. Closing the response ends the subscription either way
+    """
+
+    def __init__(self, subscription):
+        super().__init__(self.stream(), content_type='text/event-stream')
+        self.subscription = subscription
+        self['Cache-Control'] = 'no-cache'
+        # Keeps proxies such as nginx from buffering the events
+        self['X-Accel-Buffering'] = 'no'
+
+    def stream(self):
+        yield ('retry: %d\n\n' % RETRY).encode()
+        while True:
+            event = self.subscription.get(settings.BLOG_SSE_KEEPALIVE)
+            yield encode_event(*event) if event is not None else b': keep-alive\n\n'
+
+    async def asgi_stream(self):
+        yield ('retry: %d\n\n' % RETRY).encode()
+        while True:
+            event = await self.subscription.get_async(settings.BLOG_SSE_KEEPALIVE)
+            yield encode_event(*event) if event is not None else b': keep-alive\n\n'
+
+    def close(self):
+        self.subscription.close()
+        super().close()
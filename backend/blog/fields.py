@@ -0,0 +1,39 @@
+"""
+Sparse fieldsets (`?fields=`) for the read endpoints
+
+The requested fields become the columns of the query, so the fields a client
+leaves out (`content` above all) are never read from disk or serialized.
+"""
+
+ARTICLE_FIELDS = ('id', 'title', 'content', 'author')
+COMMENT_FIELDS = ('id', 'article', 'content', 'author')
+
+
+def get_fields(request, allowed, default):
+    """
+    Reads the comma-separated `fields` of the query string, or gives `default` when there is none
+
+    Raises ValueError when it is empty or names a field that is not `allowed`
+    """
+
+    if 'fields' not in request.GET:
+        return list(default)
+
+    fields = [field.strip() for field in request.GET['fields'].split(',') if field.strip()]
+    if not fields:
+        raise ValueError("fields must name at least one field")
+    for field in fields:
+        if field not in allowed:
+            raise ValueError("Unknown field: " + field)
+
+    return list(dict.fromkeys(fields))
+
+
+def fields_key(name, fields, default):
+    """
+    Gets the name a projection of the response `name` is cached under
+    """
+
+    if fields == list(default):
+        return name
+    return name + ':' + ','.join(fields)
@@ -0,0 +1,139 @@
+"""
+Compares the comment write path of the views with and without group commit (see blog/writer.py), as JSON
+
+A temporary SQLite database is filled by blog/synthetic.py, then --threads threads
+each save --comments comments, as concurrent comment POSTs would, under Zipf
+distributed (popular) articles: first each in its own transaction, then through
+a group commit writer. For both, the write throughput, the p50 / p99 / max
+latencies and the writes that failed (e.g. "database is locked") are reported.
+With --synchronous FULL, every commit waits for an fsync, as with a rollback journal.
+"""
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections
+from django.test.utils import override_settings
+from blog.synthetic import TextMaker, generate, zipf_weights
+from blog.writer import GroupCommitWriter, save_comment
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Measures the throughput and latencies of concurrent comment writes with and without group commit, as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help="Threads writing at once")
+        parser.add_argument('--comments', type=int, default=200, help="Comments written by each thread")
+        parser.add_argument('--articles', type=int, default=1000, help="Articles generated")
+        parser.add_argument('--synchronous', help="PRAGMA synchronous of the run (e.g. FULL), instead of the settings'")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the data and of the writes")
+        parser.add_argument('--output', help="File to write the report to, instead of the standard output")
+
+    def handle(self, *args, **options):
+        if options['threads'] < 1 or options['comments'] < 1 or options['articles'] < 1:
+            raise CommandError("The benchmark needs at least one thread, one comment, and one article")
+
+        pragmas = dict(settings.BLOG_SQLITE_PRAGMAS)
+        if options['synchronous']:
+            pragmas['synchronous'] = options['synchronous']
+        report = {
+            'threads': options['threads'],
+            'comments_per_thread': options['comments'],
+            'pragmas': pragmas,
+            'window': settings.BLOG_GROUP_COMMIT_WINDOW,
+            'batch': settings.BLOG_GROUP_COMMIT_BATCH,
+        }
+
+        # Points the default database to a temporary file for the run, as the test runner does
+        database = connections.databases['default']
+        saved = {key: database.get(key) for key in ('NAME', 'PRAGMAS')}
+        directory = tempfile.mkdtemp()
+        connections['default'].close()
+        database['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        database['PRAGMAS'] = pragmas
+        try:
+            call_command('migrate', verbosity=0)
+            user_ids, article_ids = generate(options['threads'], options['articles'], 0, seed=options['seed'])
+            connections['default'].close()
+
+            with override_settings(BLOG_GROUP_COMMIT=False):
+                report['direct'] = self.run(lambda item: save_comment(*item), user_ids, article_ids, options)
+
+            writer = GroupCommitWriter(settings.BLOG_GROUP_COMMIT_WINDOW, settings.BLOG_GROUP_COMMIT_BATCH)
+            try:
+                report['group_commit'] = self.run(lambda item: writer.submit(*item).result(), user_ids, article_ids, options)
+            finally:
+                writer.close()
+        finally:
+            connections['default'].close()
+            for key, value in saved.items():
+                if value is None:
+                    database.pop(key, None)
+                else:
+                    database[key] = value
+            shutil.rmtree(directory)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def run(self, write, user_ids, article_ids, options):
+        rng = random.Random(options['seed'])
+        text = TextMaker(rng)
+        count = options['comments']
+        # Every thread is a user writing under popular articles
+        work = [[(article_id, text.make(150, 2000), user_id)
+                 for article_id in rng.choices(article_ids, cum_weights=zipf_weights(len(article_ids)), k=count)]
+                for user_id in user_ids[:options['threads']]]
+
+        latencies = []
+        failures = []
+        start_line = threading.Barrier(len(work))
+
+        def writes(items):
+            start_line.wait()
+            try:
+                for item in items:
+                    start = time.perf_counter()
+                    try:
+                        write(item)
+                    except OperationalError as error:
+                        failures.append(str(error))
+                    latencies.append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writes, args=(items,)) for items in work]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        written = len(latencies) - len(failures)
+        result = {
+            'comments_per_second': round(written / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'max_ms': round(max(latencies) * 1000, 3),
+            'failed': len(failures),
+        }
+        self.stderr.write("%d comments/s, p99 %.2f ms, %d failed" % (
+            result['comments_per_second'], result['p99_ms'], result['failed']))
+        return result
@@ -0,0 +1,131 @@
+"""
+Measures the database size and the read throughput with plain and with compressed contents, as JSON
+
+A temporary SQLite database is filled by blog/synthetic.py with plain contents,
+measured, rewritten as the settings store contents (BLOG_COMPRESSION and
+BLOG_COMPRESSION_THRESHOLD, see blog/compression.py) and measured again. Each
+measure reports the size of the database file (after a VACUUM) and how many
+pages per second the listings read and encode, as the views do:
+
+- `article`: pages of the article list with their contents
+- `article_summary`: pages of the summary list, with previews cut from the contents
+- `article_id_comment`: pages of the comments of Zipf distributed (popular) articles
+
+Connections are opened again before each run, so that every run starts with a cold page cache.
+"""
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from blog.compression import Decompress, rewrite_contents
+from blog.fields import ARTICLE_FIELDS
+from blog.models import Article, Comment
+from blog.pagination import DEFAULT_LIMIT, paginate
+from blog.serializers import get_encoder
+from blog.synthetic import generate, zipf_weights
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+SUMMARY_FIELDS = ['id', 'title', 'author', 'comment_count', 'last_commented_at', 'preview']
+
+
+class Command(BaseCommand):
+    help = "Compares the database size and the read throughput of plain and compressed contents, as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Users generated")
+        parser.add_argument('--articles', type=int, default=10000, help="Articles generated")
+        parser.add_argument('--comments', type=int, default=100000, help="Comments generated")
+        parser.add_argument('--pages', type=int, default=200, help="Pages read by each listing")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the data and of the reads")
+        parser.add_argument('--output', help="File to write the report to, instead of the standard output")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['articles'] < 1 or options['pages'] < 1:
+            raise CommandError("The benchmark needs at least one user, one article, and one page")
+
+        report = {
+            'sizes': {name: options[name] for name in ('users', 'articles', 'comments')},
+            'pages': options['pages'],
+            'seed': options['seed'],
+        }
+
+        # Points the default database to a temporary file for the run, as the test runner does
+        database = connections.databases['default']
+        name = database['NAME']
+        directory = tempfile.mkdtemp()
+        connections['default'].close()
+        database['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        try:
+            call_command('migrate', verbosity=0)
+            with override_settings(BLOG_COMPRESSION=None):
+                generate(options['users'], options['articles'], options['comments'], seed=options['seed'])
+            report['plain'] = self.measure(database['NAME'], options)
+
+            start = time.perf_counter()
+            rewrite_contents(connections['default'])
+            report['compress_seconds'] = round(time.perf_counter() - start, 3)
+            report['compressed'] = self.measure(database['NAME'], options)
+        finally:
+            connections['default'].close()
+            database['NAME'] = name
+            shutil.rmtree(directory)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def measure(self, path, options):
+        connection = connections['default']
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            cursor.execute('VACUUM')
+        result = {'db_bytes': os.path.getsize(path)}
+
+        rng = random.Random(options['seed'])
+        article_ids = list(Article.objects.order_by('id').values_list('id', flat=True))
+        count = options['pages']
+        starts = [0] + rng.choices(article_ids, k=count - 1)
+        popular = rng.choices(article_ids, cum_weights=zipf_weights(len(article_ids)), k=count)
+
+        articles = Article.objects.all()
+        summaries = articles.annotate(preview=Decompress('content', 200))
+        article_encoder = get_encoder(Article, ARTICLE_FIELDS)
+        summary_encoder = get_encoder(Article, SUMMARY_FIELDS)
+        comment_fields = ['id', 'content', 'author']
+        comment_encoder = get_encoder(Comment, comment_fields)
+
+        def article_page(index):
+            page, _, next_cursor = paginate(articles, starts[index], DEFAULT_LIMIT, ARTICLE_FIELDS)
+            return article_encoder.encode_page(page, next_cursor)
+
+        def summary_page(index):
+            page, _, next_cursor = paginate(summaries, starts[index], DEFAULT_LIMIT, SUMMARY_FIELDS)
+            return summary_encoder.encode_page(page, next_cursor)
+
+        def comment_page(index):
+            rows = Article.objects.filter(id=popular[index]).comment_values(*comment_fields)[:DEFAULT_LIMIT]
+            return comment_encoder.encode_list(row for row in rows if row[0] is not None)
+
+        for name, read in (('article', article_page), ('article_summary', summary_page), ('article_id_comment', comment_page)):
+            # A new connection, with a cold page cache
+            connection.close()
+            encoded = 0
+            start = time.perf_counter()
+            for index in range(count):
+                encoded += len(read(index))
+            elapsed = time.perf_counter() - start
+            result[name] = {
+                'pages_per_second': round(count / elapsed, 1),
+                'encoded_mb_per_second': round(encoded / elapsed / 1e6, 1),
+            }
+            self.stderr.write("%s: %.1f pages/s" % (name, result[name]['pages_per_second']))
+        return result
@@ -0,0 +1,243 @@
+"""
+Drives every endpoint of blog/urls.py at realistic data sizes and reports the results as JSON
+
+A temporary SQLite database is filled by blog/synthetic.py (or, with --existing,
+the configured database is used, and written to) and each endpoint is requested
+--requests times in-process through the whole middleware stack, reads going to
+Zipf distributed (popular) articles. For each one, the p50 / p99 / max latencies,
+the requests per second, and the peak RSS of the process so far are reported, e.g.
+
+    manage.py benchmark_endpoints --label $(git rev-parse --short HEAD) --output before.json
+
+so that runs can be compared across commits.
+"""
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from blog.models import Article, Change, Comment
+from blog.synthetic import WORDS, TextMaker, generate, zipf_weights
+import django
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+USERNAME = 'benchmark'
+PASSWORD = 'benchmark'
+
+# Items created or deleted by each bulk request
+BULK_SIZE = 100
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def peak_rss_kb():
+    # ru_maxrss is in KiB on Linux, and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Command(BaseCommand):
+    help = "Measures the latency, throughput and peak RSS of every endpoint against generated data, as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Users generated")
+        parser.add_argument('--articles', type=int, default=10000, help="Articles generated")
+        parser.add_argument('--comments', type=int, default=100000, help="Comments generated")
+        parser.add_argument('--requests', type=int, default=200, help="Requests made to each endpoint")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the data and of the requests")
+        parser.add_argument('--existing', action='store_true', help="Benchmark the configured database instead of generated data")
+        parser.add_argument('--only', action='append', help="Run only this endpoint (can be repeated)")
+        parser.add_argument('--label', help="Label of the run in the report (e.g. a commit)")
+        parser.add_argument('--output', help="File to write the report to, instead of the standard output")
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['articles'] < 1 or options['requests'] < 1:
+            raise CommandError("The benchmark needs at least one user, one article, and one request per endpoint")
+
+        report = {
+            'label': options['label'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests': options['requests'],
+            'seed': options['seed'],
+        }
+
+        # One client makes all the writes of an endpoint, far faster than BLOG_WRITE_RATE lets a user write
+        with override_settings(BLOG_WRITE_RATE=None):
+            if options['existing']:
+                report['results'] = self.run(options)
+            else:
+                report['sizes'] = {name: options[name] for name in ('users', 'articles', 'comments')}
+                report['results'] = self.run_generated(options, report)
+        report['peak_rss_kb'] = peak_rss_kb()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def run_generated(self, options, report):
+        # Points the default database to a temporary file for the run, as the test runner does
+        database = connections.databases['default']
+        name = database['NAME']
+        directory = tempfile.mkdtemp()
+        connections['default'].close()
+        database['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        try:
+            call_command('migrate', verbosity=0)
+            start = time.perf_counter()
+            generate(options['users'], options['articles'], options['comments'], seed=options['seed'])
+            report['generate_seconds'] = round(time.perf_counter() - start, 3)
+            return self.run(options)
+        finally:
+            connections['default'].close()
+            database['NAME'] = name
+            shutil.rmtree(directory)
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        count = options['requests']
+        user = self.get_user()
+        article_ids = list(Article.objects.order_by('id').values_list('id', flat=True))
+        comment_ids = list(Comment.objects.order_by('id').values_list('id', flat=True))
+        if not article_ids or not comment_ids:
+            raise CommandError("The database has no articles or no comments")
+
+        # Popular articles get most of the reads; the popularity is that of the ids' order
+        popular = rng.choices(article_ids, cum_weights=zipf_weights(len(article_ids)), k=count)
+        comment_sample = rng.choices(comment_ids, k=count)
+        text = TextMaker(rng)
+
+        # What the writes edit or delete is made beforehand, and owned by the benchmark user
+        own_articles = self.make_articles(user, count * 2 + count * BULK_SIZE, text)
+        edited_articles = own_articles[:count]
+        deleted_articles = own_articles[count:count * 2]
+        bulk_deleted_articles = own_articles[count * 2:]
+        own_comments = self.make_comments(user, article_ids[0], count * 2 + count * BULK_SIZE, text)
+        edited_comments = own_comments[:count]
+        deleted_comments = own_comments[count:count * 2]
+        bulk_deleted_comments = own_comments[count * 2:]
+
+        # Syncs catch up from a recent point of the change feed, a page of changes at a time
+        last_seq = Change.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        sync_points = [rng.randint(max(0, last_seq - 10000), last_seq) for _ in range(count)]
+
+        def article(index):
+            return {'title': text.make(30, 64), 'content': text.make(1500, 20000)}
+
+        def comment(index):
+            return {'content': text.make(150, 2000)}
+
+        def bulk(items, index):
+            return items[index * BULK_SIZE:(index + 1) * BULK_SIZE]
+
+        # (name, method, path(index), body(index) or None, statuses expected, signed in)
+        endpoints = [
+            ('token', 'GET', lambda i: '/api/token', None, (204,), False),
+            ('signup', 'POST', lambda i: '/api/signup', lambda i: {'username': 'signup%d_%d' % (options['seed'], i), 'password': PASSWORD}, (201,), False),
+            ('signin', 'POST', lambda i: '/api/signin', lambda i: {'username': USERNAME, 'password': PASSWORD}, (204,), False),
+            ('signout', 'GET', lambda i: '/api/signout', None, (204,), True),
+            ('article', 'GET', lambda i: '/api/article?limit=20&after=%d' % popular[i], None, (200,), True),
+            ('article_summary', 'GET', lambda i: '/api/article?summary=1&preview=200&limit=20&after=%d' % popular[i], None, (200,), True),
+            ('article_stream', 'GET', lambda i: '/api/article?format=ndjson&after=%d' % article_ids[max(0, len(article_ids) - 1000)], None, (200,), True),
+            ('article_post', 'POST', lambda i: '/api/article', article, (201,), True),
+            ('article_bulk_post', 'POST', lambda i: '/api/article/bulk', lambda i: [article(i) for _ in range(BULK_SIZE)], (201,), True),
+            ('article_bulk_delete', 'DELETE', lambda i: '/api/article/bulk', lambda i: {'ids': bulk(bulk_deleted_articles, i)}, (200,), True),
+            ('article_search', 'GET', lambda i: '/api/article/search?q=%s' % rng.choice(WORDS[20:]), None, (200,), True),
+            ('article_id', 'GET', lambda i: '/api/article/%d' % popular[i], None, (200,), True),
+            ('article_id_put', 'PUT', lambda i: '/api/article/%d' % edited_articles[i], article, (200,), True),
+            ('article_id_delete', 'DELETE', lambda i: '/api/article/%d' % deleted_articles[i], None, (200,), True),
+            ('article_id_comment', 'GET', lambda i: '/api/article/%d/comment' % popular[i], None, (200,), True),
+            ('article_id_comment_newest', 'GET', lambda i: '/api/article/%d/comment?order=newest&limit=20' % popular[i], None, (200,), True),
+            ('article_id_comment_post', 'POST', lambda i: '/api/article/%d/comment' % popular[i], comment, (201,), True),
+            ('article_id_comment_bulk', 'POST', lambda i: '/api/article/%d/comment/bulk' % popular[i], lambda i: [comment(i) for _ in range(BULK_SIZE)], (201,), True),
+            ('comment_bulk', 'DELETE', lambda i: '/api/comment/bulk', lambda i: {'ids': bulk(bulk_deleted_comments, i)}, (200,), True),
+            ('comment_id', 'GET', lambda i: '/api/comment/%d' % comment_sample[i], None, (200,), True),
+            ('comment_id_put', 'PUT', lambda i: '/api/comment/%d' % edited_comments[i], comment, (200,), True),
+            ('comment_id_delete', 'DELETE', lambda i: '/api/comment/%d' % deleted_comments[i], None, (200,), True),
+            ('changes', 'GET', lambda i: '/api/changes?limit=100&since=%d' % sync_points[i], None, (200,), True),
+            ('metrics', 'GET', lambda i: '/api/metrics', None, (200,), False),
+        ]
+
+        results = {}
+        for name, method, path, body, statuses, signed_in in endpoints:
+            if options['only'] and name not in options['only']:
+                continue
+            latencies = self.drive(method, path, body, statuses, signed_in and name != 'signout', name == 'signout', count)
+            elapsed = sum(latencies)
+            results[name] = {
+                'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'max_ms': round(max(latencies) * 1000, 3),
+                'requests_per_second': round(count / elapsed, 1),
+                'peak_rss_kb': peak_rss_kb(),
+            }
+            self.stderr.write("%s: p50 %.2f ms, p99 %.2f ms" % (name, results[name]['p50_ms'], results[name]['p99_ms']))
+        return results
+
+    def drive(self, method, path, body, statuses, signed_in, sign_in_each, count):
+        client = self.client()
+        if signed_in:
+            self.sign_in(client)
+
+        latencies = []
+        for index in range(count):
+            if sign_in_each:
+                # Sign outs need a session to end; the sign in is not timed
+                self.sign_in(client)
+            data = json.dumps(body(index)) if body is not None else ''
+            start = time.perf_counter()
+            response = client.generic(method, path(index), data, content_type='application/json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code not in statuses:
+                raise CommandError("%s %s gave the status %d" % (method, path(index), response.status_code))
+        return latencies
+
+    def client(self):
+        # The host must pass ALLOWED_HOSTS (which allows localhost when DEBUG is on)
+        hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+        return Client(HTTP_HOST=hosts[0] if hosts else 'localhost')
+
+    def sign_in(self, client):
+        response = client.post('/api/signin', json.dumps({'username': USERNAME, 'password': PASSWORD}), content_type='application/json')
+        if response.status_code != 204:
+            raise CommandError("Could not sign in as %s" % USERNAME)
+
+    def get_user(self):
+        user = User.objects.filter(username=USERNAME).first()
+        if user is None:
+            user = User.objects.create_user(username=USERNAME, password=PASSWORD)
+        return user
+
+    def make_articles(self, user, count, text):
+        last_id = Article.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        with transaction.atomic():
+            Article.objects.bulk_create(
+                Article(title=text.make(30, 64), content=text.make(1500, 20000), author=user) for _ in range(count))
+        return list(Article.objects.filter(id__gt=last_id, author=user).order_by('id').values_list('id', flat=True))
+
+    def make_comments(self, user, article_id, count, text):
+        last_id = Comment.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        with transaction.atomic():
+            Comment.objects.bulk_create(
+                Comment(article_id=article_id, content=text.make(150, 2000), author=user) for _ in range(count))
+            Article.objects.filter(id=article_id).add_comments(count)
+        return list(Comment.objects.filter(id__gt=last_id, author=user).order_by('id').values_list('id', flat=True))
@@ -0,0 +1,113 @@
+"""
+Measures how long article and comment reads stall behind concurrent writes on SQLite
+
+Runs the same workload on two temporary databases: one with SQLite's defaults
+(rollback journal, a new connection for every request) and one with the
+settings' profile (BLOG_SQLITE_PRAGMAS and persistent connections). Reader
+threads read article pages and comment lists while a writer thread keeps
+adding comments in batches, as the bulk endpoint does, and editing articles;
+the read latencies and the throughput of both are printed.
+"""
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+from django.utils import timezone
+from blog.models import Article, Comment
+from django.contrib.auth.models import User
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+# Each run uses its own database alias, as connections are kept per alias and thread
+ALIAS = 'benchmark_%s'
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Compares read latencies under concurrent writes with SQLite's defaults and with the settings' SQLite profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5, help="Duration of each run")
+        parser.add_argument('--readers', type=int, default=4, help="Reader threads")
+        parser.add_argument('--articles', type=int, default=1000, help="Articles in the database")
+        parser.add_argument('--batch', type=int, default=500, help="Comments written per write transaction")
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp()
+        try:
+            profiles = [
+                ("defaults", {'PRAGMAS': {}, 'CONN_MAX_AGE': 0}),
+                ("tuned", {'PRAGMAS': settings.BLOG_SQLITE_PRAGMAS, 'CONN_MAX_AGE': None}),
+            ]
+            for name, profile in profiles:
+                path = os.path.join(directory, name + '.sqlite3')
+                latencies, writes = self.run(ALIAS % name, path, profile, options)
+
+                self.stdout.write("%s: %d reads (p50 %.1f ms, p99 %.1f ms, max %.1f ms), %d comments written" % (
+                    name, len(latencies), percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000,
+                    max(latencies) * 1000, writes))
+        finally:
+            shutil.rmtree(directory)
+
+    def run(self, alias, path, profile, options):
+        connections.databases[alias] = dict(connections.databases['default'], NAME=path, **profile)
+        try:
+            call_command('migrate', database=alias, verbosity=0)
+            user = User.objects.db_manager(alias).create_user(username='benchmark')
+            Article.objects.using(alias).bulk_create(
+                Article(title="Article %d" % i, content="Content " * 100, author=user) for i in range(options['articles']))
+            connections[alias].close()
+            return self.workload(alias, user, options)
+        finally:
+            connections[alias].close()
+
+    def workload(self, alias, user, options):
+        stop = threading.Event()
+        latencies = []
+        written = [0]
+        articles = options['articles']
+
+        def read():
+            while not stop.is_set():
+                start = time.perf_counter()
+                if random.random() < 0.5:
+                    after = random.randrange(articles)
+                    list(Article.objects.using(alias).filter(id__gt=after).order_by('id').values_list('id','title','content','author')[:50])
+                else:
+                    list(Article.objects.using(alias).filter(id=random.randrange(1, articles + 1)).comment_values('id','content','author'))
+                # The end of a request: closed unless connections are persistent
+                connections[alias].close_if_unusable_or_obsolete()
+                latencies.append(time.perf_counter() - start)
+            connections[alias].close()
+
+        def write():
+            while not stop.is_set():
+                article_id = random.randrange(1, articles + 1)
+                with transaction.atomic(using=alias):
+                    Comment.objects.using(alias).bulk_create(
+                        Comment(article_id=article_id, content="Comment " * 20, author=user) for _ in range(options['batch']))
+                    Article.objects.using(alias).filter(id=article_id).add_comments(options['batch'])
+                    Article.objects.using(alias).filter(id=random.randrange(1, articles + 1)).update(
+                        content="Edited " * 100, updated_at=timezone.now())
+                written[0] += options['batch']
+                connections[alias].close_if_unusable_or_obsolete()
+            connections[alias].close()
+
+        threads = [threading.Thread(target=read) for _ in range(options['readers'])] + [threading.Thread(target=write)]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        return latencies, written[0]
@@ -0,0 +1,113 @@
+"""
+Checks that every query made by the blog views is answered through an index
+
+Runs EXPLAIN QUERY PLAN on each query of blog/views.py and fails when SQLite
+plans a full scan of a table (or of a whole index) for any of them.
+Keep QUERIES in step with the views when their queries change.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F
+from django.db.models.sql import DeleteQuery, UpdateQuery
+from blog.compression import Decompress
+from blog.models import Article, Change, Comment
+import re
+
+# Any id works: the plan does not depend on the values
+ID = 1
+LIMIT = 50
+
+
+def update_statement(queryset, **values):
+    query = queryset.query.chain(UpdateQuery)
+    query.add_update_values(values)
+    return query.get_compiler(connection.alias).as_sql()
+
+
+def delete_statement(queryset):
+    return queryset.query.chain(DeleteQuery).get_compiler(connection.alias).as_sql()
+
+
+def view_queries():
+    """
+    Lists the label and the queryset (or the (sql, params) statement) of every query the views make
+    """
+
+    page = Article.objects.filter(id__gt=ID).order_by('id')
+    article = Article.objects.filter(id=ID)
+
+    return [
+        ("article GET (page)", page.values('id','title','content','author','version','updated_at')[:LIMIT + 1]),
+        ("article GET (page validators)", page.values('id','version','updated_at')[:LIMIT + 1]),
+        ("article GET (stream)", page.values('title','content','author')),
+        ("article GET (summary)", page.annotate(preview=Decompress('content', 100)).values(
+            'id','title','author','comment_count','last_commented_at','preview','version','updated_at')[:LIMIT + 1]),
+        ("article_id GET", Article.objects.filter(id=ID).order_by('pk').values('id','title','content','author','version','updated_at')[:1]),
+        ("article_id GET (validators)", Article.objects.filter(id=ID).order_by('pk').values_list('id','version','updated_at')[:1]),
+        ("article_id PUT", update_statement(Article.objects.filter(id=ID, author_id=ID), title='', content='')),
+        ("article_id PUT/DELETE (403 or 404)", Article.objects.filter(id=ID).values('id')[:1]),
+        ("article_id DELETE", Article.objects.filter(id=ID, author_id=ID).only('id')),
+        ("article_id DELETE (cascade)", delete_statement(Comment.objects.filter(article_id__in=[ID]))),
+        ("article_id_comment GET (validators)", article.comment_values('id','version','updated_at', article_fields=['comment_count'])[:LIMIT + 1]),
+        ("article_id_comment GET", article.comment_values('id','content','author','version','updated_at', article_fields=['comment_count'])[:LIMIT + 1]),
+        ("article_id_comment GET (next page)", article.comment_values('id','content','author','version','updated_at', after=ID, article_fields=['comment_count'])[:LIMIT + 1]),
+        ("article_id_comment GET (newest)", article.comment_values('id','content','author','version','updated_at', newest=True, article_fields=['comment_count'])[:LIMIT + 1]),
+        ("article_id_comment GET (newest, next page)", article.comment_values('id','content','author','version','updated_at', after=ID, newest=True, article_fields=['comment_count'])[:LIMIT + 1]),
+        ("article_id_comment GET (stream)", article.comment_values('id','content','author', after=ID)),
+        ("comment_id GET", Comment.objects.filter(id=ID).order_by('pk').values('id','article','content','author','version','updated_at')[:1]),
+        ("comment_id GET (validators)", Comment.objects.filter(id=ID).order_by('pk').values_list('id','version','updated_at')[:1]),
+        ("comment POST/DELETE (comment count)", update_statement(article, comment_count=F('comment_count') + 1)),
+        ("comment_id PUT/DELETE (article)", Comment.objects.filter(id=ID).values_list('article_id')),
+        ("comment_id PUT", update_statement(Comment.objects.filter(id=ID, author_id=ID), content='')),
+        ("comment_id DELETE", delete_statement(Comment.objects.filter(id=ID, author_id=ID))),
+        ("article_search GET (rank)", (
+            'SELECT rowid, rank FROM blog_article_fts WHERE blog_article_fts MATCH %s'
+            ' AND (rank > %s OR (rank = %s AND rowid > %s)) ORDER BY rank, rowid LIMIT %s', ['"word"', 0, 0, ID, LIMIT + 1])),
+        ("article_search GET (snippets)", (
+            'SELECT a.id, a.title, a.author_id, snippet(blog_article_fts, 1, %s, %s, %s, %s)'
+            ' FROM blog_article_fts JOIN blog_article a ON a.id = blog_article_fts.rowid'
+            ' WHERE blog_article_fts MATCH %s AND blog_article_fts.rowid IN (%s, %s)', ['[', ']', '...', 16, '"word"', ID, ID + 1])),
+        ("changes GET", Change.objects.filter(id__gt=ID).order_by('id').values_list('id','kind','object_id','deleted')[:LIMIT + 1]),
+        ("changes GET (objects)", Article.objects.filter(id__in=[ID, ID + 1]).values_list('id','title','content','author')),
+        ("every write (change log trigger)", delete_statement(Change.objects.filter(kind=Change.ARTICLE, object_id=ID))),
+    ]
+
+
+def query_plan(sql, params):
+    """
+    Gets the detail lines of SQLite's query plan of a statement
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = "Runs EXPLAIN QUERY PLAN on the queries of the blog views and fails on any full table scan"
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("EXPLAIN QUERY PLAN is only checked on SQLite, not on " + connection.vendor)
+
+        failures = []
+        for label, statement in view_queries():
+            if isinstance(statement, tuple):
+                sql, params = statement
+            else:
+                sql, params = statement.query.sql_with_params()
+            plan = query_plan(sql, params)
+
+            # "SCAN <table>" (or "SCAN TABLE <table>" on older SQLite) reads every row, except for
+            # the lookup of a full-text index by a MATCH ("VIRTUAL TABLE INDEX <n>:...M...")
+            scans = [line for line in plan if line.startswith('SCAN ') and not re.search(r'VIRTUAL TABLE INDEX \d+:\S*M', line)]
+            if scans:
+                failures.append(label)
+
+            self.stdout.write("%s %s" % ("FAIL" if scans else "ok  ", label))
+            for line in plan:
+                self.stdout.write("       " + line)
+
+        if failures:
+            raise CommandError("Full scans in: " + ", ".join(failures))
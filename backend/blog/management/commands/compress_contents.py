@@ -0,0 +1,29 @@
+"""
+Rewrites the stored article and comment contents as the settings store them now (see blog/compression.py)
+
+Contents keep the format they were saved in; run this after changing BLOG_COMPRESSION
+or BLOG_COMPRESSION_THRESHOLD to rewrite the older ones, or with --restore to store
+every content plain again.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from blog.compression import rewrite_contents
+import time
+
+
+class Command(BaseCommand):
+    help = "Compresses (or with --restore, decompresses) the stored contents of every article and comment"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restore', action='store_true', help="Store every content plain")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database to rewrite")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError("Contents are only compressed on SQLite, not on " + connection.vendor)
+
+        start = time.perf_counter()
+        written = rewrite_contents(connection, options['restore'])
+        self.stdout.write("%d contents rewritten in %.1fs" % (written, time.perf_counter() - start))
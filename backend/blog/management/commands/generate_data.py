@@ -0,0 +1,32 @@
+"""
+Fills the database with synthetic users, articles and comments (see blog/synthetic.py)
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from blog.synthetic import generate
+import time
+
+
+class Command(BaseCommand):
+    help = "Writes N users, articles and comments with skewed distributions, for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Users to make")
+        parser.add_argument('--articles', type=int, default=10000, help="Articles to make")
+        parser.add_argument('--comments', type=int, default=100000, help="Comments to make")
+        parser.add_argument('--password', default='password', help="Password of every user made")
+        parser.add_argument('--seed', type=int, default=0, help="Seed of the random data")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help="Database to write to")
+
+    def handle(self, *args, **options):
+        if min(options['users'], options['articles'], options['comments']) < 0:
+            raise CommandError("The sizes cannot be negative")
+        if options['users'] == 0 and options['articles'] + options['comments'] > 0:
+            raise CommandError("Articles and comments need at least one user")
+
+        start = time.perf_counter()
+        generate(options['users'], options['articles'], options['comments'],
+                 options['password'], options['seed'], options['database'])
+        self.stdout.write("%d users, %d articles and %d comments written in %.1fs" % (
+            options['users'], options['articles'], options['comments'], time.perf_counter() - start))
@@ -0,0 +1,124 @@
+"""
+Compares the throughput of the WSGI and ASGI entry points with many slow clients
+
+Each client takes `--delay` seconds to send its request and as long again to
+read the response, as a client on a slow network does. Served through WSGI, a
+worker thread is held for all of that time; served through myblog/asgi.py, the
+threads only run the views. Both are run in-process against the configured
+database, with the same number of threads, and their requests per second are printed.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from importlib import import_module
+from myblog.asgi import WsgiToAsgi, build_environ
+import asyncio
+import time
+
+USERNAME = 'loadtest'
+
+
+def login_cookie():
+    """
+    Gets the session cookie header of the load test user, creating the user if needed
+    """
+
+    user, created = User.objects.get_or_create(username=USERNAME)
+    if created:
+        user.set_unusable_password()
+        user.save()
+
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return (b'cookie', ('%s=%s' % (settings.SESSION_COOKIE_NAME, session.session_key)).encode())
+
+
+def make_scope(path, cookie):
+    path, _, query = path.partition('?')
+    return {
+        'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(),
+        'http_version': '1.1', 'server': ('127.0.0.1', 8000), 'client': ('127.0.0.1', 0), 'headers': [cookie],
+    }
+
+
+class Command(BaseCommand):
+    help = "Compares the requests per second of the WSGI and ASGI entry points with many slow concurrent clients"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help="Concurrent clients")
+        parser.add_argument('--requests', type=int, default=1, help="Requests made by each client, one after another")
+        parser.add_argument('--delay', type=float, default=0.25, help="Seconds a client takes to send a request, and to read a response")
+        parser.add_argument('--threads', type=int, default=settings.BLOG_ASGI_THREADS, help="Worker threads of both servers")
+        parser.add_argument('--path', default='/api/article?limit=10', help="Path (and query string) requested")
+
+    def handle(self, *args, **options):
+        cookie = login_cookie()
+        scope = make_scope(options['path'], cookie)
+        total = options['clients'] * options['requests']
+
+        for name, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+            start = time.perf_counter()
+            statuses = run(scope, options)
+            elapsed = time.perf_counter() - start
+
+            failed = [status for status in statuses if status != 200]
+            if failed:
+                raise CommandError("%s: %d of %d requests failed (status %d)" % (name, len(failed), total, failed[0]))
+            self.stdout.write("%s: %d requests in %.2fs (%.0f requests/s)" % (name, total, elapsed, total / elapsed))
+
+    def run_wsgi(self, scope, options):
+        application = get_wsgi_application()
+        delay = options['delay']
+
+        def request(_):
+            # A synchronous worker reads the request and writes the response itself
+            time.sleep(delay)
+            statuses = []
+            response = application(build_environ(scope, b''), lambda status, headers, exc_info=None: statuses.append(status))
+            try:
+                b''.join(response)
+            finally:
+                response.close()
+            time.sleep(delay)
+            return int(statuses[0].split()[0])
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            return list(executor.map(request, range(options['clients'] * options['requests'])))
+
+    def run_asgi(self, scope, options):
+        application = WsgiToAsgi(get_wsgi_application(), options['threads'])
+        delay = options['delay']
+
+        async def request():
+            status = []
+
+            async def receive():
+                await asyncio.sleep(delay)
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    await asyncio.sleep(delay)
+
+            await application(scope, receive, send)
+            return status[0]
+
+        async def client():
+            return [await request() for _ in range(options['requests'])]
+
+        async def clients():
+            return await asyncio.gather(*(client() for _ in range(options['clients'])))
+
+        try:
+            return [status for statuses in asyncio.run(clients()) for status in statuses]
+        finally:
+            application.executor.shutdown()
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# The SQL is copied here, not imported from blog/search.py, so that this migration always makes the same schema
+INDEX_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS blog_article_fts USING fts5(
+        title, content, content='blog_article', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    "INSERT INTO blog_article_fts(blog_article_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+]
+
+TRIGGERS_SQL = [
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in INDEX_SQL + TRIGGERS_SQL:
+        schema_editor.execute(sql)
+    schema_editor.execute("INSERT INTO blog_article_fts(blog_article_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute('DROP TRIGGER IF EXISTS blog_article_fts_' + trigger)
+    schema_editor.execute('DROP TABLE IF EXISTS blog_article_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
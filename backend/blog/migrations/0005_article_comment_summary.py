@@ -0,0 +1,61 @@
+# Generated by Django 2.2.28 on 2026-10-17 04:43
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+# The search index triggers of 0004: SQLite adds a column by copying blog_article into a new table,
+# and dropping the old one drops its triggers, so they are created again after it (either way)
+SEARCH_TRIGGERS_SQL = [
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+]
+
+
+def count_comments(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    Comment = apps.get_model('blog', 'Comment')
+    db = schema_editor.connection.alias
+    comments = Comment.objects.using(db).filter(article=OuterRef('pk')).order_by().values('article')
+    Article.objects.using(db).update(
+        comment_count=Coalesce(Subquery(comments.annotate(count=Count('id')).values('count')), 0),
+        last_commented_at=Subquery(comments.annotate(last=Max('updated_at')).values('last')),
+    )
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SEARCH_TRIGGERS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_article_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='article',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='article',
+            name='last_commented_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
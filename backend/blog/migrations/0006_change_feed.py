@@ -0,0 +1,65 @@
+# Generated by Django 2.2.28 on 2026-10-17 05:14
+
+from django.db import migrations, models
+
+
+# The SQL is copied here, not imported from blog/changes.py, so that this migration always makes the same schema
+TRIGGER_SQL = """CREATE TRIGGER IF NOT EXISTS blog_change_{kind}_{event} AFTER {action} ON {table} BEGIN
+    DELETE FROM blog_change WHERE kind = '{kind}' AND object_id = {row}.id;
+    INSERT INTO blog_change(kind, object_id, deleted) VALUES ('{kind}', {row}.id, {deleted});
+END"""
+
+TRIGGERS = [
+    # (kind, table, event, action, row, deleted)
+    ('article', 'blog_article', 'insert', 'INSERT', 'new', 0),
+    ('article', 'blog_article', 'update', 'UPDATE OF title, content', 'new', 0),
+    ('article', 'blog_article', 'delete', 'DELETE', 'old', 1),
+    ('comment', 'blog_comment', 'insert', 'INSERT', 'new', 0),
+    ('comment', 'blog_comment', 'update', 'UPDATE OF content', 'new', 0),
+    ('comment', 'blog_comment', 'delete', 'DELETE', 'old', 1),
+]
+
+
+def log_existing(apps, schema_editor):
+    # Every article and comment already written is a change, so a first sync (since=0) gets all of them
+    Article = apps.get_model('blog', 'Article')
+    Comment = apps.get_model('blog', 'Comment')
+    Change = apps.get_model('blog', 'Change')
+    db = schema_editor.connection.alias
+    for kind, model in (('article', Article), ('comment', Comment)):
+        ids = model.objects.using(db).order_by('id').values_list('id', flat=True)
+        Change.objects.using(db).bulk_create(Change(kind=kind, object_id=id) for id in ids.iterator())
+
+    if schema_editor.connection.vendor == 'sqlite':
+        for kind, table, event, action, row, deleted in TRIGGERS:
+            schema_editor.execute(TRIGGER_SQL.format(kind=kind, event=event, action=action, table=table, row=row, deleted=deleted))
+
+
+def drop_change_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for kind, _, event, _, _, _ in TRIGGERS:
+            schema_editor.execute('DROP TRIGGER IF EXISTS blog_change_%s_%s' % (kind, event))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_article_comment_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=7)),
+                ('object_id', models.PositiveIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='change',
+            index=models.Index(fields=['kind', 'object_id'], name='blog_change_object_idx'),
+        ),
+        migrations.RunPython(log_existing, drop_change_triggers),
+    ]
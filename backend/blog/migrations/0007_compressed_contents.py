@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db import migrations
+import blog.compression
+import zlib
+
+# What this migration does is copied here, not imported from blog/compression.py and blog/search.py,
+# so that it always makes the same schema: contents of THRESHOLD bytes or more are stored as a b'z'
+# marker followed by their zlib stream, and the search index reads the articles through blog_decompress()
+THRESHOLD = 1024
+LEVEL = 6
+
+# Rows read and rewritten at a time
+CHUNK_SIZE = 1000
+
+SEARCH_TRIGGERS = ('blog_article_fts_insert', 'blog_article_fts_delete', 'blog_article_fts_update')
+
+# Search index of 0004, on the plain contents
+PLAIN_INDEX_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS blog_article_fts USING fts5(
+        title, content, content='blog_article', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    "INSERT INTO blog_article_fts(blog_article_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    "INSERT INTO blog_article_fts(blog_article_fts) VALUES ('rebuild')",
+]
+
+# Search index of the compressed contents, read through the blog_article_text view (made after migrate, see
+# blog/search.py), and indexed from blog_article itself here
+DECOMPRESSING_INDEX_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS blog_article_fts USING fts5(
+        title, content, content='blog_article_text', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    "INSERT INTO blog_article_fts(blog_article_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, blog_decompress(new.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, blog_decompress(old.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, blog_decompress(old.content));
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, blog_decompress(new.content));
+    END""",
+    'INSERT INTO blog_article_fts(rowid, title, content) SELECT id, title, blog_decompress(content) FROM blog_article',
+]
+
+# The change log triggers of 0006 would take every rewritten row for an edit
+CHANGE_TRIGGER_SQL = """CREATE TRIGGER IF NOT EXISTS blog_change_{kind}_{event} AFTER {action} ON {table} BEGIN
+    DELETE FROM blog_change WHERE kind = '{kind}' AND object_id = {row}.id;
+    INSERT INTO blog_change(kind, object_id, deleted) VALUES ('{kind}', {row}.id, {deleted});
+END"""
+
+CHANGE_TRIGGERS = [
+    # (kind, table, event, action, row, deleted)
+    ('article', 'blog_article', 'insert', 'INSERT', 'new', 0),
+    ('article', 'blog_article', 'update', 'UPDATE OF title, content', 'new', 0),
+    ('article', 'blog_article', 'delete', 'DELETE', 'old', 1),
+    ('comment', 'blog_comment', 'insert', 'INSERT', 'new', 0),
+    ('comment', 'blog_comment', 'update', 'UPDATE OF content', 'new', 0),
+    ('comment', 'blog_comment', 'delete', 'DELETE', 'old', 1),
+]
+
+
+def compress(value):
+    if not isinstance(value, str):
+        return value
+    data = value.encode()
+    if len(data) < THRESHOLD:
+        return value
+    compressed = b'z' + zlib.compress(data, LEVEL)
+    return compressed if len(compressed) < len(data) else value
+
+
+def decompress(value):
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    if value[:1] == b'z':
+        return zlib.decompress(value[1:]).decode()
+    # b's': stored by a later BLOG_COMPRESSION = 'zstd'
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(value[1:]).decode()
+
+
+def rewrite_contents(schema_editor, convert, index_sql):
+    # The search index and the change log are dropped while the contents are rewritten, and made again after
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    for name in SEARCH_TRIGGERS:
+        schema_editor.execute('DROP TRIGGER IF EXISTS ' + name)
+    schema_editor.execute('DROP TABLE IF EXISTS blog_article_fts')
+    schema_editor.execute('DROP VIEW IF EXISTS blog_article_text')
+    for kind, _, event, _, _, _ in CHANGE_TRIGGERS:
+        schema_editor.execute('DROP TRIGGER IF EXISTS blog_change_%s_%s' % (kind, event))
+
+    with schema_editor.connection.cursor() as cursor:
+        for table in ('blog_article', 'blog_comment'):
+            last_id = 0
+            while True:
+                cursor.execute('SELECT id, content FROM %s WHERE id > %%s ORDER BY id LIMIT %%s' % table, [last_id, CHUNK_SIZE])
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                updates = []
+                for id, value in rows:
+                    stored = convert(value)
+                    if type(stored) is not type(value) or stored != value:
+                        updates.append((stored, id))
+                cursor.executemany('UPDATE %s SET content = %%s WHERE id = %%s' % table, updates)
+
+    for sql in index_sql:
+        schema_editor.execute(sql)
+    for kind, table, event, action, row, deleted in CHANGE_TRIGGERS:
+        schema_editor.execute(CHANGE_TRIGGER_SQL.format(kind=kind, event=event, action=action, table=table, row=row, deleted=deleted))
+
+
+def compress_contents(apps, schema_editor):
+    # With BLOG_COMPRESSION = None the contents are left plain
+    convert = compress if getattr(settings, 'BLOG_COMPRESSION', 'zlib') is not None else str
+    rewrite_contents(schema_editor, convert, DECOMPRESSING_INDEX_SQL)
+
+
+def decompress_contents(apps, schema_editor):
+    rewrite_contents(schema_editor, decompress, PLAIN_INDEX_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_change_feed'),
+    ]
+
+    operations = [
+        # The columns stay TEXT (SQLite keeps the BLOBs stored in them as they are), so only the state changes
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='article',
+                name='content',
+                field=blog.compression.CompressedTextField(),
+            ),
+            migrations.AlterField(
+                model_name='comment',
+                name='content',
+                field=blog.compression.CompressedTextField(),
+            ),
+        ]),
+        migrations.RunPython(compress_contents, decompress_contents),
+    ]
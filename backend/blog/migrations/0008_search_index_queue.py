@@ -0,0 +1,68 @@
+from django.db import migrations
+
+# The SQL is copied here, not imported from blog/search.py, so that this migration always makes the same schema.
+# A queued write keeps the title and the (stored) content the article had before it, when it had any
+QUEUE_SQL = [
+    """CREATE TABLE IF NOT EXISTS blog_article_fts_pending (
+        seq INTEGER PRIMARY KEY, article_id INTEGER NOT NULL, indexed INTEGER NOT NULL, title TEXT, content
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts_pending(article_id, indexed) VALUES (new.id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts_pending(article_id, indexed, title, content) VALUES (old.id, 1, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts_pending(article_id, indexed, title, content) VALUES (old.id, 1, old.title, old.content);
+    END""",
+]
+
+# The triggers of 0007, which index every write themselves with blog_decompress()
+DECOMPRESSING_TRIGGERS_SQL = [
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, blog_decompress(new.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, blog_decompress(old.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', old.id, old.title, blog_decompress(old.content));
+        INSERT INTO blog_article_fts(rowid, title, content) VALUES (new.id, new.title, blog_decompress(new.content));
+    END""",
+]
+
+
+def drop_triggers(schema_editor):
+    for trigger in ('insert', 'delete', 'update'):
+        schema_editor.execute('DROP TRIGGER IF EXISTS blog_article_fts_' + trigger)
+
+
+def queue_search_writes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    drop_triggers(schema_editor)
+    for sql in QUEUE_SQL:
+        schema_editor.execute(sql)
+
+
+def index_search_writes(apps, schema_editor):
+    # The writes still queued are indexed by rebuilding the index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    drop_triggers(schema_editor)
+    schema_editor.execute('DROP TABLE IF EXISTS blog_article_fts_pending')
+    for sql in DECOMPRESSING_TRIGGERS_SQL:
+        schema_editor.execute(sql)
+    schema_editor.execute("INSERT INTO blog_article_fts(blog_article_fts) VALUES ('delete-all')")
+    schema_editor.execute('INSERT INTO blog_article_fts(rowid, title, content) SELECT id, title, blog_decompress(content) FROM blog_article')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0007_compressed_contents'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_search_writes, index_search_writes),
+    ]
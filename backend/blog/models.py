@@ -1,25 +1,196 @@
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models import F, FilteredRelation, Q
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .compression import CompressedTextField
+
+
+def index_articles(using):
+    # Imported here: blog/search.py imports this module
+    from .search import apply_pending
+    apply_pending(connections[using])
+
+
+class ArticleQuerySet(models.QuerySet):
+    """
+    Applies the search index writes queued by a write to the articles in the same transaction (see blog/search.py)
+    """
+
+    def _write_db(self):
+        return self._db or router.db_for_write(self.model, **self._hints)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        db = self._write_db()
+        with transaction.atomic(using=db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            if objs:
+                index_articles(db)
+        return objs
+
+    def update(self, **kwargs):
+        if 'title' not in kwargs and 'content' not in kwargs:
+            return super().update(**kwargs)
+        db = self._write_db()
+        with transaction.atomic(using=db):
+            rows = super().update(**kwargs)
+            if rows:
+                index_articles(db)
+        return rows
+
+    def delete(self):
+        db = self._write_db()
+        with transaction.atomic(using=db):
+            deleted = super().delete()
+            if deleted[0]:
+                index_articles(db)
+        return deleted
+
+    def comment_values(self, *fields, after=0, newest=False, article_fields=()):
+        """
+        Reads `fields` of the comments under the articles, in the same query as the articles themselves
+
+        Comments are LEFT JOINed, so an article without comments still gives one row with None for every field,
+        and no row at all means no article matched. The comments are ordered by id (newest first with `newest`),
+        and with an `after` cursor only those after it in that order are joined. The articles' `article_fields`
+        are read in front of the comments' fields
+        """
+
+        relation = 'commented_articles'
+        queryset = self
+        if after:
+            # The cursor is a condition of the join, not of the WHERE, which would drop the article's row
+            condition = Q(commented_articles__id__lt=after) if newest else Q(commented_articles__id__gt=after)
+            queryset = queryset.annotate(listed_comments=FilteredRelation(relation, condition=condition))
+            relation = 'listed_comments'
+
+        names = list(article_fields) + [relation + '__' + field for field in fields]
+        return queryset.order_by(('-' if newest else '') + relation + '__id').values_list(*names)
+
+    def add_comments(self, count):
+        """
+        Counts `count` more comments (or fewer, when negative) under the articles, in a single UPDATE
+
+        Call it in the same transaction as the comments' INSERT or DELETE. A count never goes below 0,
+        e.g. when a comment saved without being counted is deleted
+        """
+
+        if count > 0:
+            return self.update(comment_count=F('comment_count') + count, last_commented_at=timezone.now())
+        return self.update(comment_count=Greatest(F('comment_count') + count, 0))
+
+
+class CommentManager(models.Manager):
+    def create_for_article(self, article_id, **fields):
+        """
+        Creates a comment under an article with a single `INSERT ... SELECT` that only inserts when the article exists
+
+        SQLite checks foreign keys only when the outermost transaction commits, so a plain INSERT
+        cannot report a missing article while the request is still being handled.
+        Returns the saved comment, or None when there is no article with such id
+        """
+
+        comment = self.model(article_id=article_id, **fields)
+        db = router.db_for_write(self.model)
+        connection = connections[db]
+        quote_name = connection.ops.quote_name
+        opts = self.model._meta
+        columns = [field for field in opts.concrete_fields if not field.primary_key]
+        values = [field.get_db_prep_save(field.pre_save(comment, True), connection) for field in columns]
+
+        sql = 'INSERT INTO %s (%s) SELECT %s FROM %s WHERE %s = %%s' % (
+            quote_name(opts.db_table),
+            ', '.join(quote_name(field.column) for field in columns),
+            ', '.join(['%s'] * len(columns)),
+            quote_name(Article._meta.db_table),
+            quote_name(Article._meta.pk.column),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values + [article_id])
+            if cursor.rowcount == 0:
+                return None
+            comment.pk = connection.ops.last_insert_id(cursor, opts.db_table, opts.pk.column)
+
+        comment._state.adding = False
+        comment._state.db = db
+        return comment
+
 
 # Create your models here.
 class Article(models.Model):
     title = models.CharField(max_length=64)
-    content = models.TextField()
+    content = CompressedTextField()
     author = models.ForeignKey(
         User,
         related_name = "written_articles",
         on_delete = models.CASCADE,
+        db_index = False, # Covered by the (author, id) index
     )
+    # Validators for conditional GETs: the version goes up by one on every update
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # Kept up to date by the comment create/delete paths, so listings need not count comments
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_commented_at = models.DateTimeField(null=True, editable=False)
+
+    objects = ArticleQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        db = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=db):
+            super().save(*args, **kwargs)
+            index_articles(db)
+
+    def delete(self, *args, **kwargs):
+        db = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=db):
+            deleted = super().delete(*args, **kwargs)
+            index_articles(db)
+        return deleted
+
+    class Meta:
+        # Cursor pages are ranges of the primary key, which is the table's own (rowid) index
+        indexes = [
+            models.Index(fields=['author', 'id'], name='blog_article_author_id_idx'),
+        ]
 
 class Comment(models.Model):
     article = models.ForeignKey(
         Article,
         related_name = "commented_articles",
         on_delete = models.CASCADE,
+        db_index = False, # Covered by the (article, id) index
     )
-    content = models.TextField()
+    content = CompressedTextField()
     author = models.ForeignKey(
         User,
         related_name = "written_comments",
         on_delete = models.CASCADE,
     )
+    # Validators for conditional GETs: the version goes up by one on every update
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = CommentManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['article', 'id'], name='blog_comment_article_id_idx'),
+        ]
+
+class Change(models.Model):
+    """
+    The last write to an article or a comment; the ids are the sequence numbers of the change feed (see blog/changes.py)
+    """
+
+    ARTICLE = 'article'
+    COMMENT = 'comment'
+
+    kind = models.CharField(max_length=7)
+    object_id = models.PositiveIntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'object_id'], name='blog_change_object_idx'),
+        ]
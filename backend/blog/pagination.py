@@ -0,0 +1,92 @@
+"""
+Keyset (cursor) pagination for the list endpoints
+
+Pages are read as `id > after ORDER BY id LIMIT n`, so every page is a bounded
+range scan on the primary key no matter how deep the client has paged. Comments
+are paged the same way on the (article, id) index, in either order.
+"""
+
+from .serializers import row_picker
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+OLDEST = 'oldest'
+NEWEST = 'newest'
+
+
+def get_limit(request):
+    """
+    Reads the page `limit` from the query string, capped to MAX_LIMIT
+
+    Raises ValueError when it is not a positive integer
+    """
+
+    limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    if limit <= 0:
+        raise ValueError("limit must be > 0")
+
+    return min(limit, MAX_LIMIT)
+
+
+def get_page_params(request):
+    """
+    Reads the `after` cursor and the page `limit` from the query string
+
+    Raises ValueError when either of them is not a valid non-negative integer
+    """
+
+    after = int(request.GET.get('after', 0))
+    if after < 0:
+        raise ValueError("after must be >= 0")
+
+    return after, get_limit(request)
+
+
+def get_order(request):
+    """
+    Reads the `order` of a comment listing from the query string: OLDEST (the default) or NEWEST first
+
+    Raises ValueError for any other order
+    """
+
+    order = request.GET.get('order', OLDEST)
+    if order not in (OLDEST, NEWEST):
+        raise ValueError("order must be %s or %s" % (OLDEST, NEWEST))
+
+    return order
+
+
+def split_page(rows, limit):
+    """
+    Cuts `limit` rows (read with one more) into the page and the cursor of the next page (None on the last page)
+
+    The cursor is the id of the last row of the page, which the rows start with
+    """
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1][0]
+    return rows, None
+
+
+def paginate(queryset, after, limit, fields, meta=()):
+    """
+    Gets one page of `fields` from the queryset, starting right after the `after` id
+
+    `meta` names other fields that are read in the same query but left out of the rows
+    Returns the list of row tuples (the values of `fields`, in order), the (id, *meta) tuple of
+    each row, and the cursor of the next page (None on the last page)
+    """
+
+    names = list(dict.fromkeys(['id'] + list(fields) + list(meta)))
+
+    # One row more than asked is read to know whether there is a next page
+    rows = list(queryset.filter(id__gt=after).order_by('id').values_list(*names)[:limit + 1])
+    rows, next_cursor = split_page(rows, limit)
+
+    meta_rows = list(map(row_picker(names, ['id'] + list(meta)), rows))
+    if fields:
+        rows = list(map(row_picker(names, fields), rows))
+
+    return rows, meta_rows, next_cursor
@@ -0,0 +1,202 @@
+"""
+Per-request profiling: Server-Timing headers and latency histograms
+
+ProfilingMiddleware times every request and, through an execute wrapper installed
+on each database connection, the queries it makes. Parts of a view are timed with
+timed(name): `parse` for JSON bodies, `auth` for the password check of a sign in,
+`serialize` for the encoding of listings. They are sent back in a Server-Timing
+header (milliseconds), e.g.
+
+    Server-Timing: db;dur=1.204;desc="3 queries", serialize;dur=0.311, view;dur=2.453, total;dur=2.918
+
+and the latencies are added to histograms per URL name (`article`, `article_id`,
+...), which /api/metrics serves in the Prometheus text format. The histograms are
+kept in memory, so each worker process has its own.
+
+The timings of a streamed response stop when its first bytes are sent, not after
+the last row. Outside of a request (e.g. in management commands), nothing is recorded.
+"""
+
+from django.conf import settings
+import bisect
+import contextlib
+import threading
+import time
+
+# Upper bounds of the latency histograms' buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_state = threading.local()
+
+
+def record(name, seconds):
+    """
+    Adds time spent on `name` to the timings of the current request
+    """
+
+    timings = getattr(_state, 'timings', None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0) + seconds
+
+
+@contextlib.contextmanager
+def timed(name):
+    """
+    Adds the time spent in the enclosed block to the timing `name` of the current request
+    """
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper: counts the queries of the current request and their time
+    """
+
+    if getattr(_state, 'timings', None) is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record('db', time.perf_counter() - start)
+        _state.queries += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """
+    connection_created receiver: installs record_query on a connection
+
+    A connection object is reused when it reconnects, so the wrapper is installed only once
+    """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Histogram:
+    """
+    Latencies sorted into BUCKETS, with their sum and count
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0
+        self.queries = 0
+        self.db = 0
+
+    def observe(self, seconds, queries, db):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.queries += queries
+            self.db += db
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def observe(name, seconds, queries, db):
+    """
+    Records a request of the URL name `name` that took `seconds`, `db` of them in `queries` queries
+    """
+
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(name, Histogram())
+    histogram.observe(seconds, queries, db)
+
+
+def render_metrics():
+    """
+    Writes the histograms in the Prometheus text exposition format
+    """
+
+    lines = [
+        '# HELP blog_request_duration_seconds Time spent answering requests, by URL name',
+        '# TYPE blog_request_duration_seconds histogram',
+    ]
+    totals = []
+    for name, histogram in sorted(_histograms.items()):
+        with histogram.lock:
+            counts = list(histogram.counts)
+            totals.append((name, histogram.sum, histogram.queries, histogram.db))
+
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), counts):
+            cumulative += count
+            lines.append('blog_request_duration_seconds_bucket{view="%s",le="%s"} %d' % (name, bound, cumulative))
+        lines.append('blog_request_duration_seconds_sum{view="%s"} %r' % (name, totals[-1][1]))
+        lines.append('blog_request_duration_seconds_count{view="%s"} %d' % (name, cumulative))
+
+    lines.append('# HELP blog_request_queries_total Database queries made by requests, by URL name')
+    lines.append('# TYPE blog_request_queries_total counter')
+    lines.extend('blog_request_queries_total{view="%s"} %d' % (name, queries) for name, _, queries, _ in totals)
+    lines.append('# HELP blog_request_db_seconds_total Time requests spent in database queries, by URL name')
+    lines.append('# TYPE blog_request_db_seconds_total counter')
+    lines.extend('blog_request_db_seconds_total{view="%s"} %r' % (name, db) for name, _, _, db in totals)
+    return '\n'.join(lines) + '\n'
+
+
+def server_timing(timings, queries):
+    """
+    Makes the Server-Timing header of a request's timings
+    """
+
+    metrics = []
+    for name, seconds in timings.items():
+        metric = '%s;dur=%.3f' % (name, seconds * 1000)
+        if name == 'db':
+            metric += ';desc="%d queries"' % queries
+        metrics.append(metric)
+    return ', '.join(metrics)
+
+
+class ProfilingMiddleware:
+    """
+    Times requests, adds their Server-Timing header (unless BLOG_SERVER_TIMING is off) and
+    records them in the histograms of /api/metrics
+
+    Goes first in MIDDLEWARE, so that `total` covers every other middleware; `view` runs from
+    the call of the view until its response is back here
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        _state.timings = timings = {}
+        _state.queries = 0
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.timings = None
+
+        end = time.perf_counter()
+        if 'view' in timings:
+            timings['view'] = end - timings['view']
+        timings['total'] = end - start
+
+        if settings.BLOG_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(timings, _state.queries)
+
+        match = request.resolver_match
+        observe(match.view_name if match is not None else 'unmatched',
+                timings['total'], _state.queries, timings.get('db', 0))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # The start of the view, turned into its duration once the response is back
+        timings = getattr(_state, 'timings', None)
+        if timings is not None:
+            timings['view'] = time.perf_counter()
@@ -0,0 +1,90 @@
+"""
+Read replicas for the GET requests of the article and comment views
+
+Views decorated with @replica_reads read from one of BLOG_READ_REPLICAS (aliases
+of DATABASES) while they answer a GET, the same one for every query of the
+request, so they never mix data of replicas that lag by different amounts;
+everything else reads and writes the default database. A client that has just written is pinned to the default
+database for BLOG_REPLICA_STICKY_SECONDS by a cookie, so it reads its own writes
+even when the replicas lag behind.
+"""
+
+from django.conf import settings
+import contextlib
+import functools
+import random
+import threading
+
+STICKY_COOKIE = 'blog_primary'
+
+_state = threading.local()
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the replica picked for a @replica_reads GET, and leaves everything else to the default database
+    """
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'replica', None)
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas are copies of the default database
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema with their copy of the data
+        if db in settings.BLOG_READ_REPLICAS:
+            return False
+        return None
+
+
+@contextlib.contextmanager
+def _reading_from(replica):
+    previous = getattr(_state, 'replica', None)
+    _state.replica = replica
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def current_replica():
+    """
+    Gets the replica that the reads go to, or None when they go to the default database
+    """
+
+    return getattr(_state, 'replica', None)
+
+
+def use_primary():
+    """
+    Makes the reads of the enclosed block go to the default database, e.g. to check what a replica gave
+    """
+
+    return _reading_from(None)
+
+
+def replica_reads(view):
+    """
+    Decorates a view so that its GET requests read from a random replica, unless the client is pinned to the
+    default database; responses to other requests pin the client for BLOG_REPLICA_STICKY_SECONDS
+    """
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            replicas = settings.BLOG_READ_REPLICAS
+            replica = random.choice(replicas) if replicas and STICKY_COOKIE not in request.COOKIES else None
+            with _reading_from(replica):
+                return view(request, *args, **kwargs)
+
+        response = view(request, *args, **kwargs)
+        if settings.BLOG_READ_REPLICAS and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, '1', max_age=settings.BLOG_REPLICA_STICKY_SECONDS, httponly=True)
+        return response
+
+    return wrapper
@@ -0,0 +1,249 @@
+"""
+Full-text search over article titles and contents
+
+The index is an SQLite FTS5 table that uses blog_article as its external content,
+so the text itself is not stored twice: snippets are cut from the articles read
+through the blog_article_text view, which decompresses their contents (see
+blog/compression.py).
+
+Triggers on blog_article queue every write into blog_article_fts_pending,
+including bulk inserts and queryset updates that skip signals, and the writes
+of the application apply the queue to the index in their own transaction
+(apply_pending, called by Article and its queryset, see blog/models.py), so
+searches only read. The triggers are plain SQL: indexing needs the contents
+decompressed, which only the application can do, so it is left to it, and the
+database can still be written by any other client (the sqlite3 shell, a
+restore or maintenance script), its writes being indexed along with the next
+write of the application.
+
+SQLite refuses to rename a table that a view reads from, which migrations that
+alter blog_article do; so the view is dropped before every migrate, and created
+again after it.
+"""
+
+from django.db import connections, router
+from django.db.migrations.loader import MigrationLoader
+from .compression import decompress
+from .models import Article
+
+FTS_TABLE = 'blog_article_fts'
+
+# Words around each match in a snippet
+SNIPPET_TOKENS = 16
+
+# BM25 weights of the title and content columns: a match in the title counts more
+RANK = 'bm25(10.0, 1.0)'
+
+# Articles read per query when the queue is applied (SQLite allows at most 999 variables in a statement)
+CHUNK_SIZE = 500
+
+VIEW_SQL = """CREATE VIEW IF NOT EXISTS blog_article_text AS
+    SELECT id, title, blog_decompress(content) AS content FROM blog_article"""
+
+# A queued write keeps the title and the (stored) content the article had before it, when it had any
+INDEX_SQL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS blog_article_fts USING fts5(
+        title, content, content='blog_article_text', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TABLE IF NOT EXISTS blog_article_fts_pending (
+        seq INTEGER PRIMARY KEY, article_id INTEGER NOT NULL, indexed INTEGER NOT NULL, title TEXT, content
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_insert AFTER INSERT ON blog_article BEGIN
+        INSERT INTO blog_article_fts_pending(article_id, indexed) VALUES (new.id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_delete AFTER DELETE ON blog_article BEGIN
+        INSERT INTO blog_article_fts_pending(article_id, indexed, title, content) VALUES (old.id, 1, old.title, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS blog_article_fts_update AFTER UPDATE OF title, content ON blog_article BEGIN
+        INSERT INTO blog_article_fts_pending(article_id, indexed, title, content) VALUES (old.id, 1, old.title, old.content);
+    END""",
+]
+
+
+def drop_index(connection):
+    """
+    Drops the FTS5 table, its triggers and their queue
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for trigger in ('insert', 'delete', 'update'):
+            cursor.execute('DROP TRIGGER IF EXISTS blog_article_fts_' + trigger)
+        cursor.execute('DROP TABLE IF EXISTS blog_article_fts')
+        cursor.execute('DROP TABLE IF EXISTS blog_article_fts_pending')
+
+
+def install_index(connection, rebuild=False):
+    """
+    Creates the FTS5 table and its triggers when they are missing, and optionally rebuilds the index from blog_article
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        for sql in INDEX_SQL:
+            cursor.execute(sql)
+        cursor.execute("INSERT INTO blog_article_fts(blog_article_fts, rank) VALUES ('rank', %s)", [RANK])
+        if rebuild:
+            # Indexed from blog_article itself, as the view is not there while migrating
+            cursor.execute('DELETE FROM blog_article_fts_pending')
+            cursor.execute("INSERT INTO blog_article_fts(blog_article_fts) VALUES ('delete-all')")
+            cursor.execute(
+                'INSERT INTO blog_article_fts(rowid, title, content) SELECT id, title, blog_decompress(content) FROM blog_article')
+
+
+def apply_pending(connection):
+    """
+    Applies the writes queued by the triggers to the index
+
+    Call it in the transaction of the write, which holds the write lock, so that the queue is applied by one
+    connection at a time and is empty when the transaction commits. An article's entry is taken out of the index
+    with the values of its first queued write (those it was indexed with), and the article is indexed again as it
+    is now, when it still exists. Returns the number of articles indexed again
+    """
+
+    if connection.vendor != 'sqlite':
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT seq, article_id, indexed, title, content FROM blog_article_fts_pending ORDER BY seq')
+        first = {}
+        last_seq = 0
+        for seq, article_id, indexed, title, content in cursor.fetchall():
+            first.setdefault(article_id, (indexed, title, content))
+            last_seq = seq
+        if not first:
+            return 0
+
+        deleted = [(article_id, title, decompress(content)) for article_id, (indexed, title, content) in first.items() if indexed]
+        if deleted:
+            cursor.executemany(
+                "INSERT INTO blog_article_fts(blog_article_fts, rowid, title, content) VALUES ('delete', %s, %s, %s)", deleted)
+
+        ids = list(first)
+        indexed = 0
+        for start in range(0, len(ids), CHUNK_SIZE):
+            chunk = ids[start:start + CHUNK_SIZE]
+            cursor.execute('SELECT id, title, content FROM blog_article WHERE id IN (%s)' % ', '.join(['%s'] * len(chunk)), chunk)
+            rows = [(id, title, decompress(content)) for id, title, content in cursor.fetchall()]
+            if rows:
+                cursor.executemany('INSERT INTO blog_article_fts(rowid, title, content) VALUES (%s, %s, %s)', rows)
+            indexed += len(rows)
+
+        cursor.execute('DELETE FROM blog_article_fts_pending WHERE seq <= %s', [last_seq])
+    return indexed
+
+
+def is_migrated(connection):
+    """
+    Tells whether every migration of the blog is applied to a database, so that its schema is the one of this code
+    """
+
+    loader = MigrationLoader(connection)
+    return all(node in loader.applied_migrations for node in loader.graph.leaf_nodes('blog'))
+
+
+def reinstall_triggers(sender, using, **kwargs):
+    """
+    post_migrate receiver: SQLite migrations that alter blog_article copy it into a new table and drop
+    the old one, which drops its triggers too, so they are created again after a migrate to the last
+    migration (the migrations make those of their own), and so is the view the snippets are read from,
+    when the index reads from it
+    """
+
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return
+
+    if is_migrated(connection):
+        install_index(connection)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE name = %s", [FTS_TABLE])
+        if "content='blog_article_text'" in cursor.fetchone()[0]:
+            cursor.execute(VIEW_SQL)
+
+
+def drop_view(sender, using, **kwargs):
+    """
+    pre_migrate receiver: drops the view the snippets are read from, so that migrations can rename blog_article
+    """
+
+    connection = connections[using]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('DROP VIEW IF EXISTS blog_article_text')
+
+
+def match_expression(q):
+    """
+    Turns a search string into an FTS5 query that matches all of its words
+
+    Every word is quoted, so FTS5 operators are taken literally; a trailing * still makes a prefix search
+    """
+
+    terms = []
+    for word in q.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*')
+        if word:
+            terms.append('"' + word.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def parse_cursor(cursor):
+    """
+    Reads a search cursor ("<rank>:<id>", as given by search_articles); raises ValueError when it is malformed
+    """
+
+    rank, id = cursor.split(':')
+    return float(rank), int(id)
+
+
+def search_articles(q, after, limit):
+    """
+    Gets one page of the articles matching `q`, best BM25 rank first
+
+    `after` is the (rank, id) of the last result of the previous page, or None for the first page
+    Returns the list of {"id", "title", "author", "snippet"} dictionaries and the cursor of the next page
+    """
+
+    expression = match_expression(q)
+    if not expression:
+        return [], None
+
+    connection = connections[router.db_for_read(Article)]
+    with connection.cursor() as cursor:
+        # Ranks first, reading nothing but the index; FTS5 ranks by BM25 (lower is better)
+        sql = 'SELECT rowid, rank FROM blog_article_fts WHERE blog_article_fts MATCH %s'
+        params = [expression]
+        if after is not None:
+            sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+            params += [after[0], after[0], after[1]]
+        cursor.execute(sql + ' ORDER BY rank, rowid LIMIT %s', params + [limit + 1])
+        ranked = cursor.fetchall()
+
+        next_cursor = None
+        if len(ranked) > limit:
+            ranked = ranked[:limit]
+            next_cursor = '%r:%d' % (ranked[-1][1], ranked[-1][0])
+        if not ranked:
+            return [], None
+
+        # Then snippets, only for the articles of the page
+        ids = [id for id, _ in ranked]
+        cursor.execute(
+            'SELECT a.id, a.title, a.author_id, snippet(blog_article_fts, 1, %s, %s, %s, %s)'
+            ' FROM blog_article_fts JOIN blog_article a ON a.id = blog_article_fts.rowid'
+            ' WHERE blog_article_fts MATCH %s AND blog_article_fts.rowid IN (' + ', '.join(['%s'] * len(ids)) + ')',
+            ['[', ']', '...', SNIPPET_TOKENS, expression] + ids)
+        rows = {id: (title, author, snippet) for id, title, author, snippet in cursor.fetchall()}
+
+    results = []
+    for id in ids:
+        if id in rows:
+            title, author, snippet = rows[id]
+            results.append({"id": id, "title": title, "author": author, "snippet": snippet})
+    return results, next_cursor
@@ -0,0 +1,169 @@
+"""
+JSON encoding of articles and comments straight from values_list() rows
+
+The output is byte for byte what json.dumps (with DjangoJSONEncoder, as JsonResponse
+uses) gives for the rows' dictionaries, but no dictionary is made: every row is
+formatted into a template of its keys in one go, with the way each value is encoded
+picked once per field. Strings are escaped by orjson when it is installed, and by
+the C escaper of the json module otherwise.
+"""
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from .compression import CompressedTextField, decompress
+from .profiling import timed
+from json.encoder import encode_basestring_ascii
+import functools
+import operator
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_encoder = DjangoJSONEncoder()
+
+
+if orjson is not None:
+    def encode_string(value):
+        """
+        Encodes a string as json.dumps does (with ensure_ascii)
+        """
+
+        # orjson leaves non-ASCII characters and DEL unescaped, where json.dumps escapes them
+        if value.isascii() and '\x7f' not in value:
+            return orjson.dumps(value).decode()
+        return encode_basestring_ascii(value)
+else:
+    encode_string = encode_basestring_ascii
+
+
+def encode_value(value):
+    """
+    Encodes any value as json.dumps with DjangoJSONEncoder does
+    """
+
+    if isinstance(value, str):
+        return encode_string(value)
+    return _json_encoder.encode(value)
+
+
+def _encode_datetime(value):
+    return encode_string(_json_encoder.default(value))
+
+
+def _identity(value):
+    return value
+
+
+def _nullable(encode):
+    return lambda value: 'null' if value is None else encode(value)
+
+
+def _field_encoder(model, name):
+    # Picks how a field is encoded from its type: '%d' for integers (formatted by the row template
+    # itself), or else a function; other names (e.g. annotations) are encoded by their values' types
+    if model is None:
+        return encode_value
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return encode_value
+
+    if isinstance(field, (models.AutoField, models.IntegerField, models.ForeignKey)):
+        return _nullable('%d'.__mod__) if field.null else '%d'
+    if isinstance(field, CompressedTextField):
+        # Stored values are decompressed only here, while they are encoded
+        encode = lambda value: encode_string(decompress(value))
+    elif isinstance(field, (models.CharField, models.TextField)):
+        encode = encode_string
+    elif isinstance(field, models.DateTimeField):
+        encode = _encode_datetime
+    else:
+        return encode_value
+
+    return _nullable(encode) if field.null else encode
+
+
+class RowEncoder:
+    """
+    Encodes rows of values of `fields` of a model (in that order) as JSON objects keyed by the field names
+
+    With no model, every value is encoded by its type (e.g. for values that come from a request body)
+    """
+
+    def __init__(self, model, fields):
+        self.fields = tuple(fields)
+
+        keys = []
+        encoders = []
+        for field in self.fields:
+            encode = _field_encoder(model, field)
+            key = encode_string(field).replace('%', '%%') + ': '
+            if encode == '%d':
+                # Formatted by the template itself
+                keys.append(key + '%d')
+                encoders.append(_identity)
+            else:
+                keys.append(key + '%s')
+                encoders.append(encode)
+        template = '{' + ', '.join(keys) + '}'
+        encoders = tuple(encoders)
+
+        def encode(row):
+            """
+            Encodes one row as a JSON object
+            """
+
+            return template % tuple([encode_field(value) for encode_field, value in zip(encoders, row)])
+
+        self.encode = encode
+
+    def encode_list(self, rows, prefix='', suffix=''):
+        """
+        Encodes rows as a JSON array of objects (between `prefix` and `suffix`)
+        """
+
+        # Joined only once: the array's brackets and the prefix and suffix are put on its first and last items
+        encode = self.encode
+        with timed('serialize'):
+            items = [encode(row) for row in rows]
+            if not items:
+                return prefix + '[]' + suffix
+            items[0] = prefix + '[' + items[0]
+            items[-1] = items[-1] + ']' + suffix
+            return ', '.join(items)
+
+    def encode_page(self, rows, next_cursor, **extra):
+        """
+        Encodes one page of a listing: {"results": [...], "next": ...}, followed by the `extra` keys
+        """
+
+        suffix = ''.join(', %s: %s' % (encode_string(key), encode_value(value)) for key, value in extra.items())
+        return self.encode_list(rows, '{"results": ', ', "next": %s%s}' % (encode_value(next_cursor), suffix))
+
+
+@functools.lru_cache(maxsize=256)
+def _row_encoder(model, fields):
+    return RowEncoder(model, fields)
+
+
+def get_encoder(model, fields):
+    """
+    Gets the (shared) RowEncoder of the fields of a model
+    """
+
+    return _row_encoder(model, tuple(fields))
+
+
+def row_picker(columns, fields):
+    """
+    Makes a function that gives the values of `fields` (in that order) from a row laid out as `columns`
+    """
+
+    indexes = [list(columns).index(field) for field in fields]
+    if len(indexes) == 1:
+        index, = indexes
+        return lambda row: (row[index],)
+    return operator.itemgetter(*indexes)
@@ -0,0 +1,43 @@
+"""
+Session engine (SESSION_ENGINE = 'blog.sessions') that reads sessions without the database
+
+A session is looked up in an in-process LRU first, then in the shared `sessions`
+cache, and only then in the database, so an API call with a known session makes
+no session query. Writes go to the database and the shared cache as with
+Django's cached_db engine, and drop the session from this process's LRU; other
+processes see a deleted (logged out) session within BLOG_LOCAL_CACHE_TTL seconds.
+
+The `sessions` cache must be shared by every process (the settings only use this
+engine with BLOG_CACHE_REDIS_URL): a local-memory one keeps a session until it
+expires, whatever other processes do.
+"""
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from .cache import LocalCache
+
+local_sessions = LocalCache(settings.BLOG_LOCAL_CACHE_ENTRIES, settings.BLOG_LOCAL_CACHE_TTL)
+
+
+class SessionStore(CachedDBStore):
+    def load(self):
+        data = local_sessions.get(self.cache_key)
+        if data is None:
+            data = super().load()
+            if not data:
+                return data
+            local_sessions.set(self.cache_key, data)
+
+        # Each request changes its own copy
+        return dict(data)
+
+    def save(self, must_create=False):
+        if self.session_key is not None:
+            local_sessions.delete(self.cache_key_prefix + self.session_key)
+        super().save(must_create)
+
+    def delete(self, session_key=None):
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            local_sessions.delete(self.cache_key_prefix + session_key)
+        super().delete(session_key)
@@ -0,0 +1,37 @@
+"""
+Connection setup for SQLite databases
+
+Every new SQLite connection is tuned with PRAGMA statements (BLOG_SQLITE_PRAGMAS in
+the settings, or the `PRAGMAS` of its own DATABASES entry). With WAL, readers
+read the last committed snapshot while a write is in progress, instead of waiting
+for it; with persistent connections (CONN_MAX_AGE), a connection and its page
+cache are kept from one request to the next. The SQL functions of the blog
+(blog_decompress(), see blog/compression.py) are registered on it too.
+"""
+
+from django.conf import settings
+from .compression import register_functions
+
+
+def apply_pragmas(cursor, pragmas):
+    """
+    Runs `PRAGMA name = value` for each of the pragmas on a cursor
+    """
+
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    connection_created receiver: applies the PRAGMAs of a new SQLite connection, and registers the blog's functions
+    """
+
+    if connection.vendor != 'sqlite':
+        return
+
+    register_functions(connection)
+
+    pragmas = connection.settings_dict.get('PRAGMAS', settings.BLOG_SQLITE_PRAGMAS)
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, pragmas)
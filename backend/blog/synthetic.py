@@ -0,0 +1,145 @@
+"""
+Synthetic users, articles and comments at realistic sizes, for benchmarks
+
+The data is skewed as on a real blog: a few users write most of the articles and
+comments, a few articles get most of the comments (both Zipf distributed), texts
+have log-normal lengths and their words follow a Zipf distribution too. Rows are
+written CHUNK_SIZE per transaction with one executemany() each (bulk_create spends
+most of its time preparing values one by one), and the articles' comment counts
+are filled in as the views would have kept them, and so is the search index.
+Contents are stored compressed as the models save them (see blog/compression.py).
+"""
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.utils import timezone
+from .compression import compress
+from .models import Article, Comment, index_articles
+import collections
+import itertools
+import math
+import random
+
+# Rows made and written per transaction
+CHUNK_SIZE = 5000
+
+# Characters of the text that contents are cut from
+TEXT_SIZE = 1 << 20
+
+WORDS = (
+    "the of and to in is that it for was on are as with his they at be this from have or by one had not but what all "
+    "were when we there can an your which their said if do will each about how up out them then she many some so these "
+    "would other into has more her two like him see time could no make than first been its who now people my made over "
+    "did down only way find use may water long little very after words called just where most know get through back much "
+    "before go good new write our used me man too any day same right look think also around another came come work three "
+    "word must because does part even place well such here take why things help put years different away again off went "
+    "old number great tell men say small every found still between name should home big give air line set own under read "
+    "last never us left end along while might next sound below saw something thought both few those always looked show "
+    "large often together asked house world going want school important until form food keep children feet land side "
+    "without boy once animals life enough took sometimes four head above kind began almost live page got earth need far "
+    "hand high year mother light parts country father let night following picture being study second eyes soon times "
+    "story boys since white days ever paper hard near sentence better best across during today others however sure means "
+    "knew tried group began kept idea fish mountains north once base hear horse cut sure watch color face wood main"
+).split()
+
+
+def zipf_weights(count, exponent=1.0):
+    """
+    Cumulative weights of the ranks 1 to `count`, rank r having the weight 1 / r**exponent
+    """
+
+    return list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+def skewed_choices(rng, population, k, exponent=1.0):
+    """
+    Picks `k` items of the population, Zipf distributed over a random ranking of the items
+    """
+
+    ranked = list(population)
+    rng.shuffle(ranked)
+    return rng.choices(ranked, cum_weights=zipf_weights(len(ranked), exponent), k=k)
+
+
+class TextMaker:
+    """
+    Makes texts of log-normal lengths out of one long text of Zipf distributed words
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        words = rng.choices(WORDS, cum_weights=zipf_weights(len(WORDS)), k=TEXT_SIZE // 5)
+        self.text = ' '.join(words)[:TEXT_SIZE]
+
+    def make(self, median, limit):
+        length = min(limit, max(1, int(self.rng.lognormvariate(math.log(median), 0.8))))
+        start = self.rng.randrange(len(self.text) - length)
+        return self.text[start:start + length].strip() or WORDS[0]
+
+
+def _last_id(model, using):
+    return model.objects.using(using).order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _insert(model, fields, count, make, using, on_insert=None):
+    # Writes `count` rows of the values of `fields` made by make(index), and gives back their ids in order;
+    # on_insert(using) is called in each transaction, right after its rows are written
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(model._meta.db_table),
+        ', '.join(quote_name(model._meta.get_field(field).column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+
+    last_id = _last_id(model, using)
+    for start in range(0, count, CHUNK_SIZE):
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.executemany(sql, [make(index) for index in range(start, min(count, start + CHUNK_SIZE))])
+            if on_insert is not None:
+                on_insert(using)
+    return list(model.objects.using(using).filter(id__gt=last_id).order_by('id').values_list('id', flat=True))
+
+
+def generate(users, articles, comments, password='password', seed=0, using='default'):
+    """
+    Writes `users` users (all with the same password), `articles` articles and `comments` comments
+
+    Returns the ids of the users and of the articles made
+    """
+
+    rng = random.Random(seed)
+    text = TextMaker(rng)
+    now = Article._meta.get_field('updated_at').get_db_prep_save(timezone.now(), connections[using])
+    # Contents are stored as CompressedTextField.get_db_prep_save stores them
+    store = compress if connections[using].vendor == 'sqlite' else str
+
+    # The password is hashed once, not for every user
+    hashed = make_password(password)
+    first = _last_id(User, using) + 1
+    user_ids = _insert(
+        User, ('username','password','last_login','is_superuser','is_staff','is_active','first_name','last_name','email','date_joined'),
+        users, lambda index: ('user%d' % (first + index), hashed, None, False, False, True, '', '', '', now), using)
+
+    # Comments are spread first, so that the articles are written with their counts
+    commented = collections.Counter(skewed_choices(rng, range(articles), comments)) if articles else {}
+    article_authors = skewed_choices(rng, user_ids, articles)
+
+    def make_article(index):
+        count = commented.get(index, 0)
+        return (text.make(30, 64), store(text.make(1500, 20000)), article_authors[index], now, 1, count, now if count else None)
+
+    article_ids = _insert(Article, ('title','content','author','updated_at','version','comment_count','last_commented_at'),
+                          articles, make_article, using, on_insert=index_articles)
+
+    # Comments are made in a random order of their articles, as they are written over time
+    targets = [article_ids[index] for index, count in commented.items() for _ in range(count)]
+    rng.shuffle(targets)
+    comment_authors = skewed_choices(rng, user_ids, comments)
+
+    def make_comment(index):
+        return (targets[index], store(text.make(150, 2000)), comment_authors[index], now, 1)
+
+    _insert(Comment, ('article','content','author','updated_at','version'), comments, make_comment, using)
+    return user_ids, article_ids
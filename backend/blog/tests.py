@@ -1,19 +1,87 @@
 import blog.views
-from django.test import TestCase, Client
+from django.conf import settings
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, JsonResponse
 from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, router
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.forms.models import model_to_dict
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout
 from django.contrib.auth import authenticate
 
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.http import http_date
 from django.views.decorators.csrf import ensure_csrf_cookie
-from .models import Article, Comment
+from myblog.asgi import WsgiToAsgi, application
+from .admission import ConcurrencyLimit, TokenBuckets, get_write_buckets
+from .auth import local_users
+from .compression import compress, decompress, register_functions
+from .events import EventStreamResponse, LocalBroker, SocketBroker, get_broker
+from .models import Article, Change, Comment
+from .routers import STICKY_COOKIE, replica_reads
+from .serializers import get_encoder
+from .sessions import local_sessions
+from .synthetic import generate
+from .urls import urlpatterns
+from .writer import GroupCommitWriter, PendingWrite
+from unittest import mock
+import asyncio
+import datetime
+import io
 import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+
+# Most queries and serialized rows (items of the JSON response) allowed for each URL name and method,
+# whatever the number of articles and comments (see test_query_budgets); None for no row limit
+QUERY_BUDGETS = {
+    ('signup', 'POST'): (1, 0),
+    ('signin', 'POST'): (9, 0),
+    ('signout', 'GET'): (2, 0),
+    ('article', 'GET'): (2, 50),  # One page (of the default size)
+    ('article', 'POST'): (7, 1),  # Applies the search index writes queued by the triggers (see blog/search.py)
+    ('article_bulk', 'POST'): (10, None),  # A result for each item of the request
+    ('article_bulk', 'DELETE'): (13, None),
+    ('article_search', 'GET'): (2, 50),
+    ('article_id', 'GET'): (1, 1),
+    ('article_id', 'PUT'): (8, 1),
+    ('article_id', 'DELETE'): (9, 0),
+    ('article_id_comment', 'GET'): (1, 50),  # One page (of the default size)
+    ('article_id_comment', 'POST'): (4, 1),
+    ('article_id_comment_bulk', 'POST'): (6, None),
+    ('comment_bulk', 'DELETE'): (6, None),
+    ('comment_id', 'GET'): (1, 1),
+    ('comment_id', 'PUT'): (2, 1),
+    ('comment_id', 'DELETE'): (5, 0),
+    ('token', 'GET'): (0, 0),
+    ('metrics', 'GET'): (0, 0),
+    ('changes', 'GET'): (5, 50),
+    ('article_id_comment_events', 'GET'): (1, 0),
+}
+
+# Sessions and users read through the caches, as the settings do with a shared cache (BLOG_CACHE_REDIS_URL)
+cached_sessions = override_settings(SESSION_ENGINE='blog.sessions', AUTHENTICATION_BACKENDS=['blog.auth.CachedModelBackend'])
 
 
 class BlogTestCase(TestCase):
     def setUp(self):
+        caches['blog'].clear()
+        caches['sessions'].clear()
+        local_sessions.clear()
+        local_users.clear()
+        get_write_buckets().clear()
+
         user_a = User.objects.create_user(username="alice", password="alice1212")
         user_b = User.objects.create_user(username="bobby", password="bobby1212")
 
@@ -31,6 +99,10 @@ class BlogTestCase(TestCase):
         comment3 = Comment(article=article1, content="Test Comment.", author=user_a) # Written by Alice to Alice's article
         comment3.save()
 
+        # Comments saved directly are not counted by the views
+        Article.objects.filter(id=article1.id).add_comments(2)
+        Article.objects.filter(id=article2.id).add_comments(1)
+
         self.client = Client()
         self.article1 = article1
         self.article2 = article2
@@ -91,6 +163,38 @@ class BlogTestCase(TestCase):
 
 
 
+    @cached_sessions
+    def test_cached_auth_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id)
+        self.client.get(url)
+
+        # The session, the user, and the article all come from the caches
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(0, len(queries))
+
+        # A password change logs the session out
+        user = User.objects.get(id=self.user_a_id)
+        user.set_password("alice3434")
+        user.save()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    @cached_sessions
+    def test_cached_auth_signout_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        # A session is forgotten on sign out, even when another client still has its cookie
+        cookie = self.client.cookies['sessionid'].value
+        self.client.get('/api/signout')
+        self.client.cookies['sessionid'] = cookie
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+
     ### /api/article
 
     def test_article_get_success(self):
@@ -101,6 +205,98 @@ class BlogTestCase(TestCase):
         decodedVal = response.content.decode()
         self.assertIn(json.dumps({"title": "Introducing myself", "content": "Hi my name is Alice!", "author": self.user_a_id}), decodedVal)
 
+    def test_article_get_pagination_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article?limit=2')
+        self.assertEqual(response.status_code, 200)
+
+        content = json.loads(response.content)
+        self.assertEqual(["Hi my name is Alice!", "Hi my name is Bobby!"], [article['content'] for article in content['results']])
+        self.assertEqual(self.article2.id, content['next'])
+
+        response = self.client.get('/api/article?limit=2&after=' + str(content['next']))
+        content = json.loads(response.content)
+        self.assertEqual(["this article is meant to be deleted."], [article['content'] for article in content['results']])
+        self.assertIsNone(content['next'])
+
+    def test_article_get_pagination_failure(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article?limit=0')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/article?after=abc')
+        self.assertEqual(response.status_code, 400)
+
+    def test_article_get_stream_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article?stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        articles = list(Article.objects.order_by('id').values('title','content','author'))
+        self.assertEqual(json.dumps(articles), b''.join(response.streaming_content).decode())
+
+        response = self.client.get('/api/article?after=' + str(self.article1.id), HTTP_ACCEPT='application/x-ndjson')
+        self.assertEqual('application/x-ndjson', response['Content-Type'])
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(articles[1:], [json.loads(line) for line in lines])
+
+    def test_article_get_conditional_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article')
+        etag = response['ETag']
+
+        response = self.client.get('/api/article', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put('/api/article/' + str(self.article1.id), json.dumps({"title":"Hello", "content":"Hello My name is Alice."}))
+        response = self.client.get('/api/article', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(etag, response['ETag'])
+
+        # A listing has no Last-Modified, which a delete would not move forward
+        self.assertNotIn('Last-Modified', response)
+        self.client.delete('/api/article/' + str(self.article3.id))
+        response = self.client.get('/api/article', HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(2, len(json.loads(response.content)['results']))
+
+    def test_article_get_fields_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/article?fields=id,title')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({"id": self.article1.id, "title": "Introducing myself"}, json.loads(response.content)['results'][0])
+
+        # The content column is not even read
+        queries = [query['sql'] for query in queries if '"blog_' in query['sql']]
+        self.assertEqual(1, len(queries))
+        self.assertNotIn('"content"', queries[0])
+
+        response = self.client.get('/api/article?fields=title,password')
+        self.assertEqual(response.status_code, 400)
+
+    def test_article_get_summary_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article?summary=1&preview=5&limit=2')
+        self.assertEqual(response.status_code, 200)
+
+        results = json.loads(response.content)['results']
+        self.assertEqual(['id', 'title', 'author', 'comment_count', 'last_commented_at', 'preview'], list(results[0]))
+        self.assertEqual([2, 1], [result['comment_count'] for result in results])
+        self.assertEqual(["Hi my", "Hi my"], [result['preview'] for result in results])
+
+        # A new comment changes the summary, so it changes its ETag too
+        etag = response['ETag']
+        self.client.post('/api/article/' + str(self.article2.id) + '/comment', json.dumps({"content": "Hi again"}), content_type='application/json')
+        response = self.client.get('/api/article?summary=1&preview=5&limit=2', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([2, 2], [result['comment_count'] for result in json.loads(response.content)['results']])
+
+        response = self.client.get('/api/article?summary=1&preview=abc')
+        self.assertEqual(response.status_code, 400)
+
     def test_article_post_success(self):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
         response = self.client.post('/api/article', json.dumps({"title": "Hello!", "content": "Alice says hello!", "author": self.user_a_id}), content_type='application/json')
@@ -134,6 +330,102 @@ class BlogTestCase(TestCase):
         self.assertEqual("Hi my name is Alice!", content['content'])
         self.assertEqual(self.user_a_id, content['author'])
 
+    def test_article_id_get_cache_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        self.client.get('/api/article/' + str(self.article1.id))
+
+        # Changes that bypass the views are not seen while the cached response is valid
+        Article.objects.filter(id=self.article1.id).update(title="Changed behind the cache")
+        response = self.client.get('/api/article/' + str(self.article1.id))
+        self.assertEqual("Introducing myself", json.loads(response.content)['title'])
+
+        # A local-memory cache is not invalidated by the writes of other processes: its responses expire instead
+        later = time.time() + settings.BLOG_LOCAL_CACHE_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            response = self.client.get('/api/article/' + str(self.article1.id))
+        self.assertEqual("Changed behind the cache", json.loads(response.content)['title'])
+
+        # Writes through the views invalidate it
+        self.client.put('/api/article/' + str(self.article1.id), json.dumps({"title":"Hello", "content":"Hello My name is Alice."}))
+        response = self.client.get('/api/article/' + str(self.article1.id))
+        self.assertEqual("Hello", json.loads(response.content)['title'])
+
+    def test_article_id_get_cache_replica_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id)
+        title = lambda: json.loads(self.client.get(url).content)['title']
+
+        # What a replica gives is cached when the default database has the same version of the article
+        with mock.patch('blog.views.current_replica', return_value='replica'):
+            self.client.get(url)
+        Article.objects.filter(id=self.article1.id).update(title="Changed behind the cache")
+        self.assertEqual("Introducing myself", title())
+
+        # but not when the replica lags behind it
+        caches['blog'].clear()
+        use_primary = blog.views.use_primary
+
+        def written_meanwhile():
+            Article.objects.filter(id=self.article1.id).update(version=F('version') + 1)
+            return use_primary()
+
+        with mock.patch('blog.views.current_replica', return_value='replica'), mock.patch('blog.views.use_primary', written_meanwhile):
+            self.assertEqual("Changed behind the cache", title())
+        Article.objects.filter(id=self.article1.id).update(title="Read again")
+        self.assertEqual("Read again", title())
+
+    def test_article_id_get_conditional_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article/' + str(self.article1.id))
+        etag = response['ETag']
+
+        response = self.client.get('/api/article/' + str(self.article1.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Also answered without the cached response
+        caches['blog'].clear()
+        response = self.client.get('/api/article/' + str(self.article1.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put('/api/article/' + str(self.article1.id), json.dumps({"title":"Hello", "content":"Hello My name is Alice."}))
+        response = self.client.get('/api/article/' + str(self.article1.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual("Hello", json.loads(response.content)['title'])
+
+    def test_article_id_get_last_modified_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id)
+
+        # No Last-Modified while the last change is in the current second
+        with mock.patch('blog.conditional.time') as clock:
+            clock.time.return_value = self.article1.updated_at.timestamp()
+            self.assertNotIn('Last-Modified', self.client.get(url))
+
+            # and the cached response gets it once that second is over
+            clock.time.return_value = self.article1.updated_at.timestamp() + 1
+            self.assertIn('Last-Modified', self.client.get(url))
+
+        Article.objects.filter(id=self.article1.id).update(updated_at=timezone.now() - datetime.timedelta(seconds=10))
+        caches['blog'].clear()
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.client.put(url, json.dumps({"title":"Hello", "content":"Hello My name is Alice."}))
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+    def test_article_id_get_fields_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id)
+        self.client.get(url)
+
+        # Each projection is cached apart from the full article
+        response = self.client.get(url + '?fields=title')
+        self.assertEqual({"title": "Introducing myself"}, json.loads(response.content))
+        self.assertEqual(["id", "title", "content", "author"], list(json.loads(self.client.get(url).content)))
+
+        response = self.client.get(url + '?fields=')
+        self.assertEqual(response.status_code, 400)
+
     def test_article_id_get_nonexist_failure(self):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
         response = self.client.get('/api/article/0')
@@ -149,6 +441,20 @@ class BlogTestCase(TestCase):
         self.assertEqual("Hello My name is Alice.", content['content'])
         self.assertEqual(self.user_a_id, content['author'])
 
+    def test_article_id_put_single_statement_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put('/api/article/' + str(self.article1.id), json.dumps({"title":"Hello", "content":"Hello My name is Alice."}))
+        self.assertEqual(response.status_code, 200)
+
+        # A single conditional UPDATE, without reading the article first
+        queries = [query['sql'] for query in queries if '"blog_' in query['sql']]
+        self.assertEqual(1, len(queries))
+        self.assertTrue(queries[0].startswith('UPDATE'))
+
+        article = Article.objects.get(id=self.article1.id)
+        self.assertEqual(("Hello", "Hello My name is Alice.", 2), (article.title, article.content, article.version))
+
     def test_article_id_put_nonexist_failure(self):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
         response = self.client.put('/api/article/100', json.dumps({"title":"Hi!", "content":"Hello! My name is Alice!", "author":self.user_a_id}))
@@ -164,6 +470,12 @@ class BlogTestCase(TestCase):
         response = self.client.delete('/api/article/' + str(self.article3.id))
         self.assertEqual(response.status_code, 200)
 
+    def test_article_id_delete_cascade_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.delete('/api/article/' + str(self.article1.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Comment.objects.filter(article_id=self.article1.id).exists())
+
     def test_article_id_delete_nonexist_failure(self):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
         response = self.client.delete('/api/article/100')
@@ -188,6 +500,33 @@ class BlogTestCase(TestCase):
         self.assertEqual("I'm Bobby, nice to meet you Alice!", content['content'])
         self.assertEqual(self.user_b_id, content['author'])
 
+    def test_comment_id_get_conditional_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        etag = self.client.get('/api/comment/' + str(self.comment3.id))['ETag']
+
+        response = self.client.get('/api/comment/' + str(self.comment3.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put('/api/comment/' + str(self.comment3.id), json.dumps({"content": "Edited comment"}))
+        response = self.client.get('/api/comment/' + str(self.comment3.id), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_comment_fields_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/comment/' + str(self.comment1.id) + '?fields=article,author')
+        self.assertEqual({"article": self.article1.id, "author": self.user_b_id}, json.loads(response.content))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/article/' + str(self.article1.id) + '/comment?fields=id,author')
+        self.assertEqual([{"id": self.comment1.id, "author": self.user_b_id}, {"id": self.comment3.id, "author": self.user_a_id}], json.loads(response.content)['results'])
+        self.assertFalse(any('"content"' in query['sql'] for query in queries if '"blog_' in query['sql']))
+
+        response = self.client.get('/api/article/' + str(self.article1.id) + '/comment?fields=id&stream=1')
+        self.assertEqual([{"id": self.comment1.id}, {"id": self.comment3.id}], json.loads(b''.join(response.streaming_content)))
+
+        response = self.client.get('/api/comment/' + str(self.comment1.id) + '?fields=version')
+        self.assertEqual(response.status_code, 400)
+
     def test_comment_id_get_nonexist_failure(self):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
         response = self.client.get('/api/comment/0')
@@ -203,6 +542,11 @@ class BlogTestCase(TestCase):
         self.assertEqual("My name is Alice.", content['content'])
         self.assertEqual(self.user_a_id, content['author'])
 
+    def test_comment_id_put_nonexist_failure(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.put('/api/comment/100', json.dumps({"content":"Hello"}))
+        self.assertEqual(response.status_code, 404)
+
     def test_comment_id_put_failure(self):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
         response = self.client.put('/api/comment/' + str(self.comment1.id), json.dumps({"article":self.article1.id, "content":"I'm Bobby, glad to see you Alice!", "author":self.user_b_id}))
@@ -222,6 +566,7 @@ class BlogTestCase(TestCase):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
         response = self.client.delete('/api/comment/' + str(self.comment1.id))
         self.assertEqual(response.status_code, 403)
+        self.assertTrue(Comment.objects.filter(id=self.comment1.id).exists())
 
 
 
@@ -236,8 +581,106 @@ class BlogTestCase(TestCase):
             model_to_dict(self.comment3, fields=['article','content','author'])]
 
         content = json.loads(response.content)
-        for comment in comments:
-            self.assertIn(comment, content)
+        self.assertEqual(comments, content['results'])
+        self.assertEqual(None, content['next'])
+        self.assertEqual(2, content['count'])
+
+    def test_article_id_comment_get_page_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id) + '/comment'
+        for i in range(3):
+            self.client.post(url, json.dumps({"content": "Comment %d" % i}), content_type='application/json')
+        contents = [self.comment1.content, self.comment3.content] + ["Comment %d" % i for i in range(3)]
+
+        for order, expected in (('oldest', contents), ('newest', contents[::-1])):
+            pages = []
+            content = json.loads(self.client.get(url + '?order=%s&limit=2' % order).content)
+            pages.append([comment['content'] for comment in content['results']])
+            while content['next'] is not None:
+                self.assertEqual(5, content['count'])
+                content = json.loads(self.client.get(url + '?order=%s&limit=2&after=%d' % (order, content['next'])).content)
+                pages.append([comment['content'] for comment in content['results']])
+            self.assertEqual([expected[0:2], expected[2:4], expected[4:]], pages)
+
+        # Past the last comment, the page is empty but the article is still found
+        response = self.client.get(url + '?after=%d' % (self.comment3.id + 100))
+        self.assertEqual({"results": [], "next": None, "count": 5}, json.loads(response.content))
+
+        lines = b''.join(self.client.get(url + '?format=ndjson&order=newest&after=%d' % self.comment3.id).streaming_content).decode().splitlines()
+        self.assertEqual([self.comment1.content], [json.loads(line)['content'] for line in lines])
+
+    def test_article_id_comment_get_page_failure(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id) + '/comment'
+        self.assertEqual(400, self.client.get(url + '?order=random').status_code)
+        self.assertEqual(400, self.client.get(url + '?limit=0').status_code)
+        self.assertEqual(400, self.client.get(url + '?after=-1').status_code)
+        self.assertEqual(404, self.client.get('/api/article/100/comment?after=1').status_code)
+
+    def test_article_id_comment_get_stream_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article/' + str(self.article1.id) + '/comment?format=ndjson')
+        self.assertEqual(response.status_code, 200)
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([self.comment1.content, self.comment3.content], [json.loads(line)['content'] for line in lines])
+
+        response = self.client.get('/api/article/100/comment?stream=1')
+        self.assertEqual(response.status_code, 404)
+
+    def test_article_id_comment_get_cache_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id) + '/comment'
+        self.client.get(url)
+
+        self.client.post(url, json.dumps({"content": "Another comment"}), content_type='application/json')
+        self.assertEqual(3, len(json.loads(self.client.get(url).content)['results']))
+        self.assertEqual(3, json.loads(self.client.get(url).content)['count'])
+
+        self.client.put('/api/comment/' + str(self.comment3.id), json.dumps({"content": "Edited comment"}))
+        self.assertIn("Edited comment", [comment['content'] for comment in json.loads(self.client.get(url).content)['results']])
+
+        self.client.delete('/api/comment/' + str(self.comment3.id))
+        self.assertEqual(2, len(json.loads(self.client.get(url).content)['results']))
+        self.assertEqual(2, json.loads(self.client.get(url + '?order=newest').content)['count'])
+
+    def test_article_id_comment_get_conditional_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article1.id) + '/comment'
+        etag = self.client.get(url)['ETag']
+
+        caches['blog'].clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.delete('/api/comment/' + str(self.comment3.id))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(200, self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)).status_code)
+
+        response = self.client.get('/api/article/100/comment', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
+
+    def test_article_id_comment_single_query_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article3.id) + '/comment'
+
+        # An article without comments is told apart from a missing one
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({"results": [], "next": None, "count": 0}, json.loads(response.content))
+
+        # Only the queries on the blog tables: the session and user lookups are not counted
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, json.dumps({"content": "First!"}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        # The guarded INSERT and the comment count UPDATE, without looking the article up first
+        self.assertEqual(['INSERT', 'UPDATE'], [query['sql'].split()[0] for query in queries if '"blog_' in query['sql']])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(["First!"], [comment['content'] for comment in json.loads(response.content)['results']])
+        self.assertEqual(1, len([query for query in queries if '"blog_' in query['sql']]))
 
     def test_article_id_comment_get_nonexist_failure(self):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
@@ -263,3 +706,719 @@ class BlogTestCase(TestCase):
         self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
         response = self.client.delete('/api/article/' + str(self.article1.id) + '/comment')
         self.assertEqual(response.status_code, 405)
+
+
+
+    ### /api/article/search
+
+    def test_article_search_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article/search?q=name')
+        self.assertEqual(response.status_code, 200)
+
+        content = json.loads(response.content)
+        self.assertEqual({self.article1.id, self.article2.id}, {article['id'] for article in content['results']})
+        self.assertIn("[name]", content['results'][0]['snippet'])
+
+        # Paging through the results gives each of them once
+        first = json.loads(self.client.get('/api/article/search?q=name&limit=1').content)
+        second = json.loads(self.client.get('/api/article/search?q=name&limit=1&after=' + first['next']).content)
+        self.assertEqual([article['id'] for article in content['results']], [first['results'][0]['id'], second['results'][0]['id']])
+        self.assertIsNone(second['next'])
+
+    def test_article_search_sync_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        self.client.put('/api/article/' + str(self.article1.id), json.dumps({"title":"Hello", "content":"Greetings from Wonderland"}))
+        self.client.delete('/api/article/' + str(self.article3.id))
+        self.client.post('/api/article/bulk', json.dumps([{"title": "Wonderland", "content": "Down the rabbit hole"}]), content_type='application/json')
+
+        search = lambda q: [article['title'] for article in json.loads(self.client.get('/api/article/search?q=' + q).content)['results']]
+        self.assertEqual(["Wonderland", "Hello"], search("wonderland"))
+        self.assertEqual(["Introducing myself"], search("bobby"))
+        self.assertEqual([], search("deleted"))
+        self.assertEqual(["Wonderland"], search("rab*"))
+
+    def test_article_search_without_functions_success(self):
+        # A connection without the blog's SQL functions (e.g. the sqlite3 shell) can still write the articles
+        connection.ensure_connection()
+        connection.connection.create_function('blog_decompress', -1, None)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE blog_article SET title = 'Edited in the shell' WHERE id = %s", [self.article1.id])
+                cursor.execute("DELETE FROM blog_article WHERE id = %s", [self.article3.id])
+        finally:
+            register_functions(connection)
+
+        # and the next write of the application indexes them
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        search = lambda q: [article['id'] for article in json.loads(self.client.get('/api/article/search?q=' + q).content)['results']]
+        self.assertEqual([], search("shell"))
+        self.client.post('/api/article', json.dumps({"title":"Hello", "content":"Greetings from Wonderland"}), content_type='application/json')
+        self.assertEqual([self.article1.id], search("shell"))
+        self.assertEqual([], search("deleted"))
+
+    def test_article_search_failure(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article/search')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/article/search?q=name&after=abc')
+        self.assertEqual(response.status_code, 400)
+
+
+
+    ### Bulk endpoints
+
+    def test_article_bulk_post_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        items = [{"title": "First", "content": "1"}, {"title": "Second"}, {"title": "Third", "content": "3"}]
+        response = self.client.post('/api/article/bulk', json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+
+        results = json.loads(response.content)
+        self.assertIn('error', results[1])
+        self.assertEqual(["First", "Third"], [Article.objects.get(id=results[i]['id']).title for i in (0, 2)])
+        self.assertEqual(self.user_a_id, Article.objects.get(id=results[2]['id']).author_id)
+
+    def test_article_bulk_post_failure(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.post('/api/article/bulk', json.dumps({"title": "First", "content": "1"}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_article_bulk_delete_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        ids = [self.article3.id, self.article2.id, 100]
+        response = self.client.delete('/api/article/bulk', json.dumps({"ids": ids}))
+        self.assertEqual(response.status_code, 200)
+
+        results = json.loads(response.content)
+        self.assertEqual(ids, [result['id'] for result in results])
+        self.assertEqual([False, True, True], ['error' in result for result in results])
+        self.assertEqual([self.article2.id], list(Article.objects.filter(id__in=ids).values_list('id', flat=True)))
+
+    def test_article_id_comment_bulk_post_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article2.id) + '/comment'
+        self.client.get(url)
+
+        body = '{"content": "one"}\nnot json\n{"content": "two"}\n'
+        response = self.client.post(url + '/bulk', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+
+        results = json.loads(response.content)
+        self.assertEqual([False, True, False], ['error' in result for result in results])
+        self.assertEqual("two", Comment.objects.get(id=results[2]['id']).content)
+
+        # The cached comments are invalidated
+        content = json.loads(self.client.get(url).content)
+        self.assertEqual(3, len(content['results']))
+        self.assertEqual(3, content['count'])
+
+    def test_article_id_comment_bulk_post_nonexist_failure(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.post('/api/article/100/comment/bulk', json.dumps([{"content": "one"}]), content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    def test_comment_bulk_delete_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.delete('/api/comment/bulk', json.dumps([self.comment1.id, self.comment2.id, self.comment3.id]))
+        self.assertEqual(response.status_code, 200)
+
+        results = json.loads(response.content)
+        self.assertEqual([True, False, False], ['error' in result for result in results])
+        self.assertEqual([self.comment1.id], list(Comment.objects.values_list('id', flat=True)))
+
+    def test_comment_count_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/' + str(self.article3.id) + '/comment'
+        count = lambda: Article.objects.values_list('comment_count', 'last_commented_at').get(id=self.article3.id)
+
+        self.assertEqual((0, None), count())
+        response = self.client.post(url, json.dumps({"content": "one"}), content_type='application/json')
+        self.assertEqual(1, count()[0])
+        self.assertIsNotNone(count()[1])
+
+        results = json.loads(self.client.post(url + '/bulk', json.dumps([{"content": "two"}, {}, {"content": "three"}]), content_type='application/json').content)
+        self.assertEqual(3, count()[0])
+
+        self.client.delete('/api/comment/' + str(json.loads(response.content)['id']))
+        self.assertEqual(2, count()[0])
+
+        # Only Alice's comments are deleted, each from its own article's count
+        self.client.delete('/api/comment/bulk', json.dumps([results[0]['id'], self.comment1.id, self.comment3.id]))
+        self.assertEqual(1, count()[0])
+        self.assertEqual(1, Article.objects.get(id=self.article1.id).comment_count)
+
+        # Comments saved without being counted do not take the count below 0
+        uncounted = [Comment.objects.create(article=self.article3, content="Uncounted", author_id=self.user_a_id) for _ in range(3)]
+        Article.objects.filter(id=self.article3.id).update(comment_count=0)
+        self.assertEqual(200, self.client.delete('/api/comment/' + str(uncounted[0].id)).status_code)
+        self.assertEqual(200, self.client.delete('/api/comment/bulk', json.dumps([comment.id for comment in uncounted[1:]])).status_code)
+        self.assertEqual(0, count()[0])
+
+
+
+    ### JSON encoding
+
+    def test_serializers_success(self):
+
+        fields = ['id', 'title', 'content', 'author', 'last_commented_at']
+        rows = [(1, 'Quote " and \\ slash /', 'caf\u00e9 \U0001f600 \x7f \x00\n\t', 2, None), (3, 'A', 'B', 4, timezone.now())]
+        expected = json.dumps([dict(zip(fields, row)) for row in rows], cls=DjangoJSONEncoder)
+        self.assertEqual(expected, get_encoder(Article, fields).encode_list(rows))
+        self.assertEqual(expected, get_encoder(None, fields).encode_list(rows))
+        self.assertEqual('{"results": [], "next": 5}', get_encoder(Article, fields).encode_page([], 5))
+
+        # The responses are the same bytes as JsonResponse gave
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article?limit=2')
+        articles = list(Article.objects.order_by('id').values('title', 'content', 'author')[:2])
+        self.assertEqual(JsonResponse({"results": articles, "next": self.article2.id}).content, response.content)
+
+
+
+    ### ASGI
+
+    def test_asgi_success(self):
+        def request(method, path, headers=(), body=b''):
+            messages = []
+            received = [{'type': 'http.request', 'body': body}]
+
+            async def receive():
+                return received.pop(0)
+
+            async def send(message):
+                messages.append(message)
+
+            scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': list(headers), 'server': ('testserver', 80)}
+            asyncio.run(application(scope, receive, send))
+            return messages
+
+        messages = request('GET', '/api/token')
+        self.assertEqual(204, messages[0]['status'])
+        cookie = dict(messages[0]['headers'])[b'set-cookie'].split(b';')[0]
+
+        # The body and the headers reach the view (which rejects the body)
+        headers = [(b'cookie', cookie), (b'x-csrftoken', cookie.split(b'=')[1]), (b'content-type', b'application/json')]
+        messages = request('POST', '/api/signup', headers, b'not json')
+        self.assertEqual(400, messages[0]['status'])
+
+
+
+    ### Comment events
+
+    def test_comment_events_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article/%d/comment/events' % self.article1.id)
+        self.assertEqual('text/event-stream', response['Content-Type'])
+        events = iter(response.streaming_content)
+        self.assertEqual(b'retry: 3000\n\n', next(events))
+
+        content = json.loads(self.client.post('/api/article/%d/comment' % self.article1.id, json.dumps({"content":"Pushed"}), content_type='application/json').content)
+        self.assertEqual(b'event: created\ndata: ' + json.dumps(content).encode() + b'\n\n', next(events))
+        self.client.put('/api/comment/%d' % content['id'], json.dumps({"content":"Edited"}), content_type='application/json')
+        self.assertEqual(b'event: updated\ndata: ' + json.dumps(dict(content, content="Edited")).encode() + b'\n\n', next(events))
+        self.client.delete('/api/comment/%d' % content['id'])
+        self.assertEqual(b'event: deleted\ndata: ' + json.dumps({"id": content['id'], "article": self.article1.id}).encode() + b'\n\n', next(events))
+
+        # Comments of other articles are not pushed, and bulk writes tell to reload
+        self.client.post('/api/article/%d/comment' % self.article2.id, json.dumps({"content":"Elsewhere"}), content_type='application/json')
+        self.client.post('/api/article/%d/comment/bulk' % self.article1.id, json.dumps([{"content":"Bulk"}]), content_type='application/json')
+        self.assertEqual(b'event: reload\ndata: null\n\n', next(events))
+
+        response.close()
+        self.assertEqual({}, dict(get_broker().channels))
+
+    def test_comment_events_failure(self):
+        self.assertEqual(302, self.client.get('/api/article/%d/comment/events' % self.article1.id).status_code)
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        self.assertEqual(404, self.client.get('/api/article/1000/comment/events').status_code)
+        self.assertEqual(405, self.client.post('/api/article/%d/comment/events' % self.article1.id).status_code)
+
+    @override_settings(BLOG_CONCURRENCY_LIMITS={('article_id_comment_events', 'GET'): (1, 0, 0)})
+    def test_comment_events_limit_failure(self):
+        client = Client()
+        client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        url = '/api/article/%d/comment/events' % self.article1.id
+
+        # Under WSGI, an open stream holds its slot until it is closed
+        response = client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(503, client.get(url).status_code)
+        response.close()
+        response = client.get(url)
+        self.assertEqual(200, response.status_code)
+        response.close()
+
+        # Under myblog/asgi.py, it holds none
+        streams = [client.get(url, **{'blog.asgi': True}) for _ in range(2)]
+        self.assertEqual([200, 200], [stream.status_code for stream in streams])
+        for stream in streams:
+            stream.close()
+
+    def test_comment_events_asgi_success(self):
+        # The stream is sent from the event loop until the client disconnects, and then closed
+        broker = LocalBroker()
+        response = EventStreamResponse(broker.subscribe('channel'))
+        events_application = WsgiToAsgi(lambda environ, start_response: start_response('200 OK', list(response.items())) or response, 1)
+        messages = []
+
+        async def run():
+            disconnect = asyncio.Event()
+            received = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if received:
+                    return received.pop(0)
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if len(messages) == 2:
+                    broker.publish('channel', 'created', {"id": 1})
+                elif len(messages) == 3:
+                    disconnect.set()
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'headers': [], 'server': ('testserver', 80)}
+            await events_application(scope, receive, send)
+
+        asyncio.run(run())
+        events_application.executor.shutdown()
+        self.assertEqual(200, messages[0]['status'])
+        self.assertEqual(b'event: created\ndata: {"id": 1}\n\n', messages[2]['body'])
+        self.assertEqual({}, dict(broker.channels))
+
+    def test_socket_broker_success(self):
+        directory = tempfile.mkdtemp()
+        try:
+            broker = SocketBroker(directory)
+            subscription = broker.subscribe('channel')
+            broker.publish('channel', 'created', {"id": 1})
+            self.assertEqual(('created', {"id": 1}), subscription.get(5))
+
+            # The socket of a process that is gone is removed
+            open(os.path.join(directory, '0.sock'), 'w').close()
+            broker.publish('channel', 'deleted', {"id": 1})
+            self.assertEqual(('deleted', {"id": 1}), subscription.get(5))
+            self.assertEqual([os.path.basename(broker.path)], os.listdir(directory))
+
+            # An event too large for a datagram is sent as a reload
+            broker.publish('channel', 'created', {"content": "x" * (1 << 21)})
+            self.assertEqual(('reload', None), subscription.get(5))
+
+            # A malformed message does not stop the events that come after it
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            with self.assertLogs('blog.events', 'ERROR'):
+                sender.sendto(b'not json', broker.path)
+                broker.publish('channel', 'deleted', {"id": 2})
+                self.assertEqual(('deleted', {"id": 2}), subscription.get(5))
+            sender.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+
+    ### Changes
+
+    def test_changes_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/changes')
+        self.assertEqual(200, response.status_code)
+        changes = response.json()
+        self.assertEqual([('article', self.article1.id), ('article', self.article2.id), ('article', self.article3.id),
+                          ('comment', self.comment1.id), ('comment', self.comment2.id), ('comment', self.comment3.id)],
+                         [(change['type'], change['id']) for change in changes['results']])
+        self.assertEqual(model_to_dict(self.comment1, ['id','article','content','author']), changes['results'][3]['data'])
+        self.assertFalse(changes['more'])
+
+        # Only what changed since then is given, once each, with deletions as tombstones
+        since = changes['since']
+        self.client.put('/api/article/%d' % self.article1.id, json.dumps({"title":"Edited", "content":"Once"}), content_type='application/json')
+        self.client.put('/api/article/%d' % self.article1.id, json.dumps({"title":"Edited", "content":"Twice"}), content_type='application/json')
+        self.client.delete('/api/article/%d' % self.article3.id)
+        self.client.delete('/api/comment/%d' % self.comment3.id)
+        changes = self.client.get('/api/changes?since=%d&limit=2' % since).json()
+        self.assertEqual([{"seq": changes['results'][0]['seq'], "type": "article", "id": self.article1.id, "deleted": False,
+                           "data": {"id": self.article1.id, "title": "Edited", "content": "Twice", "author": self.user_a_id}},
+                          {"seq": changes['results'][1]['seq'], "type": "article", "id": self.article3.id, "deleted": True, "data": None}],
+                         changes['results'])
+        self.assertTrue(changes['more'])
+        changes = self.client.get('/api/changes?since=%d' % changes['since']).json()
+        self.assertEqual([('comment', self.comment3.id, True)], [(change['type'], change['id'], change['deleted']) for change in changes['results']])
+        self.assertEqual(changes['since'], self.client.get('/api/changes?since=%d' % changes['since']).json()['since'])
+
+    def test_changes_failure(self):
+        self.assertEqual(302, self.client.get('/api/changes').status_code)
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        self.assertEqual(400, self.client.get('/api/changes?since=-1').status_code)
+        self.assertEqual(400, self.client.get('/api/changes?since=x').status_code)
+        self.assertEqual(405, self.client.post('/api/changes').status_code)
+
+
+
+    ### Profiling
+
+    def test_profiling_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.get('/api/article')
+        metrics = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertIn('desc=', metrics['db'])
+        self.assertIn('serialize', metrics)
+        self.assertIn('view', metrics)
+        self.assertIn('total', metrics)
+
+        response = self.client.get('/api/metrics')
+        self.assertEqual(200, response.status_code)
+        self.assertIn('blog_request_duration_seconds_count{view="article"}', response.content.decode())
+        self.assertIn('blog_request_duration_seconds_bucket{view="signin",le="+Inf"}', response.content.decode())
+
+
+
+    ### Admission control
+
+    def test_concurrency_limit_success(self):
+        limit = ConcurrencyLimit(1, 1, 5)
+        self.assertTrue(limit.acquire())
+
+        # A second caller waits for the slot, and a third one is turned away
+        acquired = []
+        waiter = threading.Thread(target=lambda: acquired.append(limit.acquire()))
+        waiter.start()
+        while limit.waiting == 0:
+            time.sleep(0.001)
+        self.assertFalse(limit.acquire())
+        limit.release()
+        waiter.join()
+        self.assertEqual([True], acquired)
+        self.assertEqual(1, limit.running)
+
+    @override_settings(BLOG_CONCURRENCY_LIMITS={('article', 'GET'): (0, 0, 0)})
+    def test_concurrency_limit_failure(self):
+        client = Client()
+        client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = client.get('/api/article')
+        self.assertEqual(503, response.status_code)
+        self.assertEqual('1', response['Retry-After'])
+        self.assertEqual(200, client.get('/api/article/%d' % self.article1.id).status_code)
+
+    @override_settings(BLOG_CONCURRENCY_LIMITS={('article', 'GET'): (1, 0, 0)})
+    def test_concurrency_limit_stream_failure(self):
+        client = Client()
+        client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+
+        # A streamed listing holds its slot until it is closed
+        response = client.get('/api/article?stream=1')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(503, client.get('/api/article').status_code)
+        response.close()
+        self.assertEqual(200, client.get('/api/article').status_code)
+
+    def test_write_rate_failure(self):
+        buckets = TokenBuckets(1, 2, 10)
+        self.assertEqual(0, buckets.take('a'))
+        self.assertEqual(0, buckets.take('a'))
+        self.assertGreater(buckets.take('a'), 0)
+        self.assertEqual(0, buckets.take('b'))
+
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        while not get_write_buckets().take('user:%d' % self.user_a_id):
+            pass
+        response = self.client.post('/api/article', json.dumps({"title":"Rate", "content":"Limited"}), content_type='application/json')
+        self.assertEqual(429, response.status_code)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(200, self.client.get('/api/article').status_code)
+
+        # The limit is read on every request, and can be turned off
+        with override_settings(BLOG_WRITE_RATE=None):
+            response = self.client.post('/api/article', json.dumps({"title":"Rate", "content":"Unlimited"}), content_type='application/json')
+        self.assertEqual(201, response.status_code)
+
+
+
+    ### Read replicas
+
+    @override_settings(BLOG_READ_REPLICAS=['replica'])
+    def test_replica_reads_success(self):
+        databases = []
+
+        @replica_reads
+        def view(request):
+            databases.append(router.db_for_read(Article))
+            # Every read of a request goes to the same replica
+            self.assertEqual(databases[-1], router.db_for_read(Comment))
+            return HttpResponse()
+
+        factory = RequestFactory()
+        view(factory.get('/'))
+        response = view(factory.post('/'))
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        # Right after a write, the client reads from the default database
+        request = factory.get('/')
+        request.COOKIES[STICKY_COOKIE] = '1'
+        view(request)
+        self.assertEqual(['replica', 'default', 'default'], databases)
+        self.assertEqual('default', router.db_for_read(Article))
+
+        with override_settings(BLOG_READ_REPLICAS=['replica', 'replica2']):
+            for _ in range(20):
+                view(factory.get('/'))
+
+
+
+    ### SQLite
+
+    def test_sqlite_pragmas_success(self):
+        # journal_mode is left out: the in-memory test database cannot use WAL
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(5000, cursor.fetchone()[0])
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(-64000, cursor.fetchone()[0])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(1, cursor.fetchone()[0])  # NORMAL
+
+
+
+    ### Compression
+
+    def stored_content(self, model, id):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content FROM %s WHERE id = %%s' % model._meta.db_table, [id])
+            return cursor.fetchone()[0]
+
+    def test_compressed_content_success(self):
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        text = "Compressible éléphant words. " * 100
+        article = json.loads(self.client.post('/api/article', json.dumps({"title": "Long", "content": text}), content_type='application/json').content)
+        comment = json.loads(self.client.post('/api/article/%d/comment' % article['id'], json.dumps({"content": text}), content_type='application/json').content)
+
+        # Long contents are stored compressed, short ones plain
+        self.assertEqual(b'z', self.stored_content(Article, article['id'])[:1])
+        self.assertEqual(b'z', self.stored_content(Comment, comment['id'])[:1])
+        self.assertEqual(self.article1.content, self.stored_content(Article, self.article1.id))
+
+        self.assertEqual(text, json.loads(self.client.get('/api/article/%d' % article['id']).content)['content'])
+        self.assertEqual(text, Article.objects.get(id=article['id']).content)
+        self.assertEqual(text, json.loads(self.client.get('/api/article/%d/comment' % article['id']).content)['results'][0]['content'])
+        page = json.loads(self.client.get('/api/article?summary=1&preview=20&after=%d' % self.article3.id).content)
+        self.assertEqual(text[:20], page['results'][0]['preview'])
+        changes = json.loads(self.client.get('/api/changes').content)['results']
+        self.assertEqual(text, [change['data']['content'] for change in changes if change['type'] == 'article' and change['id'] == article['id']][0])
+
+        # The search index has the decompressed words, and the snippets are cut from them
+        results = json.loads(self.client.get('/api/article/search?q=elephant').content)['results']
+        self.assertEqual([article['id']], [result['id'] for result in results])
+        self.assertIn('[éléphant]', results[0]['snippet'])
+
+        self.client.put('/api/article/%d' % article['id'], json.dumps({"title": "Long", "content": "Short now"}))
+        self.assertEqual("Short now", self.stored_content(Article, article['id']))
+        self.assertEqual([], json.loads(self.client.get('/api/article/search?q=elephant').content)['results'])
+
+    def test_decompress_success(self):
+        text = "Ünïcode " * 300
+        self.assertEqual(text, decompress(compress(text)))
+        self.assertEqual(text[:21], decompress(compress(text), 21))
+        self.assertEqual("Short", compress("Short"))
+        self.assertEqual("Sho", decompress("Short", 3))
+        self.assertIsNone(decompress(None, 3))
+        with override_settings(BLOG_COMPRESSION=None):
+            self.assertEqual(text, compress(text))
+
+    def test_compress_contents_success(self):
+        text = "Written before compression. " * 100
+        with override_settings(BLOG_COMPRESSION=None):
+            id = Article.objects.create(title="Old", content=text, author_id=self.user_a_id).id
+        self.assertEqual(text, self.stored_content(Article, id))
+        changes = Change.objects.count()
+
+        call_command('compress_contents', stdout=io.StringIO())
+        self.assertEqual(b'z', self.stored_content(Article, id)[:1])
+        self.assertEqual(text, Article.objects.get(id=id).content)
+        call_command('compress_contents', restore=True, stdout=io.StringIO())
+        self.assertEqual(text, self.stored_content(Article, id))
+
+        # Neither a change nor a new search index entry is made of a rewrite
+        self.assertEqual(changes, Change.objects.count())
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        self.assertEqual([id], [result['id'] for result in json.loads(self.client.get('/api/article/search?q=compression').content)['results']])
+
+
+
+    ### Group commit
+
+    def test_group_commit_batch_success(self):
+        writer = GroupCommitWriter(0.01, 3)
+        items = [(self.article1.id, "First", self.user_a_id), (self.article2.id, "Second", self.user_a_id),
+                 (self.article1.id, "Third", self.user_b_id), (1000, "Nowhere", self.user_a_id)]
+        for item in items:
+            writer.queue.put(PendingWrite(item))
+
+        # At most batch_size comments, in one transaction, counted once per article
+        batch = writer.take_batch()
+        self.assertEqual(items[:3], [pending.item for pending in batch])
+        with CaptureQueriesContext(connection) as queries:
+            writer.write_batch(batch)
+        self.assertEqual(2, len([query for query in queries if query['sql'].startswith('UPDATE')]))
+        self.assertEqual(["First", "Second", "Third"], [pending.result().content for pending in batch])
+        self.assertEqual([4, 2], [Article.objects.get(id=id).comment_count for id in (self.article1.id, self.article2.id)])
+
+        # Within the window, what is queued is taken; a missing article gives no comment
+        batch = writer.take_batch()
+        writer.write_batch(batch)
+        self.assertEqual([None], [pending.result() for pending in batch])
+
+    def test_group_commit_batch_failure(self):
+        # After an error, the comments of the batch are written one by one, and only the failing one fails
+        writer = GroupCommitWriter(0, 10)
+        batch = [PendingWrite((self.article1.id, "Fine", self.user_a_id)), PendingWrite((self.article1.id, None, self.user_a_id))]
+        writer.write_batch(batch)
+        self.assertEqual("Fine", batch[0].result().content)
+        self.assertRaises(IntegrityError, batch[1].result)
+        self.assertEqual(3, Comment.objects.filter(article=self.article1).count())
+        self.assertEqual(3, Article.objects.get(id=self.article1.id).comment_count)
+
+    def test_group_commit_close_success(self):
+        writer = GroupCommitWriter(0, 10)
+        writer.close()
+        thread = writer.thread = threading.Thread(target=writer.run)
+        thread.start()
+        writer.close()
+        self.assertFalse(thread.is_alive())
+
+    @override_settings(BLOG_GROUP_COMMIT=True)
+    def test_group_commit_view_success(self):
+        # The test's transaction is not committed: the view writes the comment itself
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        response = self.client.post('/api/article/%d/comment' % self.article1.id, json.dumps({"content": "Queued"}), content_type='application/json')
+        self.assertEqual(201, response.status_code)
+        self.assertEqual("Queued", Comment.objects.get(id=json.loads(response.content)['id']).content)
+        self.assertEqual(3, Article.objects.get(id=self.article1.id).comment_count)
+        self.assertEqual(404, self.client.post('/api/article/1000/comment', json.dumps({"content": "Queued"}), content_type='application/json').status_code)
+
+
+
+    ### Synthetic data
+
+    def test_generate_success(self):
+        user_ids, article_ids = generate(5, 20, 100)
+        self.assertEqual(5, User.objects.filter(id__in=user_ids).count())
+        self.assertEqual(20, len(article_ids))
+        self.assertEqual(100, Comment.objects.filter(article__in=article_ids).count())
+
+        # The comment counts are those the views would have kept
+        for article_id, comment_count in Article.objects.filter(id__in=article_ids).values_list('id', 'comment_count'):
+            self.assertEqual(Comment.objects.filter(article_id=article_id).count(), comment_count)
+
+        self.client.post('/api/signin', json.dumps({"username":User.objects.get(id=user_ids[0]).username, "password":"password"}), content_type='application/json')
+        self.assertEqual(200, self.client.get('/api/article/%d' % article_ids[0]).status_code)
+
+
+
+    ### Query budgets
+
+    def add_articles_and_comments(self, count):
+        # Articles by Bobby, and comments under article1
+        Article.objects.bulk_create(Article(title="Article %d" % i, content="Content " * 50, author_id=self.user_b_id) for i in range(count))
+        Comment.objects.bulk_create(Comment(article=self.article1, content="Comment %d" % i, author_id=self.user_b_id) for i in range(count))
+        Article.objects.filter(id=self.article1.id).add_comments(count)
+
+    def new_article(self):
+        return Article.objects.create(title="Mine", content="Written by Alice", author_id=self.user_a_id).id
+
+    def new_comment(self):
+        Article.objects.filter(id=self.article1.id).add_comments(1)
+        return Comment.objects.create(article=self.article1, content="Written by Alice", author_id=self.user_a_id).id
+
+    def budget_request(self, name, method, size):
+        """
+        Prepares a request to an endpoint; gives the client to send it with, its path, and its JSON body
+
+        `size` is the number of items of a bulk request
+        """
+
+        signed_in = self.client
+        anonymous = Client()
+        article_id = reverse('article_id', kwargs={'id': self.article1.id})
+        articles = [{"title": "Bulk %d" % i, "content": "Bulk"} for i in range(size)]
+        comments = [{"content": "Bulk %d" % i} for i in range(size)]
+
+        if (name, method) == ('signup', 'POST'):
+            return anonymous, reverse(name), {"username": "user%d" % User.objects.count(), "password": "password"}
+        if name == 'signin':
+            return anonymous, reverse(name), {"username": "alice", "password": "alice1212"}
+        if name == 'signout':
+            anonymous.post(reverse('signin'), json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+            anonymous.get(reverse('article'))
+            return anonymous, reverse(name), None
+        if (name, method) == ('article_bulk', 'POST'):
+            return signed_in, reverse(name), articles
+        if (name, method) == ('article_bulk', 'DELETE'):
+            return signed_in, reverse(name), {"ids": [self.new_article() for _ in range(size)]}
+        if name == 'article_search':
+            return signed_in, reverse(name) + '?q=content', None
+        if name in ('article_id', 'article_id_comment', 'article_id_comment_bulk', 'article_id_comment_events'):
+            id = self.new_article() if method == 'DELETE' else self.article1.id
+            path = reverse(name, kwargs={'id': id})
+            body = comments if name == 'article_id_comment_bulk' else {"content": "Edited"} if name == 'article_id_comment' else {"title": "Edited", "content": "Edited"}
+            return signed_in, path, body if method in ('POST', 'PUT') else None
+        if name == 'comment_bulk':
+            return signed_in, reverse(name), {"ids": [self.new_comment() for _ in range(size)]}
+        if name == 'comment_id':
+            id = self.new_comment() if method == 'DELETE' else self.comment3.id
+            return signed_in, reverse(name, kwargs={'id': id}), {"content": "Edited"} if method == 'PUT' else None
+        return signed_in, reverse(name), {"title": "New", "content": "New"} if method == 'POST' else None
+
+    def measure_budgets(self, size):
+        """
+        Requests every endpoint with a cold response cache; gives the (queries, serialized rows) of each
+        """
+
+        measures = {}
+        for name, method in QUERY_BUDGETS:
+            client, path, body = self.budget_request(name, method, size)
+            caches['blog'].clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = client.generic(method, path, json.dumps(body) if body is not None else '', content_type='application/json')
+                if response['Content-Type'] == 'text/event-stream':
+                    # Never ends by itself
+                    response.close()
+                    content = b''
+                else:
+                    content = b''.join(response.streaming_content) if response.streaming else response.content
+            self.assertLess(response.status_code, 400, (name, method, content))
+
+            data = json.loads(content) if content and response['Content-Type'] == 'application/json' else None
+            rows = len(data['results']) if isinstance(data, dict) and 'results' in data else len(data) if isinstance(data, list) else int(data is not None)
+            measures[name, method] = (len(queries), rows, '\n'.join(query['sql'] for query in queries.captured_queries))
+        return measures
+
+    # Only the queries of the endpoints themselves are counted
+    @cached_sessions
+    def test_query_budgets(self):
+        # Every endpoint has a budget
+        self.assertEqual(set(pattern.name for pattern in urlpatterns), set(name for name, _ in QUERY_BUDGETS))
+
+        self.client.post('/api/signin', json.dumps({"username":"alice", "password":"alice1212"}), content_type='application/json')
+        self.client.get('/api/article')
+        self.add_articles_and_comments(10)
+        small = self.measure_budgets(5)
+        self.add_articles_and_comments(200)
+        large = self.measure_budgets(100)
+
+        for endpoint, (max_queries, max_rows) in QUERY_BUDGETS.items():
+            queries, rows, sql = large[endpoint]
+            self.assertLessEqual(queries, max_queries, "%s %s made %d queries:\n%s" % (endpoint + (queries, sql)))
+            self.assertEqual(small[endpoint][0], queries, "%s %s made more queries with more rows:\n%s" % (endpoint + (sql,)))
+            if max_rows is not None:
+                self.assertLessEqual(rows, max_rows, "%s %s serialized %d rows" % (endpoint + (rows,)))
+
+
+
+    ### Query plans
+
+    def test_check_query_plans_success(self):
+        output = io.StringIO()
+        call_command('check_query_plans', stdout=output)
+        self.assertNotIn("FAIL", output.getvalue())
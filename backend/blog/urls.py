@@ -6,8 +6,15 @@ urlpatterns = [
     path('signin', views.signin, name='signin'),
     path('signout', views.signout, name='signout'),
     path('article', views.article, name='article'),
+    path('article/bulk', views.article_bulk, name='article_bulk'),
+    path('article/search', views.article_search, name='article_search'),
     path('article/<int:id>', views.article_id, name='article_id'),
     path('article/<int:id>/comment', views.article_id_comment, name='article_id_comment'),
+    path('article/<int:id>/comment/bulk', views.article_id_comment_bulk, name='article_id_comment_bulk'),
+    path('article/<int:id>/comment/events', views.article_id_comment_events, name='article_id_comment_events'),
+    path('comment/bulk', views.comment_bulk, name='comment_bulk'),
     path('comment/<int:id>', views.comment_id, name='comment_id'),
+    path('changes', views.changes, name='changes'),
     path('token', views.token, name='token'),
+    path('metrics', views.metrics, name='metrics'),
 ]
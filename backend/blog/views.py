@@ -1,15 +1,88 @@
 import django
 from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseBadRequest, JsonResponse
 from django.contrib.auth.models import User
-from django.forms.models import model_to_dict
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout
 from django.contrib.auth import authenticate
 
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
 from django.views.decorators.csrf import ensure_csrf_cookie
+from .bulk import create_in_chunks, delete_in_chunks, read_ids, read_items
+from .cache import bump_version, get_cached, set_cached
+from .changes import read_changes
+from .compression import Decompress
+from .conditional import has_validators, list_validators, not_modified, object_validators, set_validators
+from .events import EventStreamResponse, publish_comment, subscribe_comments
+from .fields import ARTICLE_FIELDS, COMMENT_FIELDS, fields_key, get_fields
 from .models import Article, Comment
+from .pagination import NEWEST, get_limit, get_order, get_page_params, paginate, split_page
+from .profiling import render_metrics, timed
+from .routers import current_replica, replica_reads, use_primary
+from .search import parse_cursor, search_articles
+from .serializers import get_encoder, row_picker
+from .streaming import CHUNK_SIZE, get_stream_format, stream_rows
+from .writer import save_comment
+import collections
+import itertools
 import json
 
+# Most characters of content given as a preview in the article list
+MAX_PREVIEW = 1000
+
+
+def read_json(request):
+    """
+    Parses the JSON body of a request; raises json.JSONDecodeError when it is malformed
+    """
+
+    with timed('parse'):
+        return json.loads(request.body.decode())
+
+
+
+def cached_get(request, article_id, name, read_validators, build):
+    """
+    Answers a GET with the cached (content, ETag, Last-Modified) of an article's response `name`
+
+    On a cache miss, a conditional request is first checked against read_validators(), which reads
+    no content, and only then is the response made with build() and cached. Both read from the
+    request's replica, and give None when the article does not exist, and so does this function.
+    What a replica gave is only cached when its ETag is the one read_validators() reads from the
+    default database: a lagging replica would otherwise cache stale content under the current
+    version, to be served until the next write.
+    """
+
+    key, cached = get_cached(article_id, name)
+    if cached is None:
+        if has_validators(request):
+            validators = read_validators()
+            if validators is None:
+                return None
+            response = not_modified(request, *validators)
+            if response is not None:
+                return set_validators(response, *validators)
+
+        cached = build()
+        if cached is None:
+            return None
+
+        current = True
+        if current_replica() is not None:
+            with use_primary():
+                validators = read_validators()
+            current = validators is not None and validators[0] == cached[1]
+        if current:
+            set_cached(key, cached)
+
+    content, etag, last_modified = cached
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json', status=200)
+    return set_validators(response, etag, last_modified)
+
+
 
 def signup(request):
     """
@@ -20,7 +93,7 @@ def signup(request):
 
     if request.method == 'POST':
         try:
-            req_data = json.loads(request.body.decode())
+            req_data = read_json(request)
             username = req_data['username']
             password = req_data['password']
 
@@ -45,12 +118,13 @@ def signin(request):
     
     if request.method == 'POST':
         try:
-            req_data = json.loads(request.body.decode())
+            req_data = read_json(request)
             username = req_data['username']
             password = req_data['password']
 
             # Authentication
-            user = authenticate(request,username=username, password=password)
+            with timed('auth'):
+                user = authenticate(request,username=username, password=password)
             if user is not None:
                 login(request, user)
                 return HttpResponse("Successfully signed in!", status=204)          
@@ -86,30 +160,75 @@ def signout(request):
 
 
 @login_required
+@replica_reads
 def article(request):
     """
     When generally requesting for article, the user can GET or POST.
 
-    GET: Responses with a JSON having a dictionary for the target article's title, content, and author
+    GET: Responses with a JSON having one page of articles' title, content, and author, and the cursor of the next page
+         (query string: `limit` for the page size, `after` for the cursor given as `next` by the previous page)
+         With `stream=1` (JSON array) or `format=ndjson` / `Accept: application/x-ndjson` (NDJSON), streams every article after `after` instead
+         With `summary=1`, gives each article's id, title, author, comment_count, and last_commented_at instead of its content,
+         and the first `preview` characters of the content as `preview` if asked
+         With `fields` (e.g. `fields=id,title`), gives only those of id, title, content, author, comment_count, last_commented_at, and preview
     POST: Creates an article with the information given by request JSON body, and responses the created article as a JSON
     """
 
     if request.method == 'GET':
-        # Gets articles and makes them into a list of dictionaries
         articles = Article.objects.all()
-        articles = list(articles.values('title','content','author'))
-        return JsonResponse(articles, safe=False, status=200)
+        default = ['title','content','author']
+        allowed = ARTICLE_FIELDS + ('comment_count','last_commented_at')
+        meta = ['version','updated_at']
+        try:
+            after, limit = get_page_params(request)
+            preview = int(request.GET.get('preview', 0))
+            if preview > 0:
+                articles = articles.annotate(preview=Decompress('content', min(preview, MAX_PREVIEW)))
+                allowed += ('preview',)
+
+            if request.GET.get('summary') in ('1', 'true'):
+                # Renders a list page from the articles alone: the maintained comment counts instead of the comments,
+                # and a truncated preview (cut by the database) instead of the whole content
+                default = ['id','title','author','comment_count','last_commented_at'] + (['preview'] if preview > 0 else [])
+                meta = ['version','updated_at','comment_count','last_commented_at']
+
+            # Only the asked fields are read from the database
+            fields = get_fields(request, allowed, default)
+        except ValueError:
+            # Exception: query string having unexpected format
+            return HttpResponseBadRequest()
+
+        stream_format = get_stream_format(request)
+        if stream_format is not None:
+            # Streams the articles out while they are read, chunk by chunk
+            articles = articles.filter(id__gt=after).order_by('id')
+            return stream_rows(articles.values_list(*fields), stream_format, get_encoder(Article, fields).encode)
+
+        if has_validators(request):
+            # Answers polling clients from the versions of the page alone, without reading any content
+            _, rows, next_cursor = paginate(articles, after, limit, [], meta)
+            validators = list_validators(rows, next_cursor)
+            response = not_modified(request, *validators)
+            if response is not None:
+                return set_validators(response, *validators)
+
+        # Gets one page of articles and encodes them into a JSON list
+        page, rows, next_cursor = paginate(articles, after, limit, fields, meta)
+        content = get_encoder(Article, fields).encode_page(page, next_cursor)
+        response = HttpResponse(content, content_type='application/json', status=200)
+        return set_validators(response, *list_validators(rows, next_cursor))
     
     elif request.method == 'POST':
         try:
-            req_data = json.loads(request.body.decode())
+            req_data = read_json(request)
             title = req_data['title']
             content = req_data['content']
 
             # Makes an Article object and saves it in the database
             article = Article(title=title, content=content, author=request.user)
             article.save()
-            return HttpResponse(json.dumps(model_to_dict(article)), status=201)
+            article = (article.id, article.title, article.content, article.author_id)
+            return HttpResponse(get_encoder(None, ARTICLE_FIELDS).encode(article), content_type='application/json', status=201)
         
         except (KeyError, json.JSONDecodeError):
             # Exception: req_data having unexpected format
@@ -121,70 +240,112 @@ def article(request):
 
 
 @login_required
+def article_search(request):
+    """
+    Searches the articles' titles and contents.
+
+    GET: Responses with a JSON having one page of the articles matching all words of `q` (best match first), with their id, title,
+         author and a snippet of the content around the matches, and the cursor of the next page
+         (query string: `q` for the words, `limit` for the page size, `after` for the cursor given as `next` by the previous page)
+    """
+
+    if request.method == 'GET':
+        try:
+            q = request.GET['q']
+            limit = get_limit(request)
+            after = parse_cursor(request.GET['after']) if 'after' in request.GET else None
+        except (KeyError, ValueError):
+            # Exception: query string having unexpected format
+            return HttpResponseBadRequest()
+
+        articles, next_cursor = search_articles(q, after, limit)
+        return JsonResponse({"results": articles, "next": next_cursor}, status=200)
+
+    else:
+        return HttpResponseNotAllowed(['GET'])
+
+
+
+@login_required
+@replica_reads
 def article_id(request, id):
     """
     When specified an article id in the url, the user can GET, PUT, or DELETE.
 
-    GET: Responses with a JSON having a dictionary for the target article's title, content, and author
+    GET: Responses with a JSON having a dictionary for the target article's id, title, content, and author
+         (or only some of them with `fields`, e.g. `fields=id,title`)
     PUT: Update the target article with the information given by request JSON body, and responses the updated article as a JSON
     DELETE: Deletes the target article, including the comments written under the article
     """
 
     if request.method == 'GET':
         try:
-            # Gets targeted article, and changes it to a dictionary
-            article = Article.objects.get(id=id)
-            return JsonResponse(model_to_dict(article), status=200)
-        
-        except Article.DoesNotExist:
+            fields = get_fields(request, ARTICLE_FIELDS, ARTICLE_FIELDS)
+        except ValueError:
+            # Exception: query string having unexpected format
+            return HttpResponseBadRequest()
+
+        def read_validators():
+            validators = Article.objects.filter(id=id).values_list('id','version','updated_at').first()
+            return validators and object_validators(*validators)
+
+        def build():
+            # Gets the asked fields of the targeted article (and its validators), and encodes them into a JSON dictionary
+            row = Article.objects.filter(id=id).values_list(*fields, 'version', 'updated_at').first()
+            if row is None:
+                return None
+            validators = object_validators(id, *row[-2:])
+            return (get_encoder(Article, fields).encode(row[:-2]),) + validators
+
+        # Serves the article from the cache; the database is only read on a miss
+        response = cached_get(request, id, fields_key('article', fields, ARTICLE_FIELDS), read_validators, build)
+        if response is None:
             # Exception: The targeted article with the id not existing
             return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+        return response
     
     elif request.method == 'PUT':
         try:
-            req_data = json.loads(request.body.decode())
+            req_data = read_json(request)
             title = req_data['title']
             content = req_data['content']
 
-            # Gets targeted article
-            article = Article.objects.get(id=id)
-            
-            if article.author == request.user:
-                article.title = title
-                article.content = content
-                article.save()
-                return HttpResponse(json.dumps(model_to_dict(article)), status=200)
-            else:
-                return JsonResponse({"error": "Cannot PUT because you do not have access to article with id " + str(id)}, status=403)
-        
-        except Article.DoesNotExist:
-            # Exception: The targeted article with the id not existing
-            return JsonResponse({"error": "Cannot PUT because article with id " + str(id) + " does not exist"}, status=404)
+            # Updates the targeted article in a single statement, only if it is written by the user
+            # (the row is not read first, and the columns that are not changed are not rewritten)
+            updated = Article.objects.filter(id=id, author=request.user).update(
+                title=title, content=content, version=F('version') + 1, updated_at=timezone.now())
+
+            if updated == 0:
+                if Article.objects.filter(id=id).exists():
+                    return JsonResponse({"error": "Cannot PUT because you do not have access to article with id " + str(id)}, status=403)
+                else:
+                    # Exception: The targeted article with the id not existing
+                    return JsonResponse({"error": "Cannot PUT because article with id " + str(id) + " does not exist"}, status=404)
+
+            bump_version(id)
+            article = (id, title, content, request.user.id)
+            return HttpResponse(get_encoder(None, ARTICLE_FIELDS).encode(article), content_type='application/json', status=200)
         
         except (KeyError, json.JSONDecodeError):
             # Exception: req_data having unexpected format
             return HttpResponseBadRequest()
     
     elif request.method == 'DELETE':
-        try:
-            # Gets targeted article
-            article = Article.objects.get(id=id)
-
-            if article.author == request.user:
-                # Article deletion causes Comment to be automatically deleted 
-                # (because for Comment Article is a ForeignKey that is on_delete CASCADE)
-                article.delete()
-                return HttpResponse(status=200)      
-            else:
+        # Deletes the targeted article only if it is written by the user; only its id is read, not its content
+        # Article deletion causes Comment to be automatically deleted 
+        # (because for Comment Article is a ForeignKey that is on_delete CASCADE)
+        deleted, _ = Article.objects.filter(id=id, author=request.user).only('id').delete()
+
+        if deleted == 0:
+            if Article.objects.filter(id=id).exists():
                 return JsonResponse({"error": "Cannot DELETE because you do not have access to article with id " + str(id)}, status=403)
-        
-        except Article.DoesNotExist:
-            # Exception: The targeted article with the id not existing
-            return JsonResponse({"error":"Article with such id does not exist"}, status=404)
-        
-        except (KeyError, json.JSONDecodeError):
-            # Exception: req_data having unexpected format
-            return HttpResponseBadRequest()
+            else:
+                # Exception: The targeted article with the id not existing
+                return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+
+        bump_version(id)
+        publish_comment(id, 'reload')
+        return HttpResponse(status=200)
     
     else:
         return HttpResponseNotAllowed(['GET','POST','DELETE'])
@@ -192,44 +353,101 @@ def article_id(request, id):
 
 
 @login_required
+@replica_reads
 def article_id_comment(request, id):
     """
     When generally requesting for comment of a specified article id in the url, the user can GET or POST.
 
-    GET: Responses with a JSON having a list of dictionaries for each comment's article, content, and author
+    GET: Responses with a JSON having one page of the comments' article, content, and author, the cursor of the next page,
+         and the article's comment count (query string: `limit` for the page size, `after` for the cursor given as `next`
+         by the previous page, `order=oldest` (the default) or `order=newest` for the newest comments first)
+         (or only some of id, article, content, and author with `fields`, e.g. `fields=id,author`)
+         With `stream=1` (JSON array) or `format=ndjson` / `Accept: application/x-ndjson` (NDJSON), streams every comment after `after` instead
     POST: Creates a comment with the information given by request JSON body, and responses the created comment as a JSON
     """
 
     if request.method == "GET":
+        default = ['article','content','author']
         try:
-            # Gets targeted article
-            article = Article.objects.get(id=id)
+            fields = get_fields(request, COMMENT_FIELDS, default)
+            after, limit = get_page_params(request)
+            order = get_order(request)
+        except ValueError:
+            # Exception: query string having unexpected format
+            return HttpResponseBadRequest()
 
-            # Gets comments that are written under the targeted article and makes them into a list of dictionaries
-            comments = Comment.objects.filter(article=article)
-            comments = list(comments.values('article','content','author'))
-            return JsonResponse(comments, safe=False, status=200)
-        
-        except Article.DoesNotExist:
+        # Only the asked columns are read (and the id, which tells whether there is a comment at all)
+        columns = list(dict.fromkeys(['id'] + fields))
+        to_row = row_picker(columns, fields)
+        encoder = get_encoder(Comment, fields)
+
+        stream_format = get_stream_format(request)
+        # The article and its comments are read in one query (see ArticleQuerySet.comment_values):
+        # no row means there is no such article, and a row of Nones means it has no comments
+        articles = Article.objects.filter(id=id)
+
+        if stream_format is not None:
+            rows = articles.comment_values(*columns, after=after, newest=order == NEWEST).iterator(chunk_size=CHUNK_SIZE)
+            first = next(rows, None)
+            if first is None:
+                # Exception: The targeted article with the id not existing
+                return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+
+            # Streams the comments out while they are read, chunk by chunk
+            rows = itertools.chain([first], rows)
+            comments = (to_row(row) for row in rows if row[0] is not None)
+            return stream_rows(comments, stream_format, encoder.encode)
+
+        def read_page(*names):
+            # Reads the article's comment count and one page of its comments (one row more, to know whether there is a next page)
+            rows = list(articles.comment_values(*names, after=after, newest=order == NEWEST, article_fields=['comment_count'])[:limit + 1])
+            if not rows:
+                return None
+            count = rows[0][0]
+            rows, next_cursor = split_page([row[1:] for row in rows if row[1] is not None], limit)
+            return rows, next_cursor, count
+
+        def read_validators():
+            page = read_page('id','version','updated_at')
+            if page is None:
+                return None
+            rows, next_cursor, count = page
+            return list_validators(rows, next_cursor, count)
+
+        def build():
+            # Gets one page of comments that are written under the targeted article and encodes them into a JSON page
+            page = read_page(*columns, 'version', 'updated_at')
+            if page is None:
+                return None
+            rows, next_cursor, count = page
+            validators = list_validators([(row[0],) + row[-2:] for row in rows], next_cursor, count)
+            return (encoder.encode_page(map(to_row, rows), next_cursor, count=count),) + validators
+
+        # Serves the page from the cache; the database is only read on a miss
+        name = '%s:%s:%d:%d' % (fields_key('comments', fields, default), order, after, limit)
+        response = cached_get(request, id, name, read_validators, build)
+        if response is None:
             # Exception: The targeted article with the id not existing
             return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+        return response
     
     elif request.method == "POST":
         try:
-            req_data = json.loads(request.body.decode())
+            req_data = read_json(request)
             content = req_data['content']
 
-            # Gets targeted article
-            article = Article.objects.get(id=id)
+            # Saves the comment in the database, unless the targeted article does not exist, and counts it in the article
+            # in the same transaction (a batch of the group commit writer when it is on, see blog/writer.py)
+            comment = save_comment(id, content, request.user.id)
 
-            # Makes a Comment object and saves it in the database
-            comment = Comment(article=article,content=content,author=request.user)
-            comment.save()
-            return HttpResponse(json.dumps(model_to_dict(comment)), status=201)
-        
-        except Article.DoesNotExist:
-            # Exception: The targeted article with the id not existing
-            return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+            if comment is None:
+                # Exception: The targeted article with the id not existing
+                return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+
+            bump_version(id)
+            comment = (comment.id, comment.article_id, comment.content, comment.author_id)
+            publish_comment(id, 'created', dict(zip(COMMENT_FIELDS, comment)))
+            return HttpResponse(get_encoder(None, COMMENT_FIELDS).encode(comment), content_type='application/json', status=201)
         
         except (KeyError, json.JSONDecodeError):
             # Exception: req_data having an unexpected format
@@ -241,51 +459,85 @@ def article_id_comment(request, id):
 
 
 @login_required
+@replica_reads
 def comment_id(request, id):
     """
     When specified a comment id in the url, the user can GET, PUT, or DELETE.
 
-    GET: Responses with a JSON having a dictionary for the target comment's article, content, and author
+    GET: Responses with a JSON having a dictionary for the target comment's id, article, content, and author
+         (or only some of them with `fields`, e.g. `fields=id,author`)
     PUT: Updates the target comment with the information given by request JSON body, and responses the updated comment as a JSON
     DELETE: Deletes the target comment, but not the article or author of it
     """
 
     if request.method == "GET":
         try:
-            # Gets target comment; changes it to a dictionary
-            comment = Comment.objects.get(id=id)
-            return JsonResponse(model_to_dict(comment), status=200)
-            
-        except Comment.DoesNotExist:
+            fields = get_fields(request, COMMENT_FIELDS, COMMENT_FIELDS)
+        except ValueError:
+            # Exception: query string having unexpected format
+            return HttpResponseBadRequest()
+
+        if has_validators(request):
+            # Answers polling clients from the version alone, without reading the content
+            validators = Comment.objects.filter(id=id).values_list('id','version','updated_at').first()
+            if validators is not None:
+                validators = object_validators(*validators)
+                response = not_modified(request, *validators)
+                if response is not None:
+                    return set_validators(response, *validators)
+
+        # Gets the asked fields of the target comment (and its validators); encodes them into a JSON dictionary
+        row = Comment.objects.filter(id=id).values_list(*fields, 'version', 'updated_at').first()
+        if row is None:
             # Exception: The targeted comment with the id not existing
             return JsonResponse({"error":"Comment with such id does not exist"}, status=404)
 
+        response = HttpResponse(get_encoder(Comment, fields).encode(row[:-2]), content_type='application/json', status=200)
+        return set_validators(response, *object_validators(id, *row[-2:]))
+
     elif request.method == "PUT":
         try:
-            req_data = json.loads(request.body.decode())
+            req_data = read_json(request)
             content = req_data['content']
 
-            # Gets target comment
-            comment = Comment.objects.get(id=id)
+            # Gets the article of the target comment (needed to invalidate the cached comments), but not its content
+            article_id = Comment.objects.values_list('article_id', flat=True).get(id=id)
+
+            # Updates the target comment in a single statement, only if it is written by the user
+            updated = Comment.objects.filter(id=id, author=request.user).update(
+                content=content, version=F('version') + 1, updated_at=timezone.now())
 
-            if comment.author == request.user:
-                comment.content = content
-                comment.save()
-                return HttpResponse(json.dumps(model_to_dict(comment)), status=200)         
+            if updated == 1:
+                bump_version(article_id)
+                comment = (id, article_id, content, request.user.id)
+                publish_comment(article_id, 'updated', dict(zip(COMMENT_FIELDS, comment)))
+                return HttpResponse(get_encoder(None, COMMENT_FIELDS).encode(comment), content_type='application/json', status=200)
             else:
                 return JsonResponse({"error": "Cannot PUT because you do not have access to comment with id " + str(id)}, status=403)
 
+        except Comment.DoesNotExist:
+            # Exception: The targeted comment with the id not existing
+            return JsonResponse({"error":"Comment with such id does not exist"}, status=404)
+
         except (KeyError, json.JSONDecodeError):
             # Exception: req_data having an unexpected format
             return HttpResponseBadRequest()
 
     elif request.method == "DELETE":
         try:
-            # Gets target comment
-            comment = Comment.objects.get(id=id)
-
-            if comment.author == request.user:
-                comment.delete()
+            # Gets the article of the target comment (needed to invalidate the cached comments), but not its content
+            article_id = Comment.objects.values_list('article_id', flat=True).get(id=id)
+
+            # Deletes the target comment in a single statement, only if it is written by the user,
+            # and uncounts it from the article in the same transaction
+            with transaction.atomic():
+                deleted, _ = Comment.objects.filter(id=id, author=request.user).delete()
+                if deleted == 1:
+                    Article.objects.filter(id=article_id).add_comments(-1)
+
+            if deleted == 1:
+                bump_version(article_id)
+                publish_comment(article_id, 'deleted', {"id": id, "article": article_id})
                 return HttpResponse(status=200)
             
             else:
@@ -294,16 +546,181 @@ def comment_id(request, id):
         except Comment.DoesNotExist:
             # Exception: The targeted comment with the id not existing
             return JsonResponse({"error":"Comment with such id does not exist"}, status=404)
-        
-        except (KeyError, json.JSONDecodeError):
-            # Exception: req_data having an unexpected format
-            return HttpResponseBadRequest()
     
     else:
         return HttpResponseNotAllowed(['GET','POST','DELETE'])
 
 
 
+@login_required
+@replica_reads
+def article_bulk(request):
+    """
+    Creates or deletes many articles in one request.
+
+    POST: Creates an article for each {"title": ..., "content": ...} of the request body (a JSON array, or one JSON object per line
+          with `Content-Type: application/x-ndjson`), and responses with a JSON list having {"id": ...} or {"error": ...} for each of them
+    DELETE: Deletes the articles whose ids are given by request JSON body ({"ids": [...]}), including the comments written under them,
+            and responses with a JSON list having {"id": ...} or {"id": ..., "error": ...} for each of them
+    """
+
+    if request.method == 'POST':
+        def make(item):
+            if not isinstance(item, dict) or not isinstance(item.get('title'), str) or not isinstance(item.get('content'), str):
+                raise ValueError("An article needs a title and a content")
+            if len(item['title']) > Article._meta.get_field('title').max_length:
+                raise ValueError("The title is too long")
+            return Article(title=item['title'], content=item['content'], author=request.user)
+
+        try:
+            results = create_in_chunks(Article, read_items(request), make)
+            return JsonResponse(results, safe=False, status=201)
+
+        except ValueError:
+            # Exception: request body having unexpected format
+            return HttpResponseBadRequest()
+
+    elif request.method == 'DELETE':
+        try:
+            results, deleted = delete_in_chunks(Article, read_ids(request), request.user)
+            for article_id, in deleted:
+                bump_version(article_id)
+                publish_comment(article_id, 'reload')
+            return JsonResponse(results, safe=False, status=200)
+
+        except ValueError:
+            # Exception: request body having unexpected format
+            return HttpResponseBadRequest()
+
+    else:
+        return HttpResponseNotAllowed(['POST','DELETE'])
+
+
+
+@login_required
+@replica_reads
+def article_id_comment_bulk(request, id):
+    """
+    Creates many comments under a specified article id in one request.
+
+    POST: Creates a comment for each {"content": ...} of the request body (a JSON array, or one JSON object per line
+          with `Content-Type: application/x-ndjson`), and responses with a JSON list having {"id": ...} or {"error": ...} for each of them
+    """
+
+    if request.method == 'POST':
+        if not Article.objects.filter(id=id).exists():
+            # Exception: The targeted article with the id not existing
+            return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+
+        def make(item):
+            if not isinstance(item, dict) or not isinstance(item.get('content'), str):
+                raise ValueError("A comment needs a content")
+            return Comment(article_id=id, content=item['content'], author=request.user)
+
+        try:
+            results = create_in_chunks(Comment, read_items(request), make,
+                                       lambda comments: Article.objects.filter(id=id).add_comments(len(comments)))
+            bump_version(id)
+            publish_comment(id, 'reload')
+            return JsonResponse(results, safe=False, status=201)
+
+        except ValueError:
+            # Exception: request body having unexpected format
+            return HttpResponseBadRequest()
+
+        except IntegrityError:
+            # Exception: The targeted article deleted while its comments were written
+            return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+
+    else:
+        return HttpResponseNotAllowed(['POST'])
+
+
+
+@login_required
+@replica_reads
+def comment_bulk(request):
+    """
+    Deletes many comments in one request.
+
+    DELETE: Deletes the comments whose ids are given by request JSON body ({"ids": [...]}),
+            and responses with a JSON list having {"id": ...} or {"id": ..., "error": ...} for each of them
+    """
+
+    if request.method == 'DELETE':
+        try:
+            def uncount(rows):
+                counts = collections.Counter(article_id for _, article_id in rows)
+                for article_id, count in counts.items():
+                    Article.objects.filter(id=article_id).add_comments(-count)
+
+            results, deleted = delete_in_chunks(Comment, read_ids(request), request.user, ['article_id'], uncount)
+            for article_id in set(article_id for _, article_id in deleted):
+                bump_version(article_id)
+            for comment_id, article_id in deleted:
+                publish_comment(article_id, 'deleted', {"id": comment_id, "article": article_id})
+            return JsonResponse(results, safe=False, status=200)
+
+        except ValueError:
+            # Exception: request body having unexpected format
+            return HttpResponseBadRequest()
+
+    else:
+        return HttpResponseNotAllowed(['DELETE'])
+
+
+
+@login_required
+def article_id_comment_events(request, id):
+    """
+    Pushes the changes to the comments of a specified article id as they happen, instead of them being polled.
+
+    GET: Responses with a text/event-stream of `created` and `updated` events having the comment's id, article, content, and author
+         as JSON, `deleted` events having its id and article, and `reload` events after which the comments are to be read again
+         (open the stream before reading the comments, so that none is missed in between)
+    """
+
+    if request.method == 'GET':
+        if not Article.objects.filter(id=id).exists():
+            # Exception: The targeted article with the id not existing
+            return JsonResponse({"error":"Article with such id does not exist"}, status=404)
+
+        return EventStreamResponse(subscribe_comments(id))
+
+    else:
+        return HttpResponseNotAllowed(['GET'])
+
+
+
+@login_required
+def changes(request):
+    """
+    Feed of the changes to the articles and comments, for clients that keep a copy of them in sync
+
+    GET: Responses with a JSON having the changes after the sequence number `since` (0 for everything), oldest first,
+         each one with its `seq`, the `type` ("article" or "comment") and `id` of the object, whether it is `deleted`,
+         and its fields as `data` (null when deleted); and the `since` to ask from next time, and whether there are `more` changes
+         (query string: `since` for the last sequence number seen, `limit` for the most changes given)
+    """
+
+    if request.method == 'GET':
+        try:
+            since = int(request.GET.get('since', 0))
+            if since < 0:
+                raise ValueError("since must be >= 0")
+            limit = get_limit(request)
+        except ValueError:
+            # Exception: query string having unexpected format
+            return HttpResponseBadRequest()
+
+        results, more = read_changes(since, limit)
+        return JsonResponse({"results": results, "since": results[-1]["seq"] if results else since, "more": more}, status=200)
+
+    else:
+        return HttpResponseNotAllowed(['GET'])
+
+
+
 @ensure_csrf_cookie
 def token(request):
     """ 
@@ -314,3 +731,17 @@ def token(request):
         return HttpResponse(status=204)
     else:
         return HttpResponseNotAllowed(['GET'])
+
+
+
+def metrics(request):
+    """
+    Latency histograms of the requests answered by this process
+
+    GET: Responses with the histograms per URL name, in the Prometheus text format
+    """
+
+    if request.method == 'GET':
+        return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+    else:
+        return HttpResponseNotAllowed(['GET'])
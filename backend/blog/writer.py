@@ -0,0 +1,188 @@
+"""
+Group commit of comment writes
+
+SQLite has a single writer: every comment POST takes the write lock for its own
+transaction, and under a burst the requests queue on the lock (or give up on it
+with "database is locked" after busy_timeout). With BLOG_GROUP_COMMIT on, a
+request puts its comment on the queue of a writer thread instead, which commits
+the comments queued within BLOG_GROUP_COMMIT_WINDOW seconds of each other (at
+most BLOG_GROUP_COMMIT_BATCH of them) in one transaction, and hands each request
+its comment back once they are committed. A burst then costs one lock and one
+commit per batch instead of one per comment. When a batch fails, its comments are
+written again one by one, so a bad comment does not fail the others.
+
+The queue and its writer thread are per process. A request that is already in
+a transaction (e.g. in the tests) writes its comment itself: the writer thread
+could not see the rows of a transaction that is not committed yet.
+"""
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+from .models import Article, Comment
+from .profiling import timed
+import collections
+import os
+import queue
+import threading
+import time
+
+
+def write_comments(items):
+    """
+    Writes the comments of (article id, content, author id) items in the current transaction
+
+    Returns the saved comment of each item, or None for an item whose article does not exist.
+    The comment counts of the articles are updated once per article
+    """
+
+    comments = [Comment.objects.create_for_article(article_id, content=content, author_id=author_id)
+                for article_id, content, author_id in items]
+
+    counts = collections.Counter(comment.article_id for comment in comments if comment is not None)
+    for article_id, count in counts.items():
+        Article.objects.filter(id=article_id).add_comments(count)
+    return comments
+
+
+class PendingWrite:
+    """
+    A comment waiting in the queue, and then its result
+    """
+
+    def __init__(self, item):
+        self.item = item
+        self.done = threading.Event()
+        self.comment = None
+        self.error = None
+
+    def resolve(self, comment=None, error=None):
+        self.comment = comment
+        self.error = error
+        self.done.set()
+
+    def result(self):
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.comment
+
+
+class GroupCommitWriter:
+    """
+    Commits the comments of the queue in batches from its own thread, started on the first submit
+    """
+
+    def __init__(self, window, batch_size):
+        self.window = window
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, article_id, content, author_id):
+        """
+        Queues a comment; the result() of the PendingWrite given back is the saved comment (or None)
+        """
+
+        pending = PendingWrite((article_id, content, author_id))
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='group-commit', daemon=True)
+                self.thread.start()
+        self.queue.put(pending)
+        return pending
+
+    def take_batch(self):
+        """
+        Waits for a comment, then for more during the window; gives back at most batch_size of them
+        """
+
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def write_batch(self, batch):
+        """
+        Writes a batch in one transaction, and hands each pending write its result
+
+        When the transaction fails, each comment is written again in a transaction of its own, so that
+        only the comments that fail by themselves are given the error
+        """
+
+        db = router.db_for_write(Comment)
+        try:
+            with transaction.atomic(using=db):
+                comments = write_comments([pending.item for pending in batch])
+        except Exception as error:
+            if len(batch) == 1:
+                batch[0].resolve(error=error)
+                return
+            for pending in batch:
+                self.write_batch([pending])
+        else:
+            for pending, comment in zip(batch, comments):
+                pending.resolve(comment)
+
+    def run(self):
+        while True:
+            batch = self.take_batch()
+            # None is queued by close()
+            pending = [item for item in batch if item is not None]
+            if pending:
+                # As between requests: a connection that is broken or older than CONN_MAX_AGE is opened again
+                close_old_connections()
+                self.write_batch(pending)
+            if len(pending) < len(batch):
+                connections.close_all()
+                return
+
+    def close(self):
+        """
+        Stops the thread once the comments queued before are written
+        """
+
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    Gets the group commit writer of this process (a forked worker makes its own)
+    """
+
+    global _writer, _writer_pid
+    with _writer_lock:
+        if _writer is None or _writer_pid != os.getpid():
+            _writer = GroupCommitWriter(settings.BLOG_GROUP_COMMIT_WINDOW, settings.BLOG_GROUP_COMMIT_BATCH)
+            _writer_pid = os.getpid()
+        return _writer
+
+
+def save_comment(article_id, content, author_id):
+    """
+    Saves a comment under an article and counts it in the article, through the group commit writer when it is on
+
+    Returns the saved comment, or None when there is no article with such id
+    """
+
+    db = router.db_for_write(Comment)
+    if settings.BLOG_GROUP_COMMIT and not connections[db].in_atomic_block:
+        with timed('commit'):
+            return get_writer().submit(article_id, content, author_id).result()
+
+    with transaction.atomic(using=db):
+        return write_comments([(article_id, content, author_id)])[0]
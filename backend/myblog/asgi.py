@@ -0,0 +1,175 @@
+"""
+ASGI config for myblog project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Run it with any ASGI server, e.g. ``uvicorn myblog.asgi:application``.
+
+Django 2.2 has no ASGI handler, async views or async ORM, so the WSGI
+application is served through WsgiToAsgi below: the request body is read and
+the response is sent on the event loop, and only the view itself (ORM queries,
+password hashing) runs in a bounded pool of BLOG_ASGI_THREADS worker threads.
+A slow client then holds a coroutine instead of a worker thread, and one
+process can keep thousands of them connected (see `manage.py loadtest`), and
+so can the event streams of blog/events.py, which are pushed from the event loop.
+"""
+
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myblog.settings')
+
+
+def build_environ(scope, body):
+    """
+    Makes the WSGI environ of an ASGI HTTP request, whose whole body has been read
+    """
+
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        # Tells blog/admission.py that event streams are sent from the event loop, holding no worker thread
+        'blog.asgi': True,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        environ[name] = environ[name] + ',' + value if name in environ else value
+
+    return environ
+
+
+class WsgiToAsgi:
+    """
+    Serves a WSGI application to an ASGI server, running it in a pool of `threads` threads
+
+    A response is made and read whole in one job of the pool, and sent once the thread is free again.
+    Streaming responses are the exception: their database cursor belongs to the thread that opened
+    it, so that thread sends them chunk by chunk and is held until the client has read them. A response
+    with an `asgi_stream()` async iterator (an event stream) is sent from the event loop instead, until
+    it ends or the client disconnects
+    """
+
+    def __init__(self, wsgi_application, threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError("Cannot serve a %s connection" % scope['type'])
+
+        body = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_event_loop()
+        environ = build_environ(scope, b''.join(body))
+        result = await loop.run_in_executor(self.executor, self.run, environ, loop, send)
+        if result is not None:
+            status, headers, content = result
+            await send(self.response_start(status, headers))
+            if isinstance(content, bytes):
+                await send({'type': 'http.response.body', 'body': content})
+            else:
+                await self.send_stream(content, receive, send)
+
+    async def send_stream(self, response, receive, send):
+        async def pump():
+            async for chunk in response.asgi_stream():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        tasks = [asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Closed in a worker thread, as Django's request_finished handlers expect
+            await asyncio.get_event_loop().run_in_executor(self.executor, response.close)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def response_start(self, status, headers):
+        return {
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+        }
+
+    def run(self, environ, loop, send):
+        # Runs in a worker thread: the response is closed there too, which is where Django
+        # sends request_finished and closes the thread's database connection
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [status, headers]
+
+        response = self.wsgi_application(environ, start_response)
+        if hasattr(response, 'asgi_stream'):
+            # Sent and closed by send_stream, without holding this thread
+            return started[0], started[1], response
+
+        try:
+            if not getattr(response, 'streaming', False):
+                return started[0], started[1], b''.join(response)
+
+            def send_now(message):
+                asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+            send_now(self.response_start(*started))
+            for chunk in response:
+                if chunk:
+                    send_now({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_now({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(response, 'close'):
+                response.close()
+
+
+application = WsgiToAsgi(get_wsgi_application(), settings.BLOG_ASGI_THREADS)
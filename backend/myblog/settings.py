@@ -41,11 +41,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'blog.admission.AdmissionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -70,6 +72,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'myblog.wsgi.application'
 
+ASGI_APPLICATION = 'myblog.asgi.application'
+
+# Worker threads the ASGI application runs the views in (see myblog/asgi.py)
+BLOG_ASGI_THREADS = int(os.environ.get('BLOG_ASGI_THREADS', 32))
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -78,9 +85,198 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Connections are kept open across requests, for up to this many seconds
+        'CONN_MAX_AGE': int(os.environ.get('BLOG_CONN_MAX_AGE', 600)),
+    }
+}
+
+# Read replicas: aliases of DATABASES that the GET requests of the article and comment
+# views read from (see blog/routers.py). BLOG_REPLICA_PATHS adds SQLite copies of the
+# database (e.g. kept up to date by Litestream), comma-separated; any other alias can be
+# added to BLOG_READ_REPLICAS too. A client reads from the default database for
+# BLOG_REPLICA_STICKY_SECONDS after it writes.
+
+BLOG_READ_REPLICAS = []
+
+for index, path in enumerate(filter(None, os.environ.get('BLOG_REPLICA_PATHS', '').split(','))):
+    alias = 'replica%d' % (index + 1)
+    DATABASES[alias] = dict(DATABASES['default'], NAME=path, TEST={'MIRROR': 'default'})
+    BLOG_READ_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+
+BLOG_REPLICA_STICKY_SECONDS = 5
+
+# Run on every new SQLite connection (see blog/sqlite.py); a database can have its own
+# with a `PRAGMAS` key in its DATABASES entry, e.g. {} for SQLite's defaults
+BLOG_SQLITE_PRAGMAS = {
+    # Readers are not blocked by a writer (nor the writer by readers)
+    'journal_mode': 'WAL',
+    # With WAL, commits do not wait for fsync; a power loss can lose the last
+    # transactions but never corrupts the database
+    'synchronous': 'NORMAL',
+    # Milliseconds a write waits for another one to finish before failing with "database is locked"
+    'busy_timeout': 5000,
+    # Page cache of each connection, in KiB when negative (64 MiB)
+    'cache_size': -64000,
+    # Bytes of the database file read through memory mapping (256 MiB)
+    'mmap_size': 268435456,
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+#
+# The `blog` cache holds serialized article and comment responses (see blog/cache.py),
+# and the `sessions` cache holds sessions and the users they are logged in as (only used
+# when it is shared, see below).
+# Each is a bounded, LRU-evicted local-memory cache unless BLOG_CACHE_REDIS_URL points to
+# a Redis server (needs the django-redis package; configure the server with a
+# `maxmemory` and `maxmemory-policy allkeys-lru` to keep it bounded).
+#
+# A local-memory cache is per process: a write invalidates the cached responses of its own
+# process only, so with several worker processes the others serve theirs until they expire,
+# BLOG_LOCAL_CACHE_TIMEOUT seconds after they were cached. Only a shared cache keeps
+# responses until they are invalidated.
+
+BLOG_LOCAL_CACHE_TIMEOUT = 5
+
+BLOG_CACHE_REDIS_URL = os.environ.get('BLOG_CACHE_REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'blog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blog',
+        'TIMEOUT': BLOG_LOCAL_CACHE_TIMEOUT,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+if BLOG_CACHE_REDIS_URL:
+    CACHES['blog'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': BLOG_CACHE_REDIS_URL,
+        'TIMEOUT': None,
+        'KEY_PREFIX': 'blog',
+    }
+    CACHES['sessions'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': BLOG_CACHE_REDIS_URL,
+        'KEY_PREFIX': 'sessions',
     }
+
+
+# Sessions and authentication
+# https://docs.djangoproject.com/en/2.2/topics/http/sessions/
+#
+# With a shared cache (BLOG_CACHE_REDIS_URL), sessions and the users they are logged in
+# as are read from an in-process LRU, then from the `sessions` cache, and only then from
+# the database (see blog/sessions.py and blog/auth.py). A sign out or a password change
+# made by another process is seen within BLOG_LOCAL_CACHE_TTL seconds.
+#
+# A local-memory `sessions` cache would keep them in each process until they expire, so a
+# sign out or a password change would go unseen by the other processes: without a shared
+# cache, sessions and users are read from the database.
+
+SESSION_CACHE_ALIAS = 'sessions'
+
+if BLOG_CACHE_REDIS_URL:
+    SESSION_ENGINE = 'blog.sessions'
+    AUTHENTICATION_BACKENDS = ['blog.auth.CachedModelBackend']
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+
+BLOG_LOCAL_CACHE_ENTRIES = 10000
+BLOG_LOCAL_CACHE_TTL = 5
+
+
+# Profiling
+#
+# Every response carries a Server-Timing header with the time spent in the database, the
+# view and its parts, and /api/metrics serves latency histograms per URL name (see
+# blog/profiling.py). The header can be turned off with BLOG_SERVER_TIMING=0.
+
+BLOG_SERVER_TIMING = os.environ.get('BLOG_SERVER_TIMING', '1') != '0'
+
+
+# Compression at rest
+#
+# Article and comment contents of BLOG_COMPRESSION_THRESHOLD bytes or more are stored
+# compressed with BLOG_COMPRESSION: 'zlib', 'zstd' (needs the zstandard package), or None
+# to store new contents plain (see blog/compression.py). Stored contents keep their format
+# until `manage.py compress_contents` rewrites them. Clients other than the application
+# (e.g. `manage.py dbshell`) can write the database, but read compressed contents as BLOBs.
+
+BLOG_COMPRESSION = os.environ.get('BLOG_COMPRESSION', 'zlib') or None
+BLOG_COMPRESSION_LEVEL = 6
+BLOG_COMPRESSION_THRESHOLD = 1024
+
+
+# Group commit
+#
+# With BLOG_GROUP_COMMIT=1, comment POSTs are queued to a writer thread of each process,
+# which commits them in batches (see blog/writer.py): the comments that come within
+# BLOG_GROUP_COMMIT_WINDOW seconds of the first one, at most BLOG_GROUP_COMMIT_BATCH of them.
+
+BLOG_GROUP_COMMIT = os.environ.get('BLOG_GROUP_COMMIT', '0') != '0'
+BLOG_GROUP_COMMIT_WINDOW = 0.002
+BLOG_GROUP_COMMIT_BATCH = 500
+
+
+# Comment events
+#
+# /api/article/<id>/comment/events pushes comment changes as Server-Sent Events (see
+# blog/events.py). With several processes on one machine, BLOG_EVENTS_SOCKET_DIR names a
+# directory where each of them binds a socket, so that events reach every process.
+
+BLOG_EVENTS_SOCKET_DIR = os.environ.get('BLOG_EVENTS_SOCKET_DIR')
+
+# Seconds between keep-alive comments of an idle event stream
+BLOG_SSE_KEEPALIVE = 15
+
+
+# Admission control
+#
+# Expensive endpoints run a bounded number of requests at once, and writes are rate limited
+# per user (see blog/admission.py); the requests over the limits get a 503 or a 429 at once.
+# Both are per worker process.
+
+# (URL name, method): (requests run at once, requests waiting for their turn, seconds a request waits)
+BLOG_CONCURRENCY_LIMITS = {
+    # Each one hashes a password
+    ('signin', 'POST'): (4, 16, 2),
+    ('signup', 'POST'): (4, 16, 2),
+    # Pages, and listings streamed out whole
+    ('article', 'GET'): (16, 32, 1),
+    ('article_search', 'GET'): (8, 16, 1),
+    ('article_bulk', 'POST'): (2, 4, 5),
+    ('article_bulk', 'DELETE'): (2, 4, 5),
+    ('article_id_comment_bulk', 'POST'): (2, 4, 5),
+    ('comment_bulk', 'DELETE'): (2, 4, 5),
+    # Under WSGI, an open event stream holds its worker thread (and its slot) until it is closed;
+    # keep this below the server's threads. Under myblog/asgi.py it holds neither
+    ('article_id_comment_events', 'GET'): (16, 0, 0),
 }
 
+# Seconds a client shed by a concurrency limit is told to wait (Retry-After)
+BLOG_RETRY_AFTER = 1
+
+# Writes of each user (or IP address, when signed out): (tokens per second, burst), or None for no limit
+BLOG_WRITE_RATE = (10, 50)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators